@@ -0,0 +1,466 @@
+"""Simulates driver stations against arenas listening for them on localhost.
+
+Starts one or more arenas, in a thread of this process, on an in-memory database and with six
+teams assigned to each. Every arena listens for driver stations on its own loopback address,
+127.0.0.N, on the real TCP and UDP ports. Each simulated driver station binds the address a real
+one would have on the field network, with the 10 swapped for 127, so 127.2.54.5 for team 254.
+It connects over TCP with the team number handshake, sends status frames and keepalives, sends UDP
+status packets 50 times a second and receives the arena's control packets.
+
+Reports the time from the start of a round of control packets to each driver station receiving
+its own, the control packet interval, whether the arena's missed packet count matches the one
+the driver stations report, and how long the arena takes to notice driver stations going quiet.
+
+    python -m benchmarks.ds_simulator --arenas 50 --duration 10 --loss 0.01 --quiet-stations 6
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import resource
+import threading
+import time
+
+import models
+from field.arena import Arena
+from field.arena_metrics import LatencyHistogram
+from field.driver_station_connection import (
+    CONTROL_PACKET_STATION,
+    DRIVER_STATION_TCP_LISTEN_PORT,
+    DRIVER_STATION_UDP_RECEIVE_PORT,
+    DRIVER_STATION_UDP_SEND_PORT,
+    TCP_FRAME_KEEPALIVE,
+    TCP_FRAME_STATION_INFO,
+    TCP_FRAME_STATUS,
+    TCP_FRAME_TEAM_NUMBER,
+    UDP_STATUS_PACKET,
+    UDP_STATUS_RADIO_LINKED,
+    UDP_STATUS_RIO_LINKED,
+    UDP_STATUS_ROBOT_LINKED,
+    TCPFrameParser,
+)
+from field.ds_heartbeat import DriverStationHeartbeat
+from field.specs import DS_PACKET_PERIOD_MS
+
+STATIONS = ['R1', 'R2', 'R3', 'B1', 'B2', 'B3']
+UDP_STATUS_PERIOD_SEC = 0.02
+TCP_STATUS_PERIOD_SEC = 1
+TCP_STATUS_FRAME_SIZE = 36
+LINK_POLL_PERIOD_SEC = 0.01
+CONNECT_TIMEOUT_SEC = 30
+PERCENTILES = [50, 90, 99, 99.9]
+
+
+def get_arena_host(index: int) -> str:
+    return f'127.0.0.{index + 1}'
+
+
+def get_driver_station_host(team_id: int) -> str:
+    return f'127.{team_id // 100}.{team_id % 100}.5'
+
+
+class ControlPacketTimer:
+    """Remembers when an arena, or its heartbeat, last started sending its control packets."""
+
+    send_time_ns: int
+
+    def __init__(self, arena: Arena):
+        self.send_time_ns = 0
+        if arena.ds_heartbeat is not None:
+            send_packets = arena.ds_heartbeat.send_packets
+
+            def timed_send_packets():
+                self.send_time_ns = time.perf_counter_ns()
+                send_packets()
+
+            arena.ds_heartbeat.send_packets = timed_send_packets
+            return
+
+        send_ds_packet = arena.send_ds_packet
+
+        def timed_send_ds_packet(auto: bool, enabled: bool):
+            self.send_time_ns = time.perf_counter_ns()
+            send_ds_packet(auto, enabled)
+
+        arena.send_ds_packet = timed_send_ds_packet
+
+
+class ArenaServer(threading.Thread):
+    """The arenas, running on their own event loop in a separate thread."""
+
+    arenas: list[Arena]
+    timers: list[ControlPacketTimer]
+    loop: asyncio.AbstractEventLoop
+    started: threading.Event
+
+    def __init__(self, team_ids: list[list[int]], heartbeat: str):
+        super().__init__(daemon=True)
+        self.team_ids = team_ids
+        self.heartbeat = heartbeat
+        self.arenas = []
+        self.timers = []
+        self.started = threading.Event()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        self.stopped = asyncio.Event()
+        models.db.bind(provider='sqlite', filename=':memory:', create_db=True)
+        models.db.generate_mapping(create_tables=True)
+
+        tasks = []
+        for i, team_ids in enumerate(self.team_ids):
+            arena = await Arena.new_arena()
+            for station, team_id in zip(STATIONS, team_ids, strict=True):
+                arena.assign_team(team_id, station)
+            if self.heartbeat != 'loop':
+                arena.ds_heartbeat = DriverStationHeartbeat(
+                    arena.metrics, threaded=self.heartbeat == 'thread'
+                )
+                tasks.append(asyncio.create_task(arena.ds_heartbeat.run()))
+            self.arenas.append(arena)
+            self.timers.append(ControlPacketTimer(arena))
+            host = get_arena_host(i)
+            tasks.append(asyncio.create_task(arena.listen_for_driver_stations(host)))
+            tasks.append(asyncio.create_task(arena.listen_for_ds_udp_packets(host)))
+            tasks.append(asyncio.create_task(arena.run_loop()))
+        # Let the listeners bind before any driver station connects.
+        await asyncio.sleep(0.1)
+        self.started.set()
+
+        await self.stopped.wait()
+        for arena in self.arenas:
+            arena.running = False
+            arena.loop_scheduler.wake()
+            if arena.ds_heartbeat is not None:
+                arena.ds_heartbeat.stop()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get_cpu_time(self) -> float:
+        """Reads the CPU time of the server thread, from any thread."""
+
+        async def get_thread_time():
+            return time.thread_time()
+
+        future = asyncio.run_coroutine_threadsafe(get_thread_time(), self.loop)
+        return await asyncio.wrap_future(future)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.stopped.set)
+
+
+class DriverStationStats:
+    latency_histogram: LatencyHistogram
+    interval_histogram: LatencyHistogram
+    handshake_histogram: LatencyHistogram
+    link_timeout_histogram: LatencyHistogram
+    control_packet_count: int
+    udp_status_count: int
+    recording: bool
+
+    def __init__(self):
+        self.latency_histogram = LatencyHistogram()
+        self.interval_histogram = LatencyHistogram()
+        self.handshake_histogram = LatencyHistogram()
+        self.link_timeout_histogram = LatencyHistogram()
+        self.control_packet_count = 0
+        self.udp_status_count = 0
+        self.recording = False
+
+
+class ControlPacketProtocol(asyncio.DatagramProtocol):
+    def __init__(self, driver_station: 'SimulatedDriverStation'):
+        self.driver_station = driver_station
+
+    def datagram_received(self, data: bytes, addr):
+        self.driver_station.receive_control_packet(data, time.perf_counter_ns())
+
+
+class SimulatedDriverStation:
+    """One driver station, from the TCP handshake to its UDP traffic.
+
+    Control packets are dropped on arrival with probability `loss`; the driver station counts the
+    gaps in their packet numbers and reports the total in its TCP status frames, as a real one does.
+    """
+
+    team_id: int
+    host: str
+    arena_host: str
+    station: str
+    missed_packet_count: int
+    last_packet_number: int | None
+    last_receive_time_ns: int
+    quiet: bool
+    quiet_time_ns: int
+
+    def __init__(
+        self,
+        team_id: int,
+        arena_host: str,
+        timer: ControlPacketTimer,
+        stats: DriverStationStats,
+        loss: float,
+    ):
+        self.team_id = team_id
+        self.host = get_driver_station_host(team_id)
+        self.arena_host = arena_host
+        self.timer = timer
+        self.stats = stats
+        self.loss = loss
+        self.station = ''
+        self.missed_packet_count = 0
+        self.last_packet_number = None
+        self.last_receive_time_ns = 0
+        self.quiet = False
+        self.quiet_time_ns = 0
+        self.connected = asyncio.Event()
+        self.status_frame = bytearray(2 + TCP_STATUS_FRAME_SIZE)
+        self.status_frame[:3] = bytes([0, TCP_STATUS_FRAME_SIZE, TCP_FRAME_STATUS])
+        # Frames from the arena, game data for instance, are read and dropped.
+        self.frame_parser = TCPFrameParser({})
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        control_transport, _ = await loop.create_datagram_endpoint(
+            lambda: ControlPacketProtocol(self),
+            local_addr=(self.host, DRIVER_STATION_UDP_SEND_PORT),
+        )
+        status_transport, _ = await loop.create_datagram_endpoint(
+            asyncio.DatagramProtocol,
+            local_addr=(self.host, 0),
+            remote_addr=(self.arena_host, DRIVER_STATION_UDP_RECEIVE_PORT),
+        )
+        reader, writer = await asyncio.open_connection(
+            self.arena_host, DRIVER_STATION_TCP_LISTEN_PORT, local_addr=(self.host, 0)
+        )
+        try:
+            start_time_ns = time.perf_counter_ns()
+            writer.write(
+                bytes([0, 3, TCP_FRAME_TEAM_NUMBER, self.team_id >> 8, self.team_id & 0xFF])
+            )
+            station_info = await reader.readexactly(5)
+            if station_info[2] != TCP_FRAME_STATION_INFO:
+                raise ValueError(
+                    f'Team {self.team_id} got {station_info.hex()} for its team number'
+                )
+            self.stats.handshake_histogram.record((time.perf_counter_ns() - start_time_ns) // 1000)
+            self.station = STATIONS[station_info[3]]
+            self.connected.set()
+
+            async with asyncio.TaskGroup() as tg:
+                tg.create_task(self.send_udp_status(status_transport))
+                tg.create_task(self.send_tcp_status(writer))
+                tg.create_task(self.read_tcp(reader))
+        finally:
+            writer.close()
+            control_transport.close()
+            status_transport.close()
+
+    async def send_udp_status(self, transport: asyncio.DatagramTransport):
+        loop = asyncio.get_running_loop()
+        status = UDP_STATUS_RIO_LINKED | UDP_STATUS_RADIO_LINKED | UDP_STATUS_ROBOT_LINKED
+        start_time = loop.time()
+        packet_number = 0
+        while True:
+            if not self.quiet:
+                transport.sendto(
+                    UDP_STATUS_PACKET.pack(packet_number & 0xFFFF, 0, status, self.team_id, 12, 128)
+                )
+                if self.stats.recording:
+                    self.stats.udp_status_count += 1
+            packet_number += 1
+            await asyncio.sleep(
+                max(start_time + packet_number * UDP_STATUS_PERIOD_SEC - loop.time(), 0)
+            )
+
+    async def send_tcp_status(self, writer: asyncio.StreamWriter):
+        keepalive_frame = bytes([0, 1, TCP_FRAME_KEEPALIVE])
+        while True:
+            # A trip time of 2ms, in half milliseconds, and the missed packet count, which wraps.
+            self.status_frame[3] = 4
+            self.status_frame[4] = self.missed_packet_count & 0xFF
+            writer.write(self.status_frame)
+            writer.write(keepalive_frame)
+            await writer.drain()
+            await asyncio.sleep(TCP_STATUS_PERIOD_SEC)
+
+    async def read_tcp(self, reader: asyncio.StreamReader):
+        while data := await reader.read(self.frame_parser.free_size):
+            self.frame_parser.feed(data)
+
+    def receive_control_packet(self, data: bytes, receive_time_ns: int):
+        if self.loss and random.random() < self.loss:
+            return
+
+        packet_number = CONTROL_PACKET_STATION.unpack_from(data)[0]
+        if self.last_packet_number is not None:
+            self.missed_packet_count += (packet_number - self.last_packet_number - 1) & 0xFFFF
+        self.last_packet_number = packet_number
+        if self.stats.recording:
+            self.stats.control_packet_count += 1
+            self.stats.latency_histogram.record((receive_time_ns - self.timer.send_time_ns) // 1000)
+            if self.last_receive_time_ns:
+                interval_us = (receive_time_ns - self.last_receive_time_ns) // 1000
+                self.stats.interval_histogram.record(interval_us)
+        self.last_receive_time_ns = receive_time_ns
+
+
+async def watch_link_timeouts(
+    server: ArenaServer, driver_stations: list[SimulatedDriverStation], stats: DriverStationStats
+):
+    """Times how long each quiet driver station takes to be marked as unlinked by its arena."""
+    for driver_station in driver_stations:
+        driver_station.quiet = True
+        driver_station.quiet_time_ns = time.perf_counter_ns()
+    waiting = {
+        driver_station: server.arenas[i // len(STATIONS)].alliance_stations[driver_station.station]
+        for i, driver_station in enumerate(driver_stations)
+    }
+    while waiting:
+        await asyncio.sleep(LINK_POLL_PERIOD_SEC)
+        for driver_station, alliance_station in list(waiting.items()):
+            ds_conn = alliance_station.ds_conn
+            if ds_conn is None or not ds_conn.ds_linked:
+                timeout_us = (time.perf_counter_ns() - driver_station.quiet_time_ns) // 1000
+                stats.link_timeout_histogram.record(timeout_us)
+                del waiting[driver_station]
+
+
+def format_histogram(histogram: LatencyHistogram, unit: str, scale: int = 1) -> str:
+    return (
+        ', '.join(
+            f'p{percentile:g} {histogram.get_percentile(percentile) / scale:g}'
+            for percentile in PERCENTILES
+        )
+        + f', max {histogram.max_value / scale:g} {unit} over {histogram.count}'
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--arenas', type=int, default=10, help='Arenas of six driver stations')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to measure')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds to settle first')
+    parser.add_argument(
+        '--loss', type=float, default=0, help='Fraction of control packets to drop on arrival'
+    )
+    parser.add_argument(
+        '--quiet-stations',
+        type=int,
+        default=0,
+        help='Driver stations, one per arena in turn, that stop their UDP status at the end',
+    )
+    parser.add_argument(
+        '--heartbeat',
+        choices=['loop', 'task', 'thread'],
+        default='loop',
+        help='Where the arenas send control packets from, as with the server option',
+    )
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    random.seed(args.seed)
+    # Each driver station takes five file descriptors, counting the arena's side.
+    _, max_open_files = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (max_open_files, max_open_files))
+
+    team_ids = [
+        list(range(100 + i * len(STATIONS), 100 + (i + 1) * len(STATIONS)))
+        for i in range(args.arenas)
+    ]
+    server = ArenaServer(team_ids, args.heartbeat)
+    server.start()
+    await asyncio.to_thread(server.started.wait)
+
+    stats = DriverStationStats()
+    driver_stations = [
+        SimulatedDriverStation(team_id, get_arena_host(i), server.timers[i], stats, args.loss)
+        for i, arena_team_ids in enumerate(team_ids)
+        for team_id in arena_team_ids
+    ]
+    tasks = [asyncio.create_task(driver_station.run()) for driver_station in driver_stations]
+    async with asyncio.timeout(CONNECT_TIMEOUT_SEC):
+        await asyncio.gather(
+            *[driver_station.connected.wait() for driver_station in driver_stations]
+        )
+    await asyncio.sleep(args.warmup)
+
+    stats.recording = True
+    start_cpu_time_sec = await server.get_cpu_time()
+    start_time = time.perf_counter()
+    await asyncio.sleep(args.duration)
+    stats.recording = False
+    wall_time_sec = time.perf_counter() - start_time
+    cpu_time_sec = await server.get_cpu_time() - start_cpu_time_sec
+
+    # Stop dropping packets and, as status frames go out once a second, wait for the last missed
+    # packet counts to reach the arenas.
+    for driver_station in driver_stations:
+        driver_station.loss = 0
+    await asyncio.sleep(TCP_STATUS_PERIOD_SEC * 1.5)
+    missed_packet_count = sum(
+        driver_station.missed_packet_count for driver_station in driver_stations
+    )
+    num_matching = 0
+    for i, driver_station in enumerate(driver_stations):
+        ds_conn = (
+            server.arenas[i // len(STATIONS)].alliance_stations[driver_station.station].ds_conn
+        )
+        if (
+            ds_conn is not None
+            and ds_conn.missed_packet_count == driver_station.missed_packet_count & 0xFF
+        ):
+            num_matching += 1
+
+    quiet_stations = [
+        driver_stations[(i % args.arenas) * len(STATIONS) + i // args.arenas]
+        for i in range(min(args.quiet_stations, len(driver_stations)))
+    ]
+    await watch_link_timeouts(server, quiet_stations, stats)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    server.stop()
+    await asyncio.to_thread(server.join)
+
+    print(
+        f'{len(driver_stations)} driver stations on {args.arenas} arenas for {wall_time_sec:.1f}s, '
+        f'control packets every {DS_PACKET_PERIOD_MS}ms from the {args.heartbeat}'
+    )
+    print(f'handshake (us): {format_histogram(stats.handshake_histogram, "us")}')
+    print(
+        'control packet send to receive (us): '
+        + format_histogram(stats.latency_histogram, 'us')
+        + ' packets'
+    )
+    print(
+        'control packet interval (ms): '
+        + format_histogram(stats.interval_histogram, 'ms', 1000)
+        + ' intervals'
+    )
+    print(
+        f'received {stats.control_packet_count / wall_time_sec:.0f} control packets/s, '
+        f'sent {stats.udp_status_count / wall_time_sec:.0f} UDP status packets/s'
+    )
+    print(
+        f'missed {missed_packet_count} control packets; arena counts match for {num_matching} of '
+        f'{len(driver_stations)} driver stations'
+    )
+    if quiet_stations:
+        print(
+            'quiet to unlinked (ms): '
+            + format_histogram(stats.link_timeout_histogram, 'ms', 1000)
+            + ' driver stations'
+        )
+    print(f'arena thread CPU {cpu_time_sec:.2f}s ({cpu_time_sec / wall_time_sec:.0%} of a core)')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
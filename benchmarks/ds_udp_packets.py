@@ -0,0 +1,86 @@
+"""Measures the cost of handling one driver station UDP status packet.
+
+Feeds packets from six driver stations, and from a team that is not in the match, to the UDP
+protocol the arena listens with. The packets are handled inline in datagram_received; for
+comparison the same handling is also timed with one task scheduled per packet, the way packets
+were handled before.
+
+    python -m benchmarks.ds_udp_packets --packets 300000
+"""
+
+import argparse
+import asyncio
+import struct
+import time
+
+import models
+from field.arena import AllianceStation, Arena
+from field.driver_station_connection import AsyncUDPServerProtocol, DriverStationConnection
+
+STATIONS = ['R1', 'R2', 'R3', 'B1', 'B2', 'B3']
+TEAM_IDS = [254, 1114, 148, 2056, 118, 1678]
+UNKNOWN_TEAM_ID = 9999
+
+
+def create_arena() -> Arena:
+    arena = Arena()
+    arena.alliance_stations = {
+        station: AllianceStation(i, None) for i, station in enumerate(STATIONS)
+    }
+    for station, team_id in zip(STATIONS, TEAM_IDS, strict=True):
+        arena.set_alliance_station_team(station, models.Team(id=team_id))
+        arena.alliance_stations[station].ds_conn = DriverStationConnection()
+    return arena
+
+
+def create_packets() -> list[bytes]:
+    return [
+        struct.pack('>HBBHBB', seq, 0, 0x38, team_id, 12, 128)
+        for seq, team_id in enumerate(TEAM_IDS + [UNKNOWN_TEAM_ID])
+    ]
+
+
+def time_inline(protocol: AsyncUDPServerProtocol, packets: list[bytes], num_packets: int) -> float:
+    start_time = time.perf_counter_ns()
+    for i in range(num_packets):
+        protocol.datagram_received(packets[i % len(packets)], None)
+    return (time.perf_counter_ns() - start_time) / num_packets
+
+
+async def time_task_per_packet(
+    protocol: AsyncUDPServerProtocol, packets: list[bytes], num_packets: int
+) -> float:
+    async def process_udp_packet(data: bytes):
+        protocol.process_udp_packet(data)
+
+    # Packets arrive one callback at a time, and each task runs on the next loop iteration.
+    start_time = time.perf_counter_ns()
+    for i in range(num_packets):
+        asyncio.create_task(process_udp_packet(packets[i % len(packets)]))
+        await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    return (time.perf_counter_ns() - start_time) / num_packets
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--packets', type=int, default=300_000)
+    args = parser.parse_args()
+
+    protocol = AsyncUDPServerProtocol(create_arena())
+    packets = create_packets()
+    # Warm up both paths before measuring.
+    time_inline(protocol, packets, 1000)
+    await time_task_per_packet(protocol, packets, 1000)
+
+    inline_ns = time_inline(protocol, packets, args.packets)
+    task_ns = await time_task_per_packet(protocol, packets, args.packets)
+    # Six driver stations at 50 packets per second each.
+    packets_per_sec = len(STATIONS) * 50
+    print(f'{"handling":<18}{"ns/packet":>10}{"CPU at 300 packets/s":>24}')
+    for name, cost_ns in [('inline', inline_ns), ('task per packet', task_ns)]:
+        print(f'{name:<18}{cost_ns:>10.0f}{cost_ns * packets_per_sec / 1e9:>24.4%}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
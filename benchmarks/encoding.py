@@ -0,0 +1,97 @@
+"""Compares JSON, MessagePack and deflated JSON frames for the arena's notifier messages.
+
+Builds the messages of a freshly loaded test match with some scoring on it, then reports the
+frame size and the encode time of each encoding. The MessagePack and deflate times are measured
+the way listeners pay for them, by converting the JSON frame the notifier already built.
+
+    python -m benchmarks.encoding --iterations 2000
+"""
+
+import argparse
+import asyncio
+import logging
+import timeit
+import zlib
+
+import orjson
+
+import models
+from field.arena import Arena
+from web.arena import APIArena
+from ws.encoding import COMPRESS_LEVEL, msgpack
+from ws.notifier import ENCODE_OPTIONS, encode_default
+
+MESSAGE_TYPES = [
+    'arena_status',
+    'match_load',
+    'match_time',
+    'realtime_score',
+    'score_posted',
+    'scoring_status',
+]
+
+
+def score_match(arena: Arena):
+    for realtime_score in [arena.red_realtime_score, arena.blue_realtime_score]:
+        score = realtime_score.current_score
+        score.leave_statuses = [True, True, False]
+        score.score_elements.auto_trough_coral = 2
+        score.score_elements.total_trough_coral = 5
+        score.score_elements.total_net_algae = 3
+        for position in range(0, len(score.score_elements.branches), 2):
+            score.score_elements.branches[position][1] = True
+    arena.red_realtime_score.current_score.summarize(arena.blue_realtime_score.current_score)
+    arena.blue_realtime_score.current_score.summarize(arena.red_realtime_score.current_score)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    if msgpack is None:
+        raise SystemExit('msgpack is not installed')
+
+    logging.basicConfig(level=logging.ERROR)
+    models.db.bind(provider='sqlite', filename=':memory:', create_db=True)
+    models.db.generate_mapping(create_tables=True)
+    arena = await Arena.new_arena()
+    APIArena.set_instance(arena)
+    await arena.load_test_match()
+    score_match(arena)
+
+    notifiers = {notifier.message_type: notifier for notifier in arena.get_notifiers()}
+    print(
+        f'{"message":<16}{"json B":>9}{"msgpack B":>11}{"deflate B":>11}'
+        f'{"json us":>10}{"msgpack us":>12}{"deflate us":>12}'
+    )
+    for message_type in MESSAGE_TYPES:
+        body = notifiers[message_type].get_message_body()
+        envelope = {'type': message_type, 'data': body}
+
+        def encode_json(envelope=envelope):
+            return orjson.dumps(envelope, default=encode_default, option=ENCODE_OPTIONS)
+
+        json_frame = encode_json()
+
+        def encode_msgpack(json_frame=json_frame):
+            return msgpack.packb(orjson.loads(json_frame))
+
+        def encode_deflate(json_frame=json_frame):
+            compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+            return compressor.compress(json_frame) + compressor.flush()
+
+        msgpack_frame = encode_msgpack()
+        deflate_frame = encode_deflate()
+        json_us, msgpack_us, deflate_us = (
+            timeit.timeit(encode, number=args.iterations) / args.iterations * 1e6
+            for encode in [encode_json, encode_msgpack, encode_deflate]
+        )
+        print(
+            f'{message_type:<16}{len(json_frame):>9}{len(msgpack_frame):>11}'
+            f'{len(deflate_frame):>11}{json_us:>10.1f}{msgpack_us:>12.1f}{deflate_us:>12.1f}'
+        )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,224 @@
+"""Replays a whole event against an arena running on a virtual clock.
+
+Every match is started, scored by scripted scoring panels and committed through the same code
+path as the match control page, so the run exercises `commit_match_score`, the qualification
+rankings and the playoff tournament updates at a realistic event size without waiting for any
+match in real time.
+
+    python -m benchmarks.event_simulation --teams 40 --matches 120
+"""
+
+import argparse
+import asyncio
+import logging
+import random
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+
+import game
+import models
+from field.arena import Arena
+from field.arena_metrics import LatencyHistogram
+from field.clock import VirtualClock
+from field.specs import MatchState
+from web.api.match_control import commit_current_match_score
+from web.arena import APIArena
+
+MATCH_SPACING_MIN = 7
+# Time the field crew takes between committing a match and being ready for the next one.
+FIELD_RESET_SEC = 90
+EVENT_START_TIME = datetime(2025, 3, 1, 9, 0, 0)
+# Number of event loop passes that let every ready task run before virtual time moves on.
+SETTLE_ITERATIONS = 8
+
+
+class EventSimulation:
+    arena: Arena
+    clock: VirtualClock
+    random: random.Random
+    commit_histograms: dict[models.MatchType, LatencyHistogram]
+    num_matches_played: int
+
+    def __init__(self, arena: Arena, clock: VirtualClock, seed: int):
+        self.arena = arena
+        self.clock = clock
+        self.random = random.Random(seed)
+        self.commit_histograms = {
+            models.MatchType.QUALIFICATION: LatencyHistogram(),
+            models.MatchType.PLAYOFF: LatencyHistogram(),
+        }
+        self.num_matches_played = 0
+
+    async def settle(self):
+        """Runs ready tasks until the arena loop is parked waiting for its next deadline."""
+        for _ in range(SETTLE_ITERATIONS):
+            await asyncio.sleep(0)
+        waiter = self.arena.loop_scheduler.waiter
+        while waiter is None or waiter.done():
+            await asyncio.sleep(0)
+            waiter = self.arena.loop_scheduler.waiter
+
+    async def advance_until(self, condition: Callable[[], bool]):
+        await self.settle()
+        while not condition():
+            if not self.clock.advance_to_next_timer():
+                raise RuntimeError('Virtual clock has no pending timers')
+            await self.settle()
+
+    async def wait(self, delay_sec: float):
+        deadline_ns = self.clock.monotonic_ns() + int(delay_sec * 1_000_000_000)
+        self.clock.call_later(delay_sec, lambda: None)
+        await self.advance_until(lambda: self.clock.monotonic_ns() >= deadline_ns)
+
+    def create_teams(self, num_teams: int) -> list[int]:
+        team_ids = [1000 + i * 7 for i in range(num_teams)]
+        for team_id in team_ids:
+            models.create_team(models.Team(id=team_id, nickname=f'Team {team_id}'))
+        return team_ids
+
+    def create_qualification_schedule(self, team_ids: list[int], num_matches: int):
+        """Fills each match with the teams that have played the fewest matches so far."""
+        num_matches_by_team = dict.fromkeys(team_ids, 0)
+        for i in range(num_matches):
+            teams = sorted(
+                team_ids, key=lambda team_id: (num_matches_by_team[team_id], self.random.random())
+            )[:6]
+            self.random.shuffle(teams)
+            for team_id in teams:
+                num_matches_by_team[team_id] += 1
+
+            models.create_match(
+                models.Match(
+                    type=models.MatchType.QUALIFICATION,
+                    type_order=i + 1,
+                    short_name=f'Q{i + 1}',
+                    long_name=f'Qualification {i + 1}',
+                    scheduled_time=EVENT_START_TIME + timedelta(minutes=i * MATCH_SPACING_MIN),
+                    red1=teams[0],
+                    red2=teams[1],
+                    red3=teams[2],
+                    blue1=teams[3],
+                    blue2=teams[4],
+                    blue3=teams[5],
+                    status=game.MatchStatus.MATCH_SCHEDULE,
+                    tba_match_key=models.TbaMatchKey(comp_level='qm', match_number=i + 1),
+                )
+            )
+
+    def create_alliances(self):
+        """Picks alliances straight down the rankings, like a serpentine-free selection."""
+        ranked_team_ids = [ranking.team_id for ranking in models.read_all_rankings()]
+        num_alliances = self.arena.event.num_playoff_alliances
+        for i in range(num_alliances):
+            team_ids = [
+                ranked_team_ids[i],
+                ranked_team_ids[2 * num_alliances - 1 - i],
+                ranked_team_ids[2 * num_alliances + i],
+            ]
+            models.create_alliance(
+                models.Alliance(
+                    id=i + 1,
+                    team_ids=team_ids,
+                    line_up=[team_ids[1], team_ids[0], team_ids[2]],
+                )
+            )
+
+    def score_alliance(self, score: game.Score):
+        """Stands in for a scoring panel, marking a random but plausible set of elements."""
+        score.leave_statuses = [self.random.random() < 0.8 for _ in range(3)]
+        score.score_elements.auto_trough_coral = self.random.randint(0, 2)
+        score.score_elements.total_trough_coral = (
+            score.score_elements.auto_trough_coral + self.random.randint(0, 6)
+        )
+        score.score_elements.auto_net_algae = self.random.randint(0, 1)
+        score.score_elements.total_net_algae = (
+            score.score_elements.auto_net_algae + self.random.randint(0, 4)
+        )
+        score.score_elements.teleop_processor_algae = self.random.randint(0, 3)
+        for location in range(game.BranchLocation.COUNT):
+            for level in range(game.BranchLevel.COUNT - 1):
+                score.score_elements.branches[location][level] = self.random.random() < 0.3
+        score.endgame_statuses = [self.random.choice(list(game.EndgameStatus)) for _ in range(3)]
+
+    async def play_match(self):
+        arena = self.arena
+        for alliance_station in arena.alliance_stations.values():
+            alliance_station.bypass = True
+        await self.advance_until(arena.check_can_start_match)
+
+        await arena.start_match()
+        await self.advance_until(lambda: arena.match_state == MatchState.TELEOP_PERIOD)
+        self.score_alliance(arena.red_realtime_score.current_score)
+        self.score_alliance(arena.blue_realtime_score.current_score)
+        await arena.realtime_score_notifier.notify()
+        await self.advance_until(lambda: arena.match_state == MatchState.POST_MATCH)
+
+        match_type = arena.current_match.type
+        commit_start_time_ns = time.perf_counter_ns()
+        await commit_current_match_score()
+        self.commit_histograms[match_type].record(
+            (time.perf_counter_ns() - commit_start_time_ns) // 1000
+        )
+        self.num_matches_played += 1
+
+        arena.reset_match()
+        await arena.load_next_match(True)
+        await self.wait(FIELD_RESET_SEC)
+
+    async def run(self, num_teams: int, num_matches: int):
+        arena = self.arena
+        team_ids = self.create_teams(num_teams)
+        self.create_qualification_schedule(team_ids, num_matches)
+
+        await arena.load_match(models.read_matches_by_type(models.MatchType.QUALIFICATION)[0])
+        while arena.current_match.type == models.MatchType.QUALIFICATION:
+            await self.play_match()
+
+        self.create_alliances()
+        arena.create_playoff_matches(self.clock.now())
+        await arena.load_match(models.read_matches_by_type(models.MatchType.PLAYOFF)[0])
+        while not arena.playoff_tournament.is_complete():
+            await self.play_match()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--teams', type=int, default=40)
+    parser.add_argument('--matches', type=int, default=120)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--db', default=':memory:')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+    models.db.bind(provider='sqlite', filename=args.db, create_db=True)
+    models.db.generate_mapping(create_tables=True)
+
+    clock = VirtualClock(EVENT_START_TIME)
+    arena = await Arena.new_arena(clock=clock)
+    APIArena.set_instance(arena)
+    simulation = EventSimulation(arena, clock, args.seed)
+
+    run_loop_task = asyncio.create_task(arena.run_loop())
+    start_time = time.perf_counter()
+    try:
+        await simulation.run(args.teams, args.matches)
+    finally:
+        arena.running = False
+        arena.loop_scheduler.wake()
+        await run_loop_task
+    wall_time_sec = time.perf_counter() - start_time
+
+    virtual_time_sec = clock.monotonic_ns() / 1_000_000_000
+    print(
+        f'Played {simulation.num_matches_played} matches ({virtual_time_sec / 3600:.1f}h of '
+        f'event time) in {wall_time_sec:.2f}s, {virtual_time_sec / wall_time_sec:.0f}x real time'
+    )
+    for match_type, histogram in simulation.commit_histograms.items():
+        print(f'commit_match_score {match_type.name.lower()} (us): {histogram.to_dict()}')
+    print(f'arena loop (us): {arena.metrics.loop_histogram.to_dict()}')
+    print(f'arena loop scheduler: {arena.loop_scheduler.to_dict()}')
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
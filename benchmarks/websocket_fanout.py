@@ -0,0 +1,320 @@
+"""Measures how many display and panel websockets one server can feed.
+
+Starts the FastAPI app on a local port, in a thread of this process, with an arena on an in-memory
+database and no field hardware. Opens simulated displays on the real /api/displays/*/websocket
+routes and scoring panels on /api/panels/scoring/{alliance}/websocket, then has the panels send
+scoring commands at a fixed rate. Reports the time from a realtime_score notify() to every client
+receiving that version, the messages received per second, and the CPU time of the server thread.
+
+The clients run in the main thread, so they share the interpreter lock with the server; their
+share shows up as the difference between the process and server thread CPU times.
+
+    python -m benchmarks.websocket_fanout --displays 200 --rate 20 --duration 10
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import socket
+import threading
+import time
+import zlib
+from collections import Counter
+
+import fastapi
+import orjson
+import uvicorn
+import websockets
+
+import models
+import web
+from field.arena import Arena
+from field.arena_metrics import LatencyHistogram
+from web.arena import APIArena
+from ws.encoding import DEFLATE_SUBPROTOCOL, MSGPACK_SUBPROTOCOL, WebSocketProtocol, msgpack
+from ws.notifier import Notifier
+
+DISPLAY_TYPES = [
+    'alliance_station',
+    'announcer',
+    'audience',
+    'bracket',
+    'field_monitor',
+    'logo',
+    'placeholder',
+    'queueing',
+    'rankings',
+    'twitch',
+    'wall',
+    'webpage',
+]
+# Scoring commands the panels take turns sending; every one changes the score.
+SCORING_COMMANDS = [
+    {'type': 'trough_total', 'data': {'action': 'plus'}},
+    {'type': 'net_total', 'data': {'action': 'plus'}},
+    {'type': 'trough_total', 'data': {'action': 'minus'}},
+    {'type': 'net_total', 'data': {'action': 'minus'}},
+]
+CONNECT_TIMEOUT_SEC = 30
+PERCENTILES = [50, 90, 99, 99.9]
+
+
+class NotifyTimer:
+    """Remembers when each version of a versioned notifier was first asked for.
+
+    A coalesced notifier numbers a version when it flushes, so the time kept for it is that of the
+    first notify() since the previous version, which is when the change it carries happened.
+    """
+
+    notify_times_ns: dict[int, int]
+    pending_time_ns: int | None
+
+    def __init__(self, notifier: Notifier):
+        self.notify_times_ns = {}
+        self.pending_time_ns = None
+        notify = notifier.notify
+        encode_version = notifier.encode_version
+
+        async def timed_notify():
+            if self.pending_time_ns is None:
+                self.pending_time_ns = time.perf_counter_ns()
+            await notify()
+
+        def timed_encode_version(message, with_patch):
+            frame, patch_frame = encode_version(message, with_patch)
+            self.notify_times_ns[notifier.seq] = self.pending_time_ns or time.perf_counter_ns()
+            self.pending_time_ns = None
+            return frame, patch_frame
+
+        notifier.notify = timed_notify
+        notifier.encode_version = timed_encode_version
+
+
+class FanoutServer(threading.Thread):
+    """The app and its arena, running on their own event loop in a separate thread."""
+
+    arena: Arena
+    port: int
+    loop: asyncio.AbstractEventLoop
+    started: threading.Event
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.started = threading.Event()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.loop = asyncio.get_running_loop()
+        models.db.bind(provider='sqlite', filename=':memory:', create_db=True)
+        models.db.generate_mapping(create_tables=True)
+        self.arena = await Arena.new_arena()
+        APIArena.set_instance(self.arena)
+        self.timer = NotifyTimer(self.arena.realtime_score_notifier)
+        run_loop_task = asyncio.create_task(self.arena.run_loop())
+
+        app = fastapi.FastAPI()
+        app.include_router(web.router)
+        # The same per-connection compression as the served app.
+        config = uvicorn.Config(app, ws=WebSocketProtocol, log_level='warning')
+        self.server = uvicorn.Server(config)
+        serve_task = asyncio.create_task(self.server.serve(sockets=[self.sock]))
+        while not self.server.started:
+            await asyncio.sleep(0.01)
+        self.started.set()
+
+        await serve_task
+        self.arena.running = False
+        self.arena.loop_scheduler.wake()
+        await run_loop_task
+
+    async def get_cpu_time(self) -> float:
+        """Reads the CPU time of the server thread, from any thread."""
+
+        async def get_thread_time():
+            return time.thread_time()
+
+        future = asyncio.run_coroutine_threadsafe(get_thread_time(), self.loop)
+        return await asyncio.wrap_future(future)
+
+    def get_fan_out_count(self) -> int:
+        return sum(notifier.fan_out_count for notifier in self.arena.get_notifiers())
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(setattr, self.server, 'should_exit', True)
+
+
+class FanoutStats:
+    latency_histogram: LatencyHistogram
+    message_counts: Counter[str]
+    recording: bool
+
+    def __init__(self, timer: NotifyTimer):
+        self.timer = timer
+        self.latency_histogram = LatencyHistogram()
+        self.message_counts = Counter()
+        self.recording = False
+
+    def record(self, message: dict, receive_time_ns: int):
+        if not self.recording:
+            return
+
+        self.message_counts[message.get('type')] += 1
+        if message.get('type') == 'realtime_score':
+            notify_time_ns = self.timer.notify_times_ns.get(message.get('seq'))
+            if notify_time_ns is not None:
+                self.latency_histogram.record((receive_time_ns - notify_time_ns) // 1000)
+
+
+def decode_frame(frame: str | bytes, subprotocol: str | None) -> dict:
+    if isinstance(frame, bytes):
+        if subprotocol == MSGPACK_SUBPROTOCOL:
+            return msgpack.unpackb(frame)
+        frame = zlib.decompress(frame, -zlib.MAX_WBITS)
+    return orjson.loads(frame)
+
+
+class Client:
+    """One simulated display or panel, counting every message it receives."""
+
+    def __init__(self, url: str, stats: FanoutStats, subprotocol: str | None):
+        self.url = url
+        self.stats = stats
+        self.subprotocol = subprotocol
+        self.connected = asyncio.Event()
+        self.websocket = None
+
+    async def run(self):
+        subprotocols = [self.subprotocol] if self.subprotocol else None
+        async with websockets.connect(
+            self.url, subprotocols=subprotocols, max_size=None
+        ) as websocket:
+            self.websocket = websocket
+            self.connected.set()
+            try:
+                async for frame in websocket:
+                    receive_time_ns = time.perf_counter_ns()
+                    self.stats.record(decode_frame(frame, self.subprotocol), receive_time_ns)
+            except websockets.ConnectionClosed:
+                pass
+
+    async def send(self, message: dict):
+        await self.websocket.send(orjson.dumps(message).decode())
+
+
+async def drive_commands(panels: list[Client], rate: float, duration_sec: float) -> int:
+    """Sends scoring commands round robin over the panels at `rate` per second."""
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    commands = zip(itertools.cycle(panels), itertools.cycle(SCORING_COMMANDS), strict=False)
+    num_commands = 0
+    while loop.time() - start_time < duration_sec:
+        panel, command = next(commands)
+        await panel.send(command)
+        num_commands += 1
+        await asyncio.sleep(max(start_time + num_commands / rate - loop.time(), 0))
+    return num_commands
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--displays', type=int, default=100)
+    parser.add_argument(
+        '--display-types',
+        default=','.join(DISPLAY_TYPES),
+        help='Comma separated display types the displays are spread over',
+    )
+    parser.add_argument('--panels', type=int, default=2, help='Scoring panels, half of them red')
+    parser.add_argument('--rate', type=float, default=10, help='Scoring commands per second')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds to measure')
+    parser.add_argument('--warmup', type=float, default=2, help='Seconds to settle first')
+    parser.add_argument('--delta', action='store_true', help='Have displays opt into deltas')
+    parser.add_argument('--subprotocol', choices=[MSGPACK_SUBPROTOCOL, DEFLATE_SUBPROTOCOL])
+    args = parser.parse_args()
+
+    if args.subprotocol == MSGPACK_SUBPROTOCOL and msgpack is None:
+        raise SystemExit('msgpack is not installed')
+
+    logging.basicConfig(level=logging.ERROR)
+    server = FanoutServer()
+    server.start()
+    await asyncio.to_thread(server.started.wait)
+
+    stats = FanoutStats(server.timer)
+    base_url = f'ws://127.0.0.1:{server.port}/api'
+    query = '&delta=1' if args.delta else ''
+    display_types = itertools.cycle(args.display_types.split(','))
+    displays = [
+        Client(
+            f'{base_url}/displays/{next(display_types)}/websocket?display_id={100 + i}{query}',
+            stats,
+            args.subprotocol,
+        )
+        for i in range(args.displays)
+    ]
+    panels = [
+        Client(
+            f'{base_url}/panels/scoring/{"red" if i % 2 == 0 else "blue"}/websocket?{query[1:]}',
+            stats,
+            args.subprotocol,
+        )
+        for i in range(args.panels)
+    ]
+    clients = displays + panels
+    client_tasks = [asyncio.create_task(client.run()) for client in clients]
+    async with asyncio.timeout(CONNECT_TIMEOUT_SEC):
+        await asyncio.gather(*[client.connected.wait() for client in clients])
+    await asyncio.sleep(args.warmup)
+
+    stats.recording = True
+    start_cpu_time_sec = await server.get_cpu_time()
+    start_process_time_sec = time.process_time()
+    start_fan_out_count = server.get_fan_out_count()
+    start_time = time.perf_counter()
+    num_commands = await drive_commands(panels, args.rate, args.duration)
+    # Let the last commands reach every client before the books are closed.
+    await asyncio.sleep(1)
+    stats.recording = False
+    wall_time_sec = time.perf_counter() - start_time
+    cpu_time_sec = await server.get_cpu_time() - start_cpu_time_sec
+    process_time_sec = time.process_time() - start_process_time_sec
+    fan_out_count = server.get_fan_out_count() - start_fan_out_count
+
+    for client in clients:
+        await client.websocket.close()
+    await asyncio.gather(*client_tasks, return_exceptions=True)
+    server.stop()
+    await asyncio.to_thread(server.join)
+
+    num_messages = sum(stats.message_counts.values())
+    histogram = stats.latency_histogram
+    print(
+        f'{len(displays)} displays and {len(panels)} scoring panels, {num_commands} commands in '
+        f'{wall_time_sec:.1f}s'
+    )
+    print(
+        'realtime_score notify to receive (us): '
+        + ', '.join(
+            f'p{percentile:g} {histogram.get_percentile(percentile)}' for percentile in PERCENTILES
+        )
+        + f', max {histogram.max_value} over {histogram.count} messages'
+    )
+    print(
+        f'received {num_messages} messages, {num_messages / wall_time_sec:.0f}/s; '
+        f'queued by notifiers {fan_out_count}, {fan_out_count / wall_time_sec:.0f}/s'
+    )
+    for message_type, count in stats.message_counts.most_common():
+        print(f'  {message_type:<24}{count:>10}{count / wall_time_sec:>10.0f}/s')
+    print(
+        f'server thread CPU {cpu_time_sec:.2f}s ({cpu_time_sec / wall_time_sec:.0%} of a core), '
+        f'whole process {process_time_sec:.2f}s'
+    )
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
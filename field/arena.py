@@ -1,5 +1,6 @@
 import asyncio
 import logging
+import time
 from datetime import datetime, timedelta
 
 import game
@@ -9,14 +10,22 @@ import playoff
 from models.event import Event
 from network import AccessPoint, Switch, TeamWifiStatus
 
+from .arena_metrics import ArenaMetrics
 from .arena_notifiers import ArenaNotifiersMixin
+from .clock import Clock
 from .display import Display, DisplayMixin
-from .driver_station_connection import DriverStationConnection, DriverStationConnectionMixin
+from .driver_station_connection import (
+    DriverStationConnection,
+    DriverStationConnectionMixin,
+    encode_control_packet_match_fields,
+)
+from .ds_heartbeat import DriverStationHeartbeat, create_control_snapshot
 from .event_status import EventStatusMixin
+from .loop_scheduler import LoopScheduler
+from .match_timeline import MatchTimeline
 from .realtime_score import RealtimeScore
 from .scoring_panel_register import ScoringPanelRegister
 from .specs import (
-    ARENA_LOOP_PERIOD_MS,
     ARENA_LOOP_WARNING_US,
     DS_PACKET_PERIOD_MS,
     DS_PACKET_WARNING_MS,
@@ -25,6 +34,7 @@ from .specs import (
     POST_TIMEOUT_SEC,
     PRE_LOAD_NEXT_MATCH_DELAY_SEC,
     SCHEDULED_BREAK_DELAY_SEC,
+    WEBSOCKET_STATS_PERIOD_SEC,
     MatchState,
 )
 from .team_sign import TeamSigns
@@ -83,13 +93,14 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
     # nexus_client:
     # blackmagic_client:
     alliance_stations: dict[str, AllianceStation]
+    # Station of every assigned team, kept by assign_team for the per-packet driver station lookup.
+    team_stations: dict[int, str]
     team_signs: TeamSigns
     scoring_panel_registry: ScoringPanelRegister
     match_state: MatchState = MatchState.PRE_MATCH
     last_match_state: MatchState
     current_match: models.Match
     match_start_time: datetime
-    last_match_time_sec: float
     red_realtime_score: RealtimeScore = RealtimeScore()
     blue_realtime_score: RealtimeScore = RealtimeScore()
     last_ds_packet_time: datetime = datetime.now()
@@ -112,13 +123,26 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
     sounds_played: set[str] = set()
     break_description: str = ''
     preloaded_teams: list[models.Team] = None
-
-    def __init__(self, *args, **kwargs):
+    loop_scheduler: LoopScheduler
+    match_timeline: MatchTimeline
+    metrics: ArenaMetrics
+    # Sends the driver station control packets in place of the arena loop when set.
+    ds_heartbeat: DriverStationHeartbeat | None
+    clock: Clock
+
+    def __init__(self, *args, clock: Clock = None, **kwargs):
+        self.clock = clock if clock is not None else Clock()
+        self.last_ds_packet_time = self.clock.now()
+        self.loop_scheduler = LoopScheduler(self.clock)
+        self.metrics = ArenaMetrics()
+        self.match_timeline = MatchTimeline()
+        self.team_stations = {}
+        self.ds_heartbeat = None
         super().__init__(*args, **kwargs)
 
     @classmethod
-    async def new_arena(cls):
-        arena = cls()
+    async def new_arena(cls, clock: Clock = None):
+        arena = cls(clock=clock)
         arena.alliance_stations = {
             station: AllianceStation(i, arena.access_point)
             for i, station in enumerate(['R1', 'R2', 'R3', 'B1', 'B2', 'B3'])
@@ -133,7 +157,6 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
 
         arena.match_state = MatchState.PRE_MATCH
         await arena.load_test_match()
-        arena.last_match_time_sec = 0
         arena.last_match_state = -1
 
         arena.audience_display_mode = 'blank'
@@ -201,7 +224,7 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
     def update_playoff_tournament(self):
         alliances = models.read_all_alliances()
         if len(alliances) > 0:
-            return self.playoff_tournament.update_matches(alliances)
+            return self.playoff_tournament.update_matches()
 
     async def load_match(self, match: models.Match):
         if (
@@ -267,8 +290,10 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
             if scheduled_break is not None:
 
                 async def scheduled_break_delay():
-                    await asyncio.sleep(SCHEDULED_BREAK_DELAY_SEC)
-                    self.start_timeout(scheduled_break.description, scheduled_break.duration_sec)
+                    await self.clock.sleep(SCHEDULED_BREAK_DELAY_SEC)
+                    await self.start_timeout(
+                        scheduled_break.description, scheduled_break.duration_sec
+                    )
 
                 asyncio.create_task(scheduled_break_delay())
 
@@ -308,7 +333,7 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
     async def start_match(self):
         can_start = self.check_can_start_match()
         if can_start:
-            self.current_match.started_at = datetime.now()
+            self.current_match.started_at = self.clock.now()
             if self.current_match.type != models.MatchType.TEST:
                 models.update_match(self.current_match)
 
@@ -330,6 +355,7 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
                     models.update_team(alliance_station.team)
 
             self.match_state = MatchState.START_MATCH
+            self.loop_scheduler.wake()
             return
         else:
             raise RuntimeError('Cannot start match')
@@ -343,9 +369,10 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
             raise RuntimeError('Cannot abort match while match is not in progress')
 
         if self.match_state == MatchState.TIMEOUT_ACTIVE:
-            self.match_start_time = datetime.now() - timedelta(
+            self.match_start_time = self.clock.now() - timedelta(
                 seconds=game.timing.timeout_duration_sec
             )
+            self.loop_scheduler.wake()
             return
 
         if self.match_state != MatchState.WARMUP_PERIOD:
@@ -353,6 +380,7 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
 
         self.match_state = MatchState.POST_MATCH
         self.match_aborted = True
+        self.loop_scheduler.wake()
         self.audience_display_mode = 'blank'
         await self.audience_display_mode_notifier.notify()
         self.alliance_station_display_mode = 'logo'
@@ -371,6 +399,7 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
 
         if self.match_state != MatchState.TIMEOUT_ACTIVE:
             self.match_state = MatchState.PRE_MATCH
+            self.loop_scheduler.wake()
 
         self.match_aborted = False
         self.alliance_stations['R1'].bypass = False
@@ -395,8 +424,9 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
         self.break_description = description
         await self.match_load_notifier.notify()
         self.match_state = MatchState.TIMEOUT_ACTIVE
-        self.match_start_time = datetime.now()
-        self.last_match_time_sec = -1
+        self.match_start_time = self.clock.now()
+        self.match_timeline = MatchTimeline.for_timeout(duration_sec)
+        self.loop_scheduler.wake()
         self.alliance_station_display_mode = 'timeout'
         await self.alliance_station_display_mode_notifier.notify()
 
@@ -420,9 +450,10 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
         ]:
             return 0.0
         else:
-            return (datetime.now() - self.match_start_time).total_seconds()
+            return (self.clock.now() - self.match_start_time).total_seconds()
 
     async def update(self):
+        phase_start_time_ns = time.perf_counter_ns()
         auto = False
         enabled = False
         send_ds_packet = False
@@ -433,8 +464,8 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
             enabled = False
 
         elif self.match_state == MatchState.START_MATCH:
-            self.match_start_time = datetime.now()
-            self.last_match_time_sec = -1
+            self.match_start_time = self.clock.now()
+            self.match_timeline = MatchTimeline.for_match(game.timing, game.get_sounds())
             auto = True
             self.audience_display_mode = 'match'
             await self.audience_display_mode_notifier.notify()
@@ -497,7 +528,7 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
                 # stop blackmagic
 
                 async def post_match_dwell():
-                    await asyncio.sleep(MATCH_END_SCORE_DWELL_SEC)
+                    await self.clock.sleep(MATCH_END_SCORE_DWELL_SEC)
                     self.audience_display_mode = 'blank'
                     await self.audience_display_mode_notifier.notify()
                     self.alliance_station_display_mode = 'logo'
@@ -506,7 +537,7 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
                 asyncio.create_task(post_match_dwell())
 
                 async def pre_load_next_match_delay():
-                    await asyncio.sleep(PRE_LOAD_NEXT_MATCH_DELAY_SEC)
+                    await self.clock.sleep(PRE_LOAD_NEXT_MATCH_DELAY_SEC)
                     await self.pre_load_next_match()
 
                 asyncio.create_task(pre_load_next_match_delay())
@@ -516,7 +547,7 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
                 self.match_state = MatchState.POST_TIMEOUT
 
                 async def post_timeout_dwell():
-                    await asyncio.sleep(MATCH_END_SCORE_DWELL_SEC)
+                    await self.clock.sleep(MATCH_END_SCORE_DWELL_SEC)
                     self.audience_display_mode = 'blank'
                     await self.audience_display_mode_notifier.notify()
                     self.alliance_station_display_mode = 'logo'
@@ -527,27 +558,42 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
             if match_time_sec >= game.timing.timeout_duration_sec + POST_TIMEOUT_SEC:
                 self.match_state = MatchState.PRE_MATCH
 
-        if (
-            int(match_time_sec) != int(self.last_match_time_sec)
-            or self.match_state != self.last_match_state
-        ):
+        phase_start_time_ns = self.record_update_phase('state_transition', phase_start_time_ns)
+
+        # Displays count the match time down on their own from the server timestamp in each
+        # message, so only state transitions are broadcast.
+        if self.match_state != self.last_match_state:
             await self.match_time_notifier.notify()
+            phase_start_time_ns = self.record_update_phase(
+                'match_time_notifier', phase_start_time_ns
+            )
 
-        ms_since_last_ds_packet = (datetime.now() - self.last_ds_packet_time).total_seconds() * 1000
-        if send_ds_packet or ms_since_last_ds_packet > DS_PACKET_PERIOD_MS:
+        ms_since_last_ds_packet = (
+            self.clock.now() - self.last_ds_packet_time
+        ).total_seconds() * 1000
+        if send_ds_packet or ms_since_last_ds_packet >= DS_PACKET_PERIOD_MS:
             if (
                 ms_since_last_ds_packet >= DS_PACKET_WARNING_MS
                 and self.last_ds_packet_time > datetime.min
+                and self.ds_heartbeat is None
             ):
                 logger.warning(f'Last DS packet was {ms_since_last_ds_packet}ms ago')
             self.send_ds_packet(auto, enabled)
+            phase_start_time_ns = self.record_update_phase('send_ds_packet', phase_start_time_ns)
             await self.arena_status_notifier.notify()
+            phase_start_time_ns = self.record_update_phase(
+                'arena_status_notifier', phase_start_time_ns
+            )
+        elif self.ds_heartbeat is not None:
+            # Every update is published, so an E-stop reaches the heartbeat without waiting for
+            # the next packet period.
+            self.publish_ds_control(auto, enabled)
 
         await self.handle_sounds(match_time_sec)
+        self.record_update_phase('handle_sounds', phase_start_time_ns)
         # self.handle_plc_io()
         # self.team_signs.update(self)
 
-        self.last_match_time_sec = match_time_sec
         self.last_match_state = self.match_state
 
     async def run(self):
@@ -555,19 +601,48 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
             # tg.create_task(self.listen_for_driver_stations())
             # tg.create_task(self.listen_for_ds_udp_packets())
             tg.create_task(self.run_periodic_task())
+            tg.create_task(self.run_websocket_stats_task())
             tg.create_task(self.access_point.run())
+            if self.ds_heartbeat is not None:
+                tg.create_task(self.ds_heartbeat.run())
             # run plc
-            self.running = True
-
-            while self.running:
-                loop_start_time = datetime.now()
-                await self.update()
-
-                loop_run_time = int((datetime.now() - loop_start_time).total_seconds() * 1000000)
-                if loop_run_time > ARENA_LOOP_WARNING_US:
-                    logger.warning(f'Arena loop took a long time: {loop_run_time}us')
-
-                await asyncio.sleep(ARENA_LOOP_PERIOD_MS / 1000)
+            await self.run_loop()
+
+    async def run_loop(self):
+        self.running = True
+        self.loop_scheduler.reset()
+        while self.running:
+            loop_start_time_ns = time.perf_counter_ns()
+            await self.update()
+
+            loop_run_time_ns = time.perf_counter_ns() - loop_start_time_ns
+            self.metrics.record_loop(loop_run_time_ns)
+            loop_run_time = loop_run_time_ns // 1000
+            if loop_run_time > ARENA_LOOP_WARNING_US:
+                logger.warning(f'Arena loop took a long time: {loop_run_time}us')
+
+            # Sleep until the next timeline event or DS heartbeat, unless woken up earlier.
+            next_update_delay_ns = int(self.get_next_update_delay_sec() * 1_000_000_000)
+            await self.loop_scheduler.wait_until(self.clock.monotonic_ns() + next_update_delay_ns)
+
+    def record_update_phase(self, phase: str, phase_start_time_ns: int) -> int:
+        phase_end_time_ns = time.perf_counter_ns()
+        self.metrics.record_phase(phase, phase_end_time_ns - phase_start_time_ns)
+        return phase_end_time_ns
+
+    def get_next_update_delay_sec(self):
+        ms_since_last_ds_packet = (
+            self.clock.now() - self.last_ds_packet_time
+        ).total_seconds() * 1000
+        delay_sec = (DS_PACKET_PERIOD_MS - ms_since_last_ds_packet) / 1000
+
+        if self.match_state not in [MatchState.PRE_MATCH, MatchState.POST_MATCH]:
+            match_time_sec = self.match_time_sec()
+            next_event_time_sec = self.match_timeline.next_event_time_sec(match_time_sec)
+            if next_event_time_sec is not None:
+                delay_sec = min(delay_sec, next_event_time_sec - match_time_sec)
+
+        return max(delay_sec, 0.0)
 
     def red_score_summary(self):
         return self.red_realtime_score.current_score.summarize(
@@ -601,20 +676,29 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
 
         if ds_conn is not None:
             ds_conn.close()
-            self.alliance_stations[station].team = None
+            self.set_alliance_station_team(station, None)
             self.alliance_stations[station].ds_conn = None
 
         if team_id == 0:
-            self.alliance_stations[station].team = None
+            self.set_alliance_station_team(station, None)
             return
 
         team = models.read_team_by_id(team_id)
         if team is None:
             team = models.Team(id=team_id)
 
-        self.alliance_stations[station].team = team
+        self.set_alliance_station_team(station, team)
         return
 
+    def set_alliance_station_team(self, station: str, team: models.Team | None):
+        previous_team = self.alliance_stations[station].team
+        if previous_team is not None and self.team_stations.get(previous_team.id) == station:
+            del self.team_stations[previous_team.id]
+
+        self.alliance_stations[station].team = team
+        if team is not None:
+            self.team_stations[team.id] = station
+
     def get_next_match(self, exclude_current: bool):
         if self.current_match.type == models.MatchType.TEST:
             return None
@@ -698,7 +782,8 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
                         return False
         return True
 
-    def send_ds_packet(self, auto: bool, enabled: bool):
+    def update_ds_control(self, auto: bool, enabled: bool) -> list[DriverStationConnection]:
+        ds_conns = []
         for alliance_station in self.alliance_stations.values():
             ds_conn = alliance_station.ds_conn
             if ds_conn is not None:
@@ -711,16 +796,39 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
                 )
                 ds_conn.e_stop = alliance_station.e_stop
                 ds_conn.a_stop = alliance_station.a_stop
-                ds_conn.update(self)
+                ds_conns.append(ds_conn)
+        return ds_conns
 
-        self.last_ds_packet_time = datetime.now()
+    def publish_ds_control(self, auto: bool, enabled: bool) -> list[DriverStationConnection]:
+        ds_conns = self.update_ds_control(auto, enabled)
+        self.ds_heartbeat.publish(create_control_snapshot(self, ds_conns))
+        return ds_conns
 
-    def get_assigned_alliance_station(self, team_id):
-        for station, alliance_station in self.alliance_stations.items():
-            if alliance_station.team is not None and alliance_station.team.id == team_id:
-                return station
+    def send_ds_packet(self, auto: bool, enabled: bool):
+        if self.ds_heartbeat is not None:
+            # The heartbeat sends the packets on its own timer; only the link status is kept here.
+            ds_conns = self.publish_ds_control(auto, enabled)
+        else:
+            ds_conns = self.update_ds_control(auto, enabled)
+            self.metrics.record_ds_packet_interval(
+                (self.clock.now() - self.last_ds_packet_time) // timedelta(microseconds=1) * 1000
+            )
+            # The match fields are encoded once and copied into every station's packet, and the
+            # packets all go out together once they are encoded.
+            match_fields = encode_control_packet_match_fields(
+                self, self.control_packet_match_fields
+            )
+            packets = [ds_conn.encode_control_packet(self, match_fields) for ds_conn in ds_conns]
+            for ds_conn, packet in zip(ds_conns, packets, strict=True):
+                ds_conn.send_control_packet(packet)
+
+        for ds_conn in ds_conns:
+            ds_conn.update_link_status()
 
-        return ''
+        self.last_ds_packet_time = self.clock.now()
+
+    def get_assigned_alliance_station(self, team_id):
+        return self.team_stations.get(team_id, '')
 
     def handle_team_stop(self, station: str, e_stop: bool, a_stop: bool):
         alliance_station = self.alliance_stations[station]
@@ -736,6 +844,8 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
             alliance_station.a_stop = False
             alliance_station.a_stop_reset = True
 
+        self.loop_scheduler.wake()
+
     async def handle_sounds(self, match_time_sec: float):
         if self.match_state in [
             MatchState.PRE_MATCH,
@@ -744,17 +854,10 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
         ]:
             return
 
-        for sound in game.get_sounds():
-            if sound.match_time_sec < 0:
-                continue
-
+        for sound in self.match_timeline.due_sounds(match_time_sec):
             if sound.name not in self.sounds_played:
-                if (
-                    match_time_sec >= sound.match_time_sec
-                    and match_time_sec - sound.match_time_sec < 1
-                ):
-                    await self.play_sound(sound.name)
-                    self.sounds_played.add(sound.name)
+                await self.play_sound(sound.name)
+                self.sounds_played.add(sound.name)
 
     async def play_sound(self, name: str):
         if not self.mute_match_sounds:
@@ -771,4 +874,12 @@ class Arena(DisplayMixin, EventStatusMixin, DriverStationConnectionMixin, ArenaN
         while True:
             await self.update_early_late_message()
             await self.purge_disconnected_displays()
-            await asyncio.sleep(PERIODIC_TASK_PERIOD_SEC)
+            await self.clock.sleep(PERIODIC_TASK_PERIOD_SEC)
+
+    async def run_websocket_stats_task(self):
+        while True:
+            # Collecting the statistics visits every listener, so it is only done while someone
+            # is watching them.
+            if self.websocket_stats_notifier.listeners:
+                await self.websocket_stats_notifier.notify()
+            await self.clock.sleep(WEBSOCKET_STATS_PERIOD_SEC)
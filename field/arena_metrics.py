@@ -0,0 +1,254 @@
+import math
+
+from ws.notifier import Notifier
+
+from .loop_scheduler import LoopScheduler
+
+HISTOGRAM_SUB_BUCKET_BITS = 5
+HISTOGRAM_SUB_BUCKET_COUNT = 1 << HISTOGRAM_SUB_BUCKET_BITS
+HISTOGRAM_MAX_VALUE_BITS = 31
+ARENA_LOOP_PHASES = [
+    'state_transition',
+    'match_time_notifier',
+    'send_ds_packet',
+    'arena_status_notifier',
+    'handle_sounds',
+]
+REPORTED_QUANTILES = [0.5, 0.99]
+
+
+class LatencyHistogram:
+    """Streaming log-linear histogram in the style of HdrHistogram.
+
+    Values below 64 are counted exactly; above that, every power-of-two range is split into 32
+    buckets, which bounds the error of any reported percentile to about 3% while recording stays a
+    couple of integer operations.
+    """
+
+    counts: list[int]
+    count: int
+    total: int
+    max_value: int
+
+    def __init__(self):
+        num_buckets = (
+            HISTOGRAM_MAX_VALUE_BITS - HISTOGRAM_SUB_BUCKET_BITS + 1
+        ) * HISTOGRAM_SUB_BUCKET_COUNT
+        self.counts = [0] * num_buckets
+        self.reset()
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.count = 0
+        self.total = 0
+        self.max_value = 0
+
+    @staticmethod
+    def get_bucket_index(value: int) -> int:
+        shift = max(value.bit_length() - HISTOGRAM_SUB_BUCKET_BITS - 1, 0)
+        return shift * HISTOGRAM_SUB_BUCKET_COUNT + (value >> shift)
+
+    @staticmethod
+    def get_bucket_upper_bound(index: int) -> int:
+        if index < 2 * HISTOGRAM_SUB_BUCKET_COUNT:
+            return index
+
+        shift = index // HISTOGRAM_SUB_BUCKET_COUNT - 1
+        sub_bucket = index - shift * HISTOGRAM_SUB_BUCKET_COUNT
+        return ((sub_bucket + 1) << shift) - 1
+
+    def record(self, value: int):
+        value = min(max(int(value), 0), (1 << HISTOGRAM_MAX_VALUE_BITS) - 1)
+        self.counts[self.get_bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max_value:
+            self.max_value = value
+
+    def get_percentile(self, percentile: float) -> int:
+        if self.count == 0:
+            return 0
+
+        target = max(math.ceil(self.count * percentile / 100), 1)
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= target:
+                return min(self.get_bucket_upper_bound(index), self.max_value)
+
+        return self.max_value
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'p50': self.get_percentile(50),
+            'p99': self.get_percentile(99),
+            'max': self.max_value,
+        }
+
+
+class ArenaMetrics:
+    """Per-phase timing of Arena.update and driver station packet intervals, in microseconds."""
+
+    phase_histograms: dict[str, LatencyHistogram]
+    loop_histogram: LatencyHistogram
+    ds_packet_interval_histogram: LatencyHistogram
+
+    def __init__(self):
+        self.phase_histograms = {phase: LatencyHistogram() for phase in ARENA_LOOP_PHASES}
+        self.loop_histogram = LatencyHistogram()
+        self.ds_packet_interval_histogram = LatencyHistogram()
+
+    def record_phase(self, phase: str, duration_ns: int):
+        self.phase_histograms[phase].record(duration_ns // 1000)
+
+    def record_loop(self, duration_ns: int):
+        self.loop_histogram.record(duration_ns // 1000)
+
+    def record_ds_packet_interval(self, interval_ns: int):
+        self.ds_packet_interval_histogram.record(interval_ns // 1000)
+
+    def reset(self):
+        for histogram in self.phase_histograms.values():
+            histogram.reset()
+        self.loop_histogram.reset()
+        self.ds_packet_interval_histogram.reset()
+
+    def to_dict(self):
+        return {
+            'loop': self.loop_histogram.to_dict(),
+            'ds_packet_interval': self.ds_packet_interval_histogram.to_dict(),
+            'phases': {
+                phase: histogram.to_dict() for phase, histogram in self.phase_histograms.items()
+            },
+        }
+
+    def to_prometheus_text(self, loop_scheduler: LoopScheduler, notifiers: list[Notifier]) -> str:
+        lines = []
+        write_summary(
+            lines,
+            'pengiloo_arena_loop_duration_microseconds',
+            'Duration of a whole Arena.update call.',
+            {'': self.loop_histogram},
+        )
+        write_summary(
+            lines,
+            'pengiloo_arena_phase_duration_microseconds',
+            'Duration of each phase of Arena.update.',
+            {f'phase="{phase}"': histogram for phase, histogram in self.phase_histograms.items()},
+        )
+        write_summary(
+            lines,
+            'pengiloo_ds_packet_interval_microseconds',
+            'Time between successive rounds of driver station control packets.',
+            {'': self.ds_packet_interval_histogram},
+        )
+
+        scheduler_status = loop_scheduler.to_dict()
+        write_metric(
+            lines,
+            'pengiloo_arena_loop_wakeups_total',
+            'counter',
+            'Arena loop iterations.',
+            {'': scheduler_status['tick_count']},
+        )
+        write_metric(
+            lines,
+            'pengiloo_arena_loop_early_wakeups_total',
+            'counter',
+            'Arena loop iterations woken by a state change before their deadline.',
+            {'': scheduler_status['wake_count']},
+        )
+        write_metric(
+            lines,
+            'pengiloo_arena_loop_lateness_max_microseconds',
+            'gauge',
+            'Largest delay between a scheduled arena loop deadline and the actual wakeup.',
+            {'': scheduler_status['max_lateness_us']},
+        )
+
+        write_metric(
+            lines,
+            'pengiloo_notifier_notifications_total',
+            'counter',
+            'Number of notify calls per notifier.',
+            {f'notifier="{n.message_type}"': n.notify_count for n in notifiers},
+        )
+        write_metric(
+            lines,
+            'pengiloo_notifier_messages_sent_total',
+            'counter',
+            'Number of messages fanned out to listeners per notifier.',
+            {f'notifier="{n.message_type}"': n.fan_out_count for n in notifiers},
+        )
+        write_metric(
+            lines,
+            'pengiloo_notifier_coalesced_total',
+            'counter',
+            'Number of notify calls folded into a pending coalesced notification per notifier.',
+            {f'notifier="{n.message_type}"': n.coalesced_count for n in notifiers},
+        )
+        write_metric(
+            lines,
+            'pengiloo_notifier_messages_encoded_total',
+            'counter',
+            'Number of messages encoded once for all listeners per notifier.',
+            {f'notifier="{n.message_type}"': n.message_count for n in notifiers},
+        )
+        write_metric(
+            lines,
+            'pengiloo_notifier_encoded_bytes_total',
+            'counter',
+            'Bytes of the frames encoded per notifier, snapshots and patches alike.',
+            {f'notifier="{n.message_type}"': n.encoded_bytes for n in notifiers},
+        )
+        write_metric(
+            lines,
+            'pengiloo_notifier_encode_time_microseconds_total',
+            'counter',
+            'Time spent encoding messages per notifier.',
+            {f'notifier="{n.message_type}"': n.encode_time_ns // 1000 for n in notifiers},
+        )
+        write_metric(
+            lines,
+            'pengiloo_notifier_listeners',
+            'gauge',
+            'Number of listeners currently connected per notifier.',
+            {f'notifier="{n.message_type}"': len(n.listeners) for n in notifiers},
+        )
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels: str, extra: str = '') -> str:
+    labels = ','.join(label for label in [labels, extra] if label)
+    return f'{{{labels}}}' if labels else ''
+
+
+def write_metric(lines: list[str], name: str, type: str, help: str, values: dict[str, int]):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} {type}')
+    for labels, value in values.items():
+        lines.append(f'{name}{format_labels(labels)} {value}')
+
+
+def write_summary(lines: list[str], name: str, help: str, histograms: dict[str, LatencyHistogram]):
+    lines.append(f'# HELP {name} {help}')
+    lines.append(f'# TYPE {name} summary')
+    for labels, histogram in histograms.items():
+        for quantile in REPORTED_QUANTILES:
+            quantile_label = f'quantile="{quantile}"'
+            lines.append(
+                f'{name}{format_labels(labels, quantile_label)} '
+                f'{histogram.get_percentile(quantile * 100)}'
+            )
+        lines.append(f'{name}_sum{format_labels(labels)} {histogram.total}')
+        lines.append(f'{name}_count{format_labels(labels)} {histogram.count}')
+
+    write_metric(
+        lines,
+        f'{name}_max',
+        'gauge',
+        f'Maximum of {name}.',
+        {labels: histogram.max_value for labels, histogram in histograms.items()},
+    )
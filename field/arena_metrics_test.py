@@ -0,0 +1,89 @@
+import unittest
+
+from ws.notifier import Notifier
+
+from .arena_metrics import ArenaMetrics, LatencyHistogram
+from .loop_scheduler import LoopScheduler
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_empty(self):
+        histogram = LatencyHistogram()
+        self.assertEqual(histogram.get_percentile(50), 0)
+        self.assertEqual(histogram.to_dict(), {'count': 0, 'p50': 0, 'p99': 0, 'max': 0})
+
+    def test_exact_small_values(self):
+        histogram = LatencyHistogram()
+        for value in range(1, 11):
+            histogram.record(value)
+        self.assertEqual(histogram.count, 10)
+        self.assertEqual(histogram.total, 55)
+        self.assertEqual(histogram.get_percentile(50), 5)
+        self.assertEqual(histogram.get_percentile(100), 10)
+        self.assertEqual(histogram.max_value, 10)
+
+    def test_bucket_error_bound(self):
+        for value in [64, 100, 1000, 3000, 123456, 10_000_000]:
+            index = LatencyHistogram.get_bucket_index(value)
+            upper_bound = LatencyHistogram.get_bucket_upper_bound(index)
+            self.assertGreaterEqual(upper_bound, value)
+            self.assertLessEqual(upper_bound - value, value / 32)
+            if index > 0:
+                self.assertLess(LatencyHistogram.get_bucket_upper_bound(index - 1), value)
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram()
+        for _ in range(990):
+            histogram.record(200)
+        for _ in range(10):
+            histogram.record(5000)
+        self.assertAlmostEqual(histogram.get_percentile(50), 200, delta=200 / 32)
+        self.assertAlmostEqual(histogram.get_percentile(99), 200, delta=200 / 32)
+        self.assertEqual(histogram.get_percentile(99.9), 5000)
+        self.assertEqual(histogram.max_value, 5000)
+
+        histogram.reset()
+        self.assertEqual(histogram.count, 0)
+        self.assertEqual(histogram.get_percentile(99), 0)
+
+    def test_clamps_out_of_range_values(self):
+        histogram = LatencyHistogram()
+        histogram.record(-5)
+        histogram.record(1 << 40)
+        self.assertEqual(histogram.count, 2)
+        self.assertEqual(histogram.get_percentile(1), 0)
+
+
+class TestArenaMetrics(unittest.TestCase):
+    def test_prometheus_text(self):
+        metrics = ArenaMetrics()
+        metrics.record_phase('send_ds_packet', 150_000)
+        metrics.record_loop(400_000)
+        metrics.record_ds_packet_interval(500_000_000)
+        notifier = Notifier('match_time', None)
+        notifier.notify_count = 3
+        notifier.fan_out_count = 12
+        notifier.coalesced_count = 2
+        notifier.encoded_bytes = 480
+        notifier.encode_time_ns = 25_000
+
+        text = metrics.to_prometheus_text(LoopScheduler(), [notifier])
+        self.assertIn(
+            'pengiloo_arena_phase_duration_microseconds{phase="send_ds_packet",quantile="0.5"} 150',
+            text,
+        )
+        self.assertIn(
+            'pengiloo_arena_phase_duration_microseconds_count{phase="handle_sounds"} 0', text
+        )
+        self.assertIn('pengiloo_arena_loop_duration_microseconds_max 400', text)
+        self.assertIn('pengiloo_ds_packet_interval_microseconds_count 1', text)
+        self.assertIn('pengiloo_arena_loop_early_wakeups_total 0', text)
+        self.assertIn('pengiloo_notifier_notifications_total{notifier="match_time"} 3', text)
+        self.assertIn('pengiloo_notifier_messages_sent_total{notifier="match_time"} 12', text)
+        self.assertIn('pengiloo_notifier_coalesced_total{notifier="match_time"} 2', text)
+        self.assertIn('pengiloo_notifier_encoded_bytes_total{notifier="match_time"} 480', text)
+        self.assertIn(
+            'pengiloo_notifier_encode_time_microseconds_total{notifier="match_time"} 25', text
+        )
+        self.assertIn('pengiloo_notifier_listeners{notifier="match_time"} 0', text)
+        self.assertTrue(text.endswith('\n'))
@@ -2,16 +2,18 @@ from pydantic import BaseModel
 
 import game
 import models
-from ws.notifier import Notifier
+from ws.notifier import Notifier, get_stats
 
 from .display import Display
 from .realtime_score import RealtimeScore
-from .specs import MatchState
+from .specs import NOTIFIER_COALESCE_INTERVAL_SEC, NOTIFIER_REPLAY_SIZE, MatchState
 
 
 class MatchTimeMessage(BaseModel):
     match_state: MatchState
-    match_time_sec: int
+    match_time_sec: float
+    # Server wall clock time at which match_time_sec was taken, in milliseconds since the epoch.
+    server_time_ms: float
 
 
 class AudienceAllianceScoreFields(BaseModel):
@@ -35,6 +37,7 @@ class ArenaNotifiersMixin:
     reload_displays_notifier: Notifier
     score_posted_notifier: Notifier
     scoring_status_notifier: Notifier
+    websocket_stats_notifier: Notifier
 
     @staticmethod
     def get_audience_alliance_score_fields(
@@ -64,7 +67,13 @@ class ArenaNotifiersMixin:
         self.alliance_station_display_mode_notifier = Notifier(
             'alliance_station_display_mode', self.generate_alliance_station_display_mode_message
         )
-        self.arena_status_notifier = Notifier('arena_status', self.generate_arena_status_message)
+        self.arena_status_notifier = Notifier(
+            'arena_status',
+            self.generate_arena_status_message,
+            NOTIFIER_COALESCE_INTERVAL_SEC,
+            delta=True,
+            replay_size=NOTIFIER_REPLAY_SIZE,
+        )
         self.audience_display_mode_notifier = Notifier(
             'audience_display_mode', self.generate_audience_display_mode_message
         )
@@ -73,20 +82,65 @@ class ArenaNotifiersMixin:
         )
         self.event_status_notifier = Notifier('event_status', self.generate_event_status_message)
         self.lower_third_notifier = Notifier('lower_third', self.generate_lower_third_message)
-        self.match_load_notifier = Notifier('match_load', self.generate_match_load_message)
-        self.match_time_notifier = Notifier('match_time', self.generate_match_time_message)
+        # The match load and score posted messages are read from the database, so their bodies are
+        # cached for reconnecting displays until the next notify() or invalidate(), and a display
+        # that resumes with the latest version does not need them at all.
+        self.match_load_notifier = Notifier(
+            'match_load',
+            self.generate_match_load_message,
+            cache=True,
+            replay_size=NOTIFIER_REPLAY_SIZE,
+        )
+        self.match_time_notifier = Notifier(
+            'match_time', self.generate_match_time_message, NOTIFIER_COALESCE_INTERVAL_SEC
+        )
         self.match_timing_notifier = Notifier('match_timing', self.generate_match_timing_message)
-        self.play_sound_notifier = Notifier('play_sound', None)
+        # Messages without a producer are only recoverable from the replay buffer.
+        self.play_sound_notifier = Notifier('play_sound', None, replay_size=NOTIFIER_REPLAY_SIZE)
         self.realtime_score_notifier = Notifier(
-            'realtime_score', self.generate_realtime_score_message
+            'realtime_score',
+            self.generate_realtime_score_message,
+            NOTIFIER_COALESCE_INTERVAL_SEC,
+            delta=True,
+            replay_size=NOTIFIER_REPLAY_SIZE,
+        )
+        self.reload_displays_notifier = Notifier(
+            'reload_displays', None, replay_size=NOTIFIER_REPLAY_SIZE
+        )
+        self.score_posted_notifier = Notifier(
+            'score_posted',
+            self.generate_score_posted_message,
+            cache=True,
+            replay_size=NOTIFIER_REPLAY_SIZE,
         )
-        self.reload_displays_notifier = Notifier('reload_displays', None)
-        self.score_posted_notifier = Notifier('score_posted', self.generate_score_posted_message)
         self.scoring_status_notifier = Notifier(
             'scoring_status', self.generate_scoring_status_message
         )
+        self.websocket_stats_notifier = Notifier(
+            'websocket_stats', self.generate_websocket_stats_message, relayed=False
+        )
         super().__init__(*args, **kwargs)
 
+    def get_notifiers(self) -> list[Notifier]:
+        return [
+            self.alliance_selection_notifier,
+            self.alliance_station_display_mode_notifier,
+            self.arena_status_notifier,
+            self.audience_display_mode_notifier,
+            self.display_configuration_notifier,
+            self.event_status_notifier,
+            self.lower_third_notifier,
+            self.match_load_notifier,
+            self.match_time_notifier,
+            self.match_timing_notifier,
+            self.play_sound_notifier,
+            self.realtime_score_notifier,
+            self.reload_displays_notifier,
+            self.score_posted_notifier,
+            self.scoring_status_notifier,
+            self.websocket_stats_notifier,
+        ]
+
     def generate_alliance_selection_message(self):
         return {
             'alliances': self.alliance_selection_alliances,
@@ -188,7 +242,9 @@ class ArenaNotifiersMixin:
 
     def generate_match_time_message(self):
         return MatchTimeMessage(
-            match_state=self.match_state, match_time_sec=int(self.match_time_sec())
+            match_state=self.match_state,
+            match_time_sec=self.match_time_sec(),
+            server_time_ms=self.clock.now().timestamp() * 1000,
         ).model_dump()
 
     def generate_match_timing_message(self):
@@ -296,3 +352,6 @@ class ArenaNotifiersMixin:
                 'blue'
             ),
         }
+
+    def generate_websocket_stats_message(self):
+        return get_stats(self.get_notifiers())
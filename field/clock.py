@@ -0,0 +1,102 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+
+
+class Clock:
+    """Source of time for the arena, backed by the real wall clock and event loop timers."""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    def monotonic_ns(self) -> int:
+        return time.monotonic_ns()
+
+    def call_later(self, delay_sec: float, callback: Callable[..., None], *args):
+        return asyncio.get_running_loop().call_later(delay_sec, callback, *args)
+
+    async def sleep(self, delay_sec: float):
+        await asyncio.sleep(delay_sec)
+
+
+class VirtualTimerHandle:
+    deadline_ns: int
+    callback: Callable[..., None]
+    args: tuple
+    cancelled: bool
+
+    def __init__(self, deadline_ns: int, callback: Callable[..., None], args: tuple):
+        self.deadline_ns = deadline_ns
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class VirtualClock(Clock):
+    """Clock whose time only moves when `advance` is called.
+
+    Timers and sleeps are kept in a heap and fired in deadline order as virtual time passes, so an
+    arena driven by this clock can run through whole matches without waiting in real time.
+    """
+
+    start_time: datetime
+    elapsed_ns: int
+    timers: list[tuple[int, int, VirtualTimerHandle]]
+
+    def __init__(self, start_time: datetime = None):
+        self.start_time = start_time if start_time is not None else datetime.now()
+        self.elapsed_ns = 0
+        self.timers = []
+        self.timer_sequence = itertools.count()
+
+    def now(self) -> datetime:
+        return self.start_time + timedelta(microseconds=self.elapsed_ns // 1000)
+
+    def monotonic_ns(self) -> int:
+        return self.elapsed_ns
+
+    def call_later(self, delay_sec: float, callback: Callable[..., None], *args):
+        handle = VirtualTimerHandle(
+            self.elapsed_ns + max(int(delay_sec * 1_000_000_000), 0), callback, args
+        )
+        heapq.heappush(self.timers, (handle.deadline_ns, next(self.timer_sequence), handle))
+        return handle
+
+    async def sleep(self, delay_sec: float):
+        future = asyncio.get_running_loop().create_future()
+        self.call_later(delay_sec, self.resolve_sleep, future)
+        await future
+
+    @staticmethod
+    def resolve_sleep(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def get_next_deadline_ns(self) -> int | None:
+        while self.timers and self.timers[0][2].cancelled:
+            heapq.heappop(self.timers)
+        return self.timers[0][0] if self.timers else None
+
+    def advance(self, delay_sec: float):
+        """Moves time forward, firing every timer that falls due along the way."""
+        self.advance_to(self.elapsed_ns + int(delay_sec * 1_000_000_000))
+
+    def advance_to(self, target_ns: int):
+        while (deadline_ns := self.get_next_deadline_ns()) is not None and deadline_ns <= target_ns:
+            _, _, handle = heapq.heappop(self.timers)
+            self.elapsed_ns = max(self.elapsed_ns, deadline_ns)
+            handle.callback(*handle.args)
+        self.elapsed_ns = max(self.elapsed_ns, target_ns)
+
+    def advance_to_next_timer(self) -> bool:
+        deadline_ns = self.get_next_deadline_ns()
+        if deadline_ns is None:
+            return False
+        self.advance_to(deadline_ns)
+        return True
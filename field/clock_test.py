@@ -0,0 +1,46 @@
+import asyncio
+import unittest
+from datetime import datetime, timedelta
+
+from .clock import VirtualClock
+
+
+class TestVirtualClock(unittest.IsolatedAsyncioTestCase):
+    async def test_now(self):
+        start_time = datetime(2025, 3, 1, 9, 0, 0)
+        clock = VirtualClock(start_time)
+        self.assertEqual(clock.now(), start_time)
+        self.assertEqual(clock.monotonic_ns(), 0)
+
+        clock.advance(90.5)
+        self.assertEqual(clock.now(), start_time + timedelta(seconds=90.5))
+        self.assertEqual(clock.monotonic_ns(), 90_500_000_000)
+
+    async def test_timers_fire_in_order(self):
+        clock = VirtualClock()
+        fired = []
+        clock.call_later(3, fired.append, 'c')
+        clock.call_later(1, fired.append, 'a')
+        cancelled = clock.call_later(2, fired.append, 'cancelled')
+        clock.call_later(2, fired.append, 'b')
+        cancelled.cancel()
+
+        self.assertEqual(clock.get_next_deadline_ns(), 1_000_000_000)
+        clock.advance(1.5)
+        self.assertEqual(fired, ['a'])
+        self.assertTrue(clock.advance_to_next_timer())
+        self.assertEqual(fired, ['a', 'b'])
+        self.assertEqual(clock.monotonic_ns(), 2_000_000_000)
+        clock.advance(10)
+        self.assertEqual(fired, ['a', 'b', 'c'])
+        self.assertFalse(clock.advance_to_next_timer())
+
+    async def test_sleep(self):
+        clock = VirtualClock()
+        sleep_task = asyncio.create_task(clock.sleep(60))
+        await asyncio.sleep(0)
+        self.assertFalse(sleep_task.done())
+
+        clock.advance(60)
+        await asyncio.wait_for(sleep_task, 1)
+        self.assertEqual(clock.monotonic_ns(), 60_000_000_000)
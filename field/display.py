@@ -213,7 +213,7 @@ def display_from_url(path: str, query: dict[str, list[str]]):
     )
 
     for display_type, display_path in display_type_paths.items():
-        if path == f'/api{display_path}/websocket':
+        if path in [f'/api{display_path}/websocket', f'/api{display_path}/events']:
             display_configuration.type = display_type
             break
 
@@ -1,6 +1,8 @@
 import asyncio
 import logging
 import re
+import struct
+from collections.abc import Callable
 from datetime import datetime
 
 import game
@@ -19,6 +21,105 @@ DRIVER_STATION_UDP_LINK_TIMEOUT_SEC = 1
 MAX_TCP_PACKET_BYTES = 4096
 
 alliance_station_position_map = {'R1': 0, 'R2': 1, 'R3': 2, 'B1': 3, 'B2': 4, 'B3': 5}
+# UDP status packet: sequence number, protocol version, status bits, team number and the battery
+# voltage as whole volts and 256ths.
+UDP_STATUS_PACKET = struct.Struct('>HBBHBB')
+UDP_STATUS_RIO_LINKED = 0x08
+UDP_STATUS_RADIO_LINKED = 0x10
+UDP_STATUS_ROBOT_LINKED = 0x20
+# UDP control packet, in two parts. The station part is the packet number, protocol version,
+# control bits, an unused byte and the alliance station. The match part is the same for every
+# station: match type, match number, repeat number, the current time from microseconds up to the
+# year, and the seconds remaining in the match period.
+CONTROL_PACKET_SIZE = 22
+CONTROL_PACKET_STATION = struct.Struct('>HBBBB')
+CONTROL_PACKET_MATCH = struct.Struct('>BHBIBBBBBBH')
+CONTROL_AUTO = 0x02
+CONTROL_ENABLED = 0x04
+CONTROL_A_STOP = 0x40
+CONTROL_E_STOP = 0x80
+control_packet_match_types = {
+    models.MatchType.PRACTICE: 1,
+    models.MatchType.QUALIFICATION: 2,
+    models.MatchType.PLAYOFF: 3,
+}
+# TCP frames are a two byte length followed by that many bytes, the first of which is the type.
+TCP_FRAME_HEADER_SIZE = 2
+TCP_FRAME_STATUS = 22
+TCP_FRAME_TEAM_NUMBER = 24
+TCP_FRAME_STATION_INFO = 25
+TCP_FRAME_GAME_DATA = 28
+TCP_FRAME_KEEPALIVE = 29
+
+
+class TCPFrameParser:
+    """Splits a driver station's TCP stream into frames and dispatches them by type.
+
+    Received bytes are copied into one buffer that lives as long as the connection. Each complete
+    frame is passed to its handler as a memoryview into that buffer, starting at the type byte, so
+    handlers must not keep it past the call. A frame split over several reads waits in the buffer
+    for the rest, and any number of frames arriving in one read are all dispatched.
+    """
+
+    buffer: bytearray
+    view: memoryview
+    end: int
+    handlers: dict[int, Callable[[memoryview], None]]
+    handle_unknown: Callable[[memoryview], None] | None
+
+    def __init__(
+        self,
+        handlers: dict[int, Callable[[memoryview], None]],
+        handle_unknown: Callable[[memoryview], None] | None = None,
+        size: int = MAX_TCP_PACKET_BYTES,
+    ):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.end = 0
+        self.handlers = handlers
+        self.handle_unknown = handle_unknown
+
+    @property
+    def free_size(self) -> int:
+        return len(self.buffer) - self.end
+
+    def feed(self, data: bytes) -> int:
+        """Appends received bytes and dispatches every frame completed by them.
+
+        Returns the number of frames dispatched. Raises ValueError if the data does not fit in the
+        buffer or a frame is longer than the buffer could ever hold.
+        """
+        size = len(data)
+        if size > self.free_size:
+            raise ValueError(f'{size} bytes do not fit in the {self.free_size} free')
+        buffer = self.buffer
+        buffer[self.end : self.end + size] = data
+        self.end += size
+
+        start = 0
+        num_frames = 0
+        while self.end - start >= TCP_FRAME_HEADER_SIZE:
+            frame_size = (buffer[start] << 8) | buffer[start + 1]
+            if frame_size > len(buffer) - TCP_FRAME_HEADER_SIZE:
+                raise ValueError(f'TCP frame of {frame_size} bytes is too long')
+            frame_end = start + TCP_FRAME_HEADER_SIZE + frame_size
+            if frame_end > self.end:
+                break
+
+            if frame_size > 0:
+                frame = self.view[start + TCP_FRAME_HEADER_SIZE : frame_end]
+                handler = self.handlers.get(frame[0], self.handle_unknown)
+                if handler is not None:
+                    handler(frame)
+                num_frames += 1
+            start = frame_end
+
+        # Move the start of an incomplete frame, if any, to the front for the next read.
+        remaining = self.end - start
+        if remaining > 0 and start > 0:
+            buffer[:remaining] = buffer[start : self.end]
+        self.end = remaining
+        return num_frames
 
 
 class DriverStationConnection:
@@ -42,8 +143,21 @@ class DriverStationConnection:
     missed_packet_offset: int = 0
     tcp_conn: tuple[asyncio.StreamReader, asyncio.StreamWriter] = None
     udp_conn: asyncio.DatagramTransport = None
+    ip_address: str = ''
     log: None = None
     wrong_station: str = ''
+    control_packet: bytearray
+
+    def __init__(
+        self,
+        team_id: int = 0,
+        alliance_station: str = '',
+        tcp_conn: tuple[asyncio.StreamReader, asyncio.StreamWriter] = None,
+    ):
+        self.team_id = team_id
+        self.alliance_station = alliance_station
+        self.tcp_conn = tcp_conn
+        self.control_packet = bytearray(CONTROL_PACKET_SIZE)
 
     @classmethod
     async def new_driver_station_conncetion(
@@ -52,23 +166,24 @@ class DriverStationConnection:
         alliance_station: str = '',
         tcp_conn: tuple[asyncio.StreamReader, asyncio.StreamWriter] = None,
     ):
-        ds_conn = cls()
-        ds_conn.team_id = team_id
-        ds_conn.alliance_station = alliance_station
-        ds_conn.tcp_conn = tcp_conn
+        ds_conn = cls(team_id, alliance_station, tcp_conn)
         if ds_conn.tcp_conn is not None:
-            ip_address, _ = ds_conn.tcp_conn[1].get_extra_info('peername')
-            logger.info(f'Driver station for Team {ds_conn.team_id} connected from {ip_address}')
+            ds_conn.ip_address, _ = ds_conn.tcp_conn[1].get_extra_info('peername')
+            logger.info(
+                f'Driver station for Team {ds_conn.team_id} connected from {ds_conn.ip_address}'
+            )
             loop = asyncio.get_running_loop()
             ds_conn.udp_conn, _ = await loop.create_datagram_endpoint(
                 lambda: asyncio.DatagramProtocol(),
-                remote_addr=(ip_address, DRIVER_STATION_UDP_SEND_PORT),
+                remote_addr=(ds_conn.ip_address, DRIVER_STATION_UDP_SEND_PORT),
             )
         return ds_conn
 
     def update(self, arena):
-        self.send_control_packet(arena)
+        self.send_control_packet(self.encode_control_packet(arena))
+        self.update_link_status()
 
+    def update_link_status(self):
         if (
             datetime.now() - self.last_packet_time
         ).total_seconds() > DRIVER_STATION_UDP_LINK_TIMEOUT_SEC:
@@ -82,7 +197,7 @@ class DriverStationConnection:
             datetime.now() - self.last_robot_linked_time
         ).total_seconds()
 
-    async def close(self):
+    def close(self):
         if self.log is not None:
             self.log.close()
 
@@ -91,106 +206,80 @@ class DriverStationConnection:
 
         if self.tcp_conn is not None:
             self.tcp_conn[1].close()
-            await self.tcp_conn[1].wait_closed()
 
     def signal_match_start(self, match: models.Match, wifi_status: network.TeamWifiStatus):
         self.missed_packet_offset = self.missed_packet_count
         # self.log =
 
-    def encode_control_packet(self, arena):
-        packet = bytearray(22)
-
-        # packet number
-        packet[0] = (self.packet_count >> 8) & 0xFF
-        packet[1] = (self.packet_count) & 0xFF
-
-        # protocol version
-        packet[2] = 0
-
-        # robot status
-        packet[3] = 0
-        packet[3] |= 0x02 if self.auto else 0
-        packet[3] |= 0x04 if self.enabled else 0
-        packet[3] |= 0x40 if self.a_stop else 0
-        packet[3] |= 0x80 if self.e_stop else 0
-
-        # unused
-        packet[4] = 0
-
-        # alliance station
-        packet[5] = alliance_station_position_map[self.alliance_station]
-
-        # match type
-        packet[6] = 0
-        match = arena.current_match
-        if match.type == models.MatchType.PRACTICE:
-            packet[6] = 1
-        elif match.type == models.MatchType.QUALIFICATION:
-            packet[6] = 2
-        elif match.type == models.MatchType.PLAYOFF:
-            packet[6] = 3
-
-        # match number
-        packet[7] = match.type_order >> 8
-        packet[8] = match.type_order & 0xFF
-        packet[9] = 1
-
-        # current time
-        current_time = datetime.now()
-        packet[10] = (current_time.microsecond >> 24) & 0xFF
-        packet[11] = (current_time.microsecond >> 16) & 0xFF
-        packet[12] = (current_time.microsecond >> 8) & 0xFF
-        packet[13] = current_time.microsecond & 0xFF
-        packet[14] = current_time.second
-        packet[15] = current_time.minute
-        packet[16] = current_time.hour
-        packet[17] = current_time.day
-        packet[18] = current_time.month
-        packet[19] = current_time.year - 1900
-
-        # match remaining time
-        if arena.match_state in [
-            MatchState.PRE_MATCH,
-            MatchState.TIMEOUT_ACTIVE,
-            MatchState.POST_TIMEOUT,
-        ]:
-            match_seconds_remaining = game.timing.auto_duration_sec
-        elif arena.match_state in [MatchState.START_MATCH, MatchState.AUTO_PERIOD]:
-            match_seconds_remaining = game.timing.auto_duration_sec - int(arena.match_time_sec())
-        elif arena.match_state in [MatchState.PAUSE_PERIOD]:
-            match_seconds_remaining = game.timing.teleop_duration_sec
-        elif arena.match_state in [MatchState.TELEOP_PERIOD]:
-            match_seconds_remaining = (
-                game.timing.auto_duration_sec
-                + game.timing.teleop_duration_sec
-                + game.timing.pause_duration_sec
-                - int(arena.match_time_sec())
-            )
-        else:
-            match_seconds_remaining = 0
-        packet[20] = (match_seconds_remaining >> 8) & 0xFF
-        packet[21] = match_seconds_remaining & 0xFF
+    def encode_control_packet(self, arena, match_fields: bytearray | None = None) -> bytearray:
+        """Encodes the next control packet in place, in the buffer this connection reuses.
+
+        `match_fields` is a control packet holding the fields every station shares, from
+        encode_control_packet_match_fields(); without it they are encoded for this packet alone.
+        """
+        if match_fields is None:
+            match_fields = encode_control_packet_match_fields(arena)
+
+        return self.pack_control_packet(match_fields, self.get_control_bits())
+
+    def get_control_bits(self) -> int:
+        return (
+            (CONTROL_AUTO if self.auto else 0)
+            | (CONTROL_ENABLED if self.enabled else 0)
+            | (CONTROL_A_STOP if self.a_stop else 0)
+            | (CONTROL_E_STOP if self.e_stop else 0)
+        )
+
+    def pack_control_packet(self, match_fields: bytearray, control: int) -> bytearray:
+        """Packs the next control packet with these control bits into the reused buffer."""
+        packet = self.control_packet
+        packet[:] = match_fields
+        CONTROL_PACKET_STATION.pack_into(
+            packet,
+            0,
+            self.packet_count & 0xFFFF,
+            0,
+            control,
+            0,
+            alliance_station_position_map[self.alliance_station],
+        )
 
         self.packet_count += 1
         return packet
 
-    def send_control_packet(self, arena):
-        packet = self.encode_control_packet(arena)
+    def send_control_packet(self, packet: bytearray):
         if self.udp_conn is not None:
             self.udp_conn.sendto(packet)
 
-    def decode_status_packet(self, data: bytes):
+    def decode_status_packet(self, data: bytes | memoryview):
         # average ds-robot time in ms
         self.ds_robot_trip_time_ms = int(data[1]) / 2
         # number of missed packet from ds to robot
         self.missed_packet_count = int(data[2]) - self.missed_packet_offset
 
+    def handle_keepalive_frame(self, frame: memoryview):
+        pass
+
+    def handle_unknown_frame(self, frame: memoryview):
+        logger.info(f'Received unknown packet type {frame[0]} from Team {self.team_id}')
+
+    def create_tcp_frame_parser(self) -> TCPFrameParser:
+        return TCPFrameParser(
+            {
+                TCP_FRAME_STATUS: self.decode_status_packet,
+                TCP_FRAME_KEEPALIVE: self.handle_keepalive_frame,
+            },
+            self.handle_unknown_frame,
+        )
+
     async def handle_tcp_connection(self, arena):
+        reader = self.tcp_conn[0]
+        parser = self.create_tcp_frame_parser()
         try:
             while True:
                 try:
-                    packet = await asyncio.wait_for(
-                        self.tcp_conn[0].read(38), timeout=DRIVER_STATION_TCP_LINK_TIMEOUT_SEC
+                    data = await asyncio.wait_for(
+                        reader.read(parser.free_size), timeout=DRIVER_STATION_TCP_LINK_TIMEOUT_SEC
                     )
                 except asyncio.TimeoutError:  # noqa: UP041
                     logger.error(f'TCP connection timeout for Team {self.team_id}')
@@ -199,26 +288,19 @@ class DriverStationConnection:
                     logger.error(f'Error reading from connection for Team {self.team_id}: {err}')
                     break
 
-                packet_type = int(packet[2])
-                match packet_type:
-                    case 29:
-                        # Keepalive packet
-                        continue
-                    case 22:
-                        status_packet = bytearray(36)
-                        status_packet[:] = packet[2:38]
-                        self.decode_status_packet(status_packet)
-
-                        match_time_sec = arena.match_time_sec()
-                        if match_time_sec > 0 and self.log is not None:
-                            pass
-                    case _:
-                        logger.info(
-                            f'Received unknown packet type {packet_type} from Team {self.team_id}'
-                        )
+                if not data:
+                    logger.info(f'TCP connection closed by Team {self.team_id}')
+                    break
+                try:
+                    parser.feed(data)
+                except ValueError as err:
+                    logger.error(f'Invalid TCP data from Team {self.team_id}: {err}')
+                    break
         finally:
-            await self.close()
-            arena.alliance_stations[self.alliance_station].ds_conn = None
+            self.close()
+            alliance_station = arena.alliance_stations[self.alliance_station]
+            if alliance_station.ds_conn is self:
+                alliance_station.ds_conn = None
 
     def send_game_data_packet(self, game_data: str):
         byte_data = game_data.encode('ascii')
@@ -227,7 +309,7 @@ class DriverStationConnection:
 
         packet[0] = 0  # packet size
         packet[1] = size + 2
-        packet[2] = 28
+        packet[2] = TCP_FRAME_GAME_DATA
         packet[3] = size
         packet.extend(byte_data)
 
@@ -265,50 +347,123 @@ class DriverStationConnection:
         }
 
 
+def encode_control_packet_match_fields(arena, packet: bytearray | None = None) -> bytearray:
+    """Encodes the fields of a control packet that are the same for every station.
+
+    The station fields are left for DriverStationConnection.encode_control_packet() to fill in.
+    """
+    match = arena.current_match
+    return pack_control_packet_match_fields(
+        packet,
+        control_packet_match_types.get(match.type, 0),
+        match.type_order,
+        get_match_seconds_remaining(arena),
+    )
+
+
+def get_match_seconds_remaining(arena) -> int:
+    """Returns the seconds left in the current match period, as sent to the driver stations."""
+    if arena.match_state in [
+        MatchState.PRE_MATCH,
+        MatchState.TIMEOUT_ACTIVE,
+        MatchState.POST_TIMEOUT,
+    ]:
+        return game.timing.auto_duration_sec
+    elif arena.match_state in [MatchState.START_MATCH, MatchState.AUTO_PERIOD]:
+        return game.timing.auto_duration_sec - int(arena.match_time_sec())
+    elif arena.match_state in [MatchState.PAUSE_PERIOD]:
+        return game.timing.teleop_duration_sec
+    elif arena.match_state in [MatchState.TELEOP_PERIOD]:
+        return (
+            game.timing.auto_duration_sec
+            + game.timing.teleop_duration_sec
+            + game.timing.pause_duration_sec
+            - int(arena.match_time_sec())
+        )
+    else:
+        return 0
+
+
+def pack_control_packet_match_fields(
+    packet: bytearray | None, match_type: int, match_number: int, match_seconds_remaining: int
+) -> bytearray:
+    """Packs the shared fields of a control packet, stamped with the current time."""
+    if packet is None:
+        packet = bytearray(CONTROL_PACKET_SIZE)
+
+    current_time = datetime.now()
+    CONTROL_PACKET_MATCH.pack_into(
+        packet,
+        CONTROL_PACKET_STATION.size,
+        match_type,
+        match_number & 0xFFFF,
+        1,
+        current_time.microsecond,
+        current_time.second,
+        current_time.minute,
+        current_time.hour,
+        current_time.day,
+        current_time.month,
+        current_time.year - 1900,
+        match_seconds_remaining & 0xFFFF,
+    )
+    return packet
+
+
 class AsyncUDPServerProtocol(asyncio.DatagramProtocol):
-    def __init__(self, alliance_stations):
-        self.alliance_stations = alliance_stations
+    """Receives the status packets driver stations send over UDP.
+
+    Each packet is decoded right in the callback: it only updates a few fields of the team's
+    connection, found through the arena's team to station index, which costs less than
+    scheduling a task for it.
+    """
+
+    def __init__(self, arena):
+        self.arena = arena
 
     def connection_made(self, transport):
         self.transport = transport
 
     def datagram_received(self, data, addr):
-        asyncio.create_task(self.process_udp_packet(data, addr))
+        self.process_udp_packet(data)
 
-    async def process_udp_packet(self, data, addr):
-        if len(data) < 8:
+    def process_udp_packet(self, data: bytes):
+        if len(data) < UDP_STATUS_PACKET.size:
             return
 
-        team_id = (data[4] << 8) + data[5]
-        ds_conn = None
-        for _, alliance_station in self.alliance_stations.items():
-            if alliance_station.team is not None and alliance_station.team.id == team_id:
-                ds_conn = alliance_station.ds_conn
-                break
+        _, _, status, team_id, battery_volts, battery_fraction = UDP_STATUS_PACKET.unpack_from(data)
+        station = self.arena.team_stations.get(team_id)
+        if station is None:
+            return
+        ds_conn = self.arena.alliance_stations[station].ds_conn
+        if ds_conn is None:
+            return
 
-        if ds_conn is not None:
-            ds_conn.ds_linked = True
-            ds_conn.last_packet_time = datetime.now()
+        ds_conn.ds_linked = True
+        ds_conn.last_packet_time = datetime.now()
 
-            ds_conn.rio_linked = (data[3] & 0x08) != 0
-            ds_conn.radio_linked = (data[3] & 0x10) != 0
-            ds_conn.robot_linked = (data[3] & 0x20) != 0
+        ds_conn.rio_linked = (status & UDP_STATUS_RIO_LINKED) != 0
+        ds_conn.radio_linked = (status & UDP_STATUS_RADIO_LINKED) != 0
+        ds_conn.robot_linked = (status & UDP_STATUS_ROBOT_LINKED) != 0
 
-            if ds_conn.robot_linked:
-                ds_conn.last_robot_linked_time = datetime.now()
-                ds_conn.battery_voltage = float(data[6]) + float(data[7]) / 256
+        if ds_conn.robot_linked:
+            ds_conn.last_robot_linked_time = ds_conn.last_packet_time
+            ds_conn.battery_voltage = battery_volts + battery_fraction / 256
 
 
 class DriverStationConnectionMixin:
+    control_packet_match_fields: bytearray
+
     def __init__(self, *args, **kwargs):
+        self.control_packet_match_fields = bytearray(CONTROL_PACKET_SIZE)
         super().__init__(*args, **kwargs)
 
-    async def listen_for_ds_udp_packets(self):
+    async def listen_for_ds_udp_packets(self, host: str = '0.0.0.0'):
         try:
             loop = asyncio.get_running_loop()
             transport, _ = await loop.create_datagram_endpoint(
-                lambda: AsyncUDPServerProtocol(self.alliance_stations),
-                local_addr=('0.0.0.0', DRIVER_STATION_UDP_RECEIVE_PORT),
+                lambda: AsyncUDPServerProtocol(self),
+                local_addr=(host, DRIVER_STATION_UDP_RECEIVE_PORT),
             )
         except OSError as err:
             logger.error(f'Error starting driver station UDP listener: {err}')
@@ -323,11 +478,11 @@ class DriverStationConnectionMixin:
         finally:
             transport.close()
 
-    async def listen_for_driver_stations(self):
+    async def listen_for_driver_stations(self, host: str | None = None):
         try:
             listener = await asyncio.start_server(
                 self.handle_ds_tcp_connection,
-                network.server_ip_address,
+                host or network.server_ip_address,
                 DRIVER_STATION_TCP_LISTEN_PORT,
             )
         except OSError as err:
@@ -337,7 +492,7 @@ class DriverStationConnectionMixin:
         async with listener:
             await listener.serve_forever()
 
-    async def handle_rejected_connection(team_id, writer: asyncio.StreamWriter):
+    async def handle_rejected_connection(self, team_id: int, writer: asyncio.StreamWriter):
         logger.warning(
             f'Rejecting connection from Team {team_id}, who is not in the current match.'
         )
@@ -351,9 +506,9 @@ class DriverStationConnectionMixin:
     ):
         ip_address, port = writer.get_extra_info('peername')
         try:
-            packet = await reader.read(5)
+            packet = await reader.readexactly(5)
 
-            if not (packet[0] == 0 and packet[1] == 3 and packet[2] == 24):
+            if not (packet[0] == 0 and packet[1] == 3 and packet[2] == TCP_FRAME_TEAM_NUMBER):
                 logger.info(f'Invalid initial packet received: {packet}')
                 writer.close()
                 await writer.wait_closed()
@@ -383,14 +538,20 @@ class DriverStationConnectionMixin:
                     station_status = 1
 
             assignment_packet = bytearray(
-                [0, 3, 25, alliance_station_position_map[assigned_station], station_status]
+                [
+                    0,
+                    3,
+                    TCP_FRAME_STATION_INFO,
+                    alliance_station_position_map[assigned_station],
+                    station_status,
+                ]
             )
             logger.info(f'Accepting connection from Team {team_id} in station {assigned_station}')
             writer.write(assignment_packet)
             await writer.drain()
 
             ds_conn = await DriverStationConnection.new_driver_station_conncetion(
-                team_id=team_id, assigned_station=assigned_station, tcp_conn=(reader, writer)
+                team_id=team_id, alliance_station=assigned_station, tcp_conn=(reader, writer)
             )
             self.alliance_stations[assigned_station].ds_conn = ds_conn
 
@@ -1,11 +1,18 @@
 import socket
+import struct
 import unittest
 from datetime import datetime, timedelta
 from unittest.mock import MagicMock
 
 import models
 
-from .driver_station_connection import DriverStationConnection
+from .arena import AllianceStation, Arena
+from .driver_station_connection import (
+    AsyncUDPServerProtocol,
+    DriverStationConnection,
+    TCPFrameParser,
+    encode_control_packet_match_fields,
+)
 from .specs import MatchState
 from .test_helper import setup_test_arena_with_parameter
 
@@ -148,7 +155,7 @@ class TestDriverStationConnection(unittest.TestCase):
         tcp_conn = self.setup_fake_tcp_connection()
         ds_conn = DriverStationConnection(1234, 'R1', tcp_conn)
 
-        ds_conn.send_control_packet(arena)
+        ds_conn.send_control_packet(ds_conn.encode_control_packet(arena))
 
     def test_decode_status_packet(self):
         tcp_conn = self.setup_fake_tcp_connection()
@@ -285,3 +292,140 @@ class TestDriverStationConnection(unittest.TestCase):
     #     self.assertEqual(ds_conn.missed_packet_count, 103)
     #     self.assertEqual(ds_conn.ds_robot_trip_time_ms, 14)
     #     tcp_conn.close()
+
+
+class TestUDPStatusPacket(unittest.TestCase):
+    def setUp(self) -> None:
+        self.arena = Arena()
+        self.arena.alliance_stations = {
+            station: AllianceStation(i, None) for i, station in enumerate(['R1', 'R2', 'B1'])
+        }
+
+    def test_team_stations(self):
+        self.arena.set_alliance_station_team('R1', models.Team(id=254))
+        self.arena.set_alliance_station_team('B1', models.Team(id=1114))
+        self.assertEqual(self.arena.get_assigned_alliance_station(254), 'R1')
+        self.assertEqual(self.arena.get_assigned_alliance_station(1114), 'B1')
+
+        # A team moved to another station leaves its old one behind.
+        self.arena.set_alliance_station_team('R2', models.Team(id=254))
+        self.arena.set_alliance_station_team('R1', None)
+        self.assertEqual(self.arena.team_stations, {254: 'R2', 1114: 'B1'})
+        self.arena.set_alliance_station_team('B1', models.Team(id=148))
+        self.assertEqual(self.arena.get_assigned_alliance_station(1114), '')
+
+    def test_process_udp_packet(self):
+        ds_conn = DriverStationConnection()
+        self.arena.set_alliance_station_team('R2', models.Team(id=254))
+        self.arena.alliance_stations['R2'].ds_conn = ds_conn
+        protocol = AsyncUDPServerProtocol(self.arena)
+
+        protocol.datagram_received(struct.pack('>HBBHBB', 1, 0, 0x38, 254, 12, 128), None)
+        self.assertTrue(ds_conn.ds_linked)
+        self.assertTrue(ds_conn.rio_linked)
+        self.assertTrue(ds_conn.radio_linked)
+        self.assertTrue(ds_conn.robot_linked)
+        self.assertEqual(ds_conn.battery_voltage, 12.5)
+
+        protocol.datagram_received(struct.pack('>HBBHBB', 2, 0, 0x08, 254, 11, 0), None)
+        self.assertTrue(ds_conn.rio_linked)
+        self.assertFalse(ds_conn.robot_linked)
+        self.assertEqual(ds_conn.battery_voltage, 12.5)
+
+        # Packets that are short or from a team not in the match are ignored.
+        protocol.datagram_received(struct.pack('>HBBHB', 3, 0, 0x38, 254, 9), None)
+        protocol.datagram_received(struct.pack('>HBBHBB', 4, 0, 0x38, 1114, 9, 0), None)
+        self.assertFalse(ds_conn.robot_linked)
+
+
+class TestControlPacket(unittest.TestCase):
+    def test_shared_match_fields(self):
+        arena = Arena()
+        arena.current_match = models.Match(
+            id=0, type=models.MatchType.QUALIFICATION, type_order=258
+        )
+        arena.match_state = MatchState.PRE_MATCH
+        match_fields = encode_control_packet_match_fields(arena, arena.control_packet_match_fields)
+        self.assertIs(match_fields, arena.control_packet_match_fields)
+        self.assertEqual(match_fields[:6], bytes(6))
+        self.assertEqual(match_fields[6:10], bytes([2, 1, 2, 1]))
+
+        red_conn = DriverStationConnection(254, 'R1')
+        blue_conn = DriverStationConnection(1114, 'B3')
+        blue_conn.enabled = True
+        blue_conn.packet_count = 258
+        red_packet = red_conn.encode_control_packet(arena, match_fields)
+        blue_packet = blue_conn.encode_control_packet(arena, match_fields)
+        self.assertEqual(red_packet[:6], bytes([0, 0, 0, 0, 0, 0]))
+        self.assertEqual(blue_packet[:6], bytes([1, 2, 0, 0x04, 0, 5]))
+        self.assertEqual(red_packet[6:], match_fields[6:])
+        self.assertEqual(blue_packet[6:], match_fields[6:])
+
+        # Each connection encodes into the same buffer every time.
+        self.assertIs(red_conn.encode_control_packet(arena, match_fields), red_packet)
+        self.assertEqual(red_packet[:2], bytes([0, 1]))
+
+
+class TestTCPFrameParser(unittest.TestCase):
+    def setUp(self) -> None:
+        self.frames = []
+        self.unknown_frames = []
+        self.parser = TCPFrameParser(
+            {22: self.handle_frame, 29: self.handle_frame},
+            lambda frame: self.unknown_frames.append(bytes(frame)),
+            size=64,
+        )
+
+    def handle_frame(self, frame: memoryview):
+        self.assertIsInstance(frame, memoryview)
+        self.frames.append(bytes(frame))
+
+    def test_coalesced_frames(self):
+        status = bytes([22, 28, 103]) + bytes(33)
+        data = bytes([0, 1, 29]) + bytes([0, 36]) + status + bytes([0, 3, 37, 0, 0])
+        self.assertEqual(self.parser.feed(data), 3)
+        self.assertEqual(self.frames, [bytes([29]), status])
+        self.assertEqual(self.unknown_frames, [bytes([37, 0, 0])])
+        self.assertEqual(self.parser.end, 0)
+
+    def test_split_frames(self):
+        status = bytes([22, 28, 103]) + bytes(33)
+        data = bytes([0, 36]) + status + bytes([0, 1, 29])
+        # Every split point, including one inside the length prefix.
+        for split in range(1, len(data)):
+            self.frames.clear()
+            self.assertEqual(self.parser.feed(data[:split]), 1 if split >= 38 else 0)
+            self.parser.feed(data[split:])
+            self.assertEqual(self.frames, [status, bytes([29])], split)
+            self.assertEqual(self.parser.end, 0)
+
+        # One byte at a time.
+        self.frames.clear()
+        for i in range(len(data)):
+            self.parser.feed(data[i : i + 1])
+        self.assertEqual(self.frames, [status, bytes([29])])
+
+    def test_reused_buffer(self):
+        views = []
+        parser = TCPFrameParser({29: views.append})
+        for _ in range(3):
+            parser.feed(bytes([0, 1, 29, 0, 1, 29]))
+        self.assertEqual(len(views), 6)
+        self.assertTrue(all(view.obj is parser.buffer for view in views))
+
+    def test_status_frame(self):
+        ds_conn = DriverStationConnection(254, 'R1')
+        parser = ds_conn.create_tcp_frame_parser()
+        status = bytes([22, 28, 103]) + bytes(33)
+        parser.feed(bytes([0, 36]) + status[:20])
+        self.assertEqual(ds_conn.missed_packet_count, 0)
+        parser.feed(status[20:] + bytes([0, 1, 29]))
+        self.assertEqual(ds_conn.missed_packet_count, 103)
+        self.assertEqual(ds_conn.ds_robot_trip_time_ms, 14)
+
+    def test_invalid_data(self):
+        with self.assertRaises(ValueError):
+            self.parser.feed(bytes([0, 63]))
+        parser = TCPFrameParser({}, size=8)
+        with self.assertRaises(ValueError):
+            parser.feed(bytes(9))
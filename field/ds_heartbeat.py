@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import socket
+import threading
+import time
+from typing import NamedTuple
+
+from .arena_metrics import ArenaMetrics
+from .driver_station_connection import (
+    CONTROL_PACKET_SIZE,
+    DRIVER_STATION_UDP_SEND_PORT,
+    DriverStationConnection,
+    control_packet_match_types,
+    get_match_seconds_remaining,
+    pack_control_packet_match_fields,
+)
+from .specs import DS_PACKET_PERIOD_MS
+
+logger = logging.getLogger(__name__)
+
+
+class ControlSnapshot(NamedTuple):
+    """What every driver station is to be told, as one immutable value."""
+
+    match_type: int
+    match_number: int
+    match_seconds_remaining: int
+    # Each connected driver station and its control bits.
+    stations: tuple[tuple[DriverStationConnection, int], ...]
+
+
+def create_control_snapshot(arena, ds_conns: list[DriverStationConnection]) -> ControlSnapshot:
+    match = arena.current_match
+    return ControlSnapshot(
+        control_packet_match_types.get(match.type, 0),
+        match.type_order,
+        get_match_seconds_remaining(arena),
+        tuple((ds_conn, ds_conn.get_control_bits()) for ds_conn in ds_conns),
+    )
+
+
+class DriverStationHeartbeat:
+    """Sends driver station control packets on a timer of its own, apart from the arena loop.
+
+    The arena publishes a new ControlSnapshot on every update by swapping one reference, which the
+    sender reads once per round, so it always sees a consistent snapshot without a lock. Rounds go
+    out against absolute deadlines one period apart, and straight away when the control bits of any
+    station change. The sender runs as a task on the event loop or, with `threaded`, in a thread of
+    its own where slow awaits on the loop cannot hold it up; either way it has its own UDP socket
+    and owns the connections' control packet buffers and packet counts.
+    """
+
+    period_ns: int
+    threaded: bool
+    port: int
+    snapshot: ControlSnapshot | None
+    metrics: ArenaMetrics
+    match_fields: bytearray
+    running: bool
+    next_deadline_ns: int
+    last_send_time_ns: int
+    send_count: int
+    wake_count: int
+    wake_event: threading.Event | asyncio.Event
+
+    def __init__(
+        self,
+        metrics: ArenaMetrics,
+        threaded: bool = False,
+        period_ms: int = DS_PACKET_PERIOD_MS,
+        port: int = DRIVER_STATION_UDP_SEND_PORT,
+    ):
+        self.metrics = metrics
+        self.threaded = threaded
+        self.period_ns = period_ms * 1_000_000
+        self.port = port
+        self.snapshot = None
+        self.match_fields = bytearray(CONTROL_PACKET_SIZE)
+        self.running = False
+        self.next_deadline_ns = 0
+        self.last_send_time_ns = 0
+        self.send_count = 0
+        self.wake_count = 0
+        self.wake_event = threading.Event() if threaded else asyncio.Event()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    def publish(self, snapshot: ControlSnapshot):
+        previous = self.snapshot
+        self.snapshot = snapshot
+        if previous is None or previous.stations != snapshot.stations:
+            self.wake_event.set()
+
+    def send_packets(self):
+        snapshot = self.snapshot
+        if snapshot is None:
+            return
+
+        now_ns = time.monotonic_ns()
+        if self.last_send_time_ns:
+            self.metrics.record_ds_packet_interval(now_ns - self.last_send_time_ns)
+        self.last_send_time_ns = now_ns
+
+        match_fields = pack_control_packet_match_fields(
+            self.match_fields,
+            snapshot.match_type,
+            snapshot.match_number,
+            snapshot.match_seconds_remaining,
+        )
+        for ds_conn, control in snapshot.stations:
+            if not ds_conn.ip_address:
+                continue
+            packet = ds_conn.pack_control_packet(match_fields, control)
+            try:
+                self.sock.sendto(packet, (ds_conn.ip_address, self.port))
+            except OSError as err:
+                logger.warning(f'Error sending control packet to Team {ds_conn.team_id}: {err}')
+        self.send_count += 1
+
+    def tick(self, woken: bool):
+        self.wake_event.clear()
+        self.send_packets()
+
+        now_ns = time.monotonic_ns()
+        if woken:
+            self.wake_count += 1
+            self.next_deadline_ns = now_ns + self.period_ns
+        else:
+            # Deadlines missed entirely are skipped instead of being sent back to back.
+            self.next_deadline_ns += self.period_ns
+            if self.next_deadline_ns <= now_ns:
+                self.next_deadline_ns = now_ns + self.period_ns
+
+    def get_timeout_sec(self) -> float:
+        return max(self.next_deadline_ns - time.monotonic_ns(), 0) / 1_000_000_000
+
+    def run_thread(self):
+        try:
+            while self.running:
+                woken = self.wake_event.wait(self.get_timeout_sec())
+                if self.running:
+                    self.tick(woken)
+        finally:
+            self.sock.close()
+
+    async def run(self):
+        self.running = True
+        self.next_deadline_ns = time.monotonic_ns()
+        try:
+            if self.threaded:
+                thread = threading.Thread(target=self.run_thread, name='ds-heartbeat', daemon=True)
+                thread.start()
+                await asyncio.to_thread(thread.join)
+                return
+
+            while self.running:
+                try:
+                    await asyncio.wait_for(self.wake_event.wait(), self.get_timeout_sec())
+                    woken = True
+                except TimeoutError:
+                    woken = False
+                if self.running:
+                    self.tick(woken)
+        finally:
+            self.running = False
+            self.wake_event.set()
+            # The thread closes the socket itself once it has sent its last round.
+            if not self.threaded:
+                self.sock.close()
+
+    def stop(self):
+        self.running = False
+        self.wake_event.set()
@@ -0,0 +1,147 @@
+import asyncio
+import socket
+import unittest
+
+import models
+
+from .arena import AllianceStation, Arena
+from .arena_metrics import ArenaMetrics
+from .driver_station_connection import CONTROL_ENABLED, CONTROL_PACKET_SIZE, DriverStationConnection
+from .ds_heartbeat import ControlSnapshot, DriverStationHeartbeat
+from .specs import MatchState
+
+
+def create_receiver() -> socket.socket:
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(1)
+    return receiver
+
+
+def create_ds_conn(team_id: int, station: str) -> DriverStationConnection:
+    ds_conn = DriverStationConnection(team_id, station)
+    ds_conn.ip_address = '127.0.0.1'
+    return ds_conn
+
+
+class TestDriverStationHeartbeat(unittest.TestCase):
+    def test_publish(self):
+        heartbeat = DriverStationHeartbeat(ArenaMetrics(), threaded=True)
+        ds_conn = create_ds_conn(254, 'R1')
+        heartbeat.publish(ControlSnapshot(2, 12, 15, ((ds_conn, 0),)))
+        self.assertTrue(heartbeat.wake_event.is_set())
+
+        # Only a change in what a driver station is told sends packets early.
+        heartbeat.wake_event.clear()
+        heartbeat.publish(ControlSnapshot(2, 12, 14, ((ds_conn, 0),)))
+        self.assertFalse(heartbeat.wake_event.is_set())
+        self.assertEqual(heartbeat.snapshot.match_seconds_remaining, 14)
+        heartbeat.publish(ControlSnapshot(2, 12, 14, ((ds_conn, CONTROL_ENABLED),)))
+        self.assertTrue(heartbeat.wake_event.is_set())
+
+    def test_send_packets(self):
+        receiver = create_receiver()
+        metrics = ArenaMetrics()
+        heartbeat = DriverStationHeartbeat(metrics, port=receiver.getsockname()[1])
+        red_conn = create_ds_conn(254, 'R1')
+        blue_conn = create_ds_conn(1114, 'B2')
+        unconnected_conn = DriverStationConnection(148, 'R3')
+        heartbeat.publish(
+            ControlSnapshot(
+                2, 258, 15, ((red_conn, 0), (blue_conn, CONTROL_ENABLED), (unconnected_conn, 0))
+            )
+        )
+
+        heartbeat.send_packets()
+        red_packet = receiver.recv(100)
+        blue_packet = receiver.recv(100)
+        self.assertEqual(len(red_packet), CONTROL_PACKET_SIZE)
+        self.assertEqual(red_packet[:6], bytes([0, 0, 0, 0, 0, 0]))
+        self.assertEqual(blue_packet[:6], bytes([0, 0, 0, CONTROL_ENABLED, 0, 4]))
+        self.assertEqual(blue_packet[6:10], bytes([2, 1, 2, 1]))
+        self.assertEqual(blue_packet[20:], bytes([0, 15]))
+        self.assertEqual(unconnected_conn.packet_count, 0)
+
+        heartbeat.send_packets()
+        self.assertEqual(receiver.recv(100)[:2], bytes([0, 1]))
+        self.assertEqual(heartbeat.send_count, 2)
+        self.assertEqual(metrics.ds_packet_interval_histogram.count, 1)
+        receiver.close()
+
+
+class TestDriverStationHeartbeatTimer(unittest.IsolatedAsyncioTestCase):
+    async def check_timer(self, threaded: bool):
+        receiver = create_receiver()
+        metrics = ArenaMetrics()
+        heartbeat = DriverStationHeartbeat(
+            metrics, threaded=threaded, period_ms=20, port=receiver.getsockname()[1]
+        )
+        ds_conn = create_ds_conn(254, 'R1')
+        heartbeat.publish(ControlSnapshot(2, 1, 15, ((ds_conn, 0),)))
+        task = asyncio.create_task(heartbeat.run())
+        await asyncio.sleep(0.15)
+        heartbeat.stop()
+        await asyncio.wait_for(task, 1)
+
+        self.assertGreaterEqual(heartbeat.send_count, 5)
+        self.assertEqual(ds_conn.packet_count, heartbeat.send_count)
+        histogram = metrics.ds_packet_interval_histogram
+        self.assertEqual(histogram.count, heartbeat.send_count - 1)
+        self.assertGreaterEqual(histogram.get_percentile(50), 15_000)
+        self.assertLess(histogram.get_percentile(50), 40_000)
+        self.assertEqual(heartbeat.sock.fileno(), -1)
+        receiver.close()
+
+    async def test_task(self):
+        await self.check_timer(threaded=False)
+
+    async def test_thread(self):
+        await self.check_timer(threaded=True)
+
+    async def test_wake(self):
+        receiver = create_receiver()
+        heartbeat = DriverStationHeartbeat(
+            ArenaMetrics(), period_ms=10_000, port=receiver.getsockname()[1]
+        )
+        ds_conn = create_ds_conn(254, 'R1')
+        heartbeat.publish(ControlSnapshot(2, 1, 15, ((ds_conn, 0),)))
+        task = asyncio.create_task(heartbeat.run())
+        await asyncio.sleep(0.05)
+        self.assertEqual(heartbeat.send_count, 1)
+
+        heartbeat.publish(ControlSnapshot(2, 1, 15, ((ds_conn, CONTROL_ENABLED),)))
+        await asyncio.sleep(0.05)
+        # The change goes out at once rather than after the ten second period.
+        self.assertEqual(heartbeat.send_count, 2)
+        self.assertGreaterEqual(heartbeat.wake_count, 1)
+        self.assertEqual(receiver.recv(100)[3], 0)
+        self.assertEqual(receiver.recv(100)[3], CONTROL_ENABLED)
+        heartbeat.stop()
+        await asyncio.wait_for(task, 1)
+        receiver.close()
+
+
+class TestArenaHeartbeat(unittest.TestCase):
+    def test_send_ds_packet(self):
+        arena = Arena()
+        arena.current_match = models.Match(id=0, type=models.MatchType.QUALIFICATION, type_order=3)
+        arena.match_state = MatchState.PRE_MATCH
+        arena.alliance_stations = {
+            station: AllianceStation(i, None) for i, station in enumerate(['R1', 'R2', 'B1'])
+        }
+        arena.alliance_stations['R1'].ds_conn = create_ds_conn(254, 'R1')
+        arena.alliance_stations['B1'].ds_conn = create_ds_conn(1114, 'B1')
+        arena.alliance_stations['B1'].e_stop = True
+        arena.ds_heartbeat = DriverStationHeartbeat(arena.metrics)
+
+        arena.send_ds_packet(True, True)
+        snapshot = arena.ds_heartbeat.snapshot
+        self.assertEqual(snapshot.match_type, 2)
+        self.assertEqual(snapshot.match_number, 3)
+        self.assertEqual(
+            [(ds_conn.team_id, control) for ds_conn, control in snapshot.stations],
+            [(254, 0x06), (1114, 0x82)],
+        )
+        # The packets themselves are left to the heartbeat.
+        self.assertEqual(arena.alliance_stations['R1'].ds_conn.packet_count, 0)
+        self.assertEqual(arena.metrics.ds_packet_interval_histogram.count, 0)
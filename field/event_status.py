@@ -105,7 +105,7 @@ class EventStatusMixin:
                 MatchState.POST_TIMEOUT,
             ]:
                 current_minutes_late = (
-                    datetime.now() - current_match.scheduled_time
+                    self.clock.now() - current_match.scheduled_time
                 ).total_seconds() / 60
                 if (
                     previous_match_index >= 0
@@ -129,7 +129,7 @@ class EventStatusMixin:
                 if next_match_index < len(matches):
                     next_match = matches[next_match_index]
                     next_minutes_late = (
-                        datetime.now() - next_match.scheduled_time
+                        self.clock.now() - next_match.scheduled_time
                     ).total_seconds() / 60
                     minutes_late = max(current_minutes_late, next_minutes_late)
                 else:
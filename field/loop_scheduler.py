@@ -0,0 +1,83 @@
+import asyncio
+
+from .clock import Clock
+
+
+class LoopScheduler:
+    """Runs an event-driven loop against absolute monotonic deadlines.
+
+    Each iteration arms a timer for the loop's next deadline with `wait_until`, and is woken early
+    with `wake` when something outside the loop changes its state. Wakeups that come from the
+    timer record how late they ran.
+    """
+
+    next_deadline_ns: int
+    tick_count: int
+    wake_count: int
+    last_lateness_us: int
+    max_lateness_us: int
+    wake_pending: bool
+    waiter: asyncio.Future | None
+    clock: Clock
+
+    def __init__(self, clock: Clock = None):
+        self.clock = clock if clock is not None else Clock()
+        self.waiter = None
+        self.reset()
+
+    def reset(self):
+        self.next_deadline_ns = self.clock.monotonic_ns()
+        self.tick_count = 0
+        self.wake_count = 0
+        self.last_lateness_us = 0
+        self.max_lateness_us = 0
+        self.wake_pending = False
+
+    async def wait_until(self, deadline_ns: int):
+        self.next_deadline_ns = deadline_ns
+        loop = asyncio.get_running_loop()
+        woken = self.wake_pending
+        if woken or deadline_ns <= self.clock.monotonic_ns():
+            # Still yield to the event loop so an overdue loop cannot starve everything else.
+            await asyncio.sleep(0)
+        while not woken and (delay_ns := deadline_ns - self.clock.monotonic_ns()) > 0:
+            waiter = loop.create_future()
+            timer = self.clock.call_later(delay_ns / 1_000_000_000, self.expire_waiter, waiter)
+            self.waiter = waiter
+            try:
+                woken = await waiter
+            finally:
+                timer.cancel()
+                self.waiter = None
+
+        self.wake_pending = False
+        self.tick_count += 1
+        if woken:
+            self.wake_count += 1
+        else:
+            self.record_lateness(self.clock.monotonic_ns() - deadline_ns)
+
+    def wake(self):
+        """Ends the current wait early, or the next one if the loop is not waiting right now."""
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(True)
+        else:
+            self.wake_pending = True
+
+    @staticmethod
+    def expire_waiter(waiter: asyncio.Future):
+        if not waiter.done():
+            waiter.set_result(False)
+
+    def record_lateness(self, lateness_ns: int):
+        self.last_lateness_us = max(lateness_ns, 0) // 1000
+        self.max_lateness_us = max(self.max_lateness_us, self.last_lateness_us)
+
+    def to_dict(self):
+        return {
+            'tick_count': self.tick_count,
+            'wake_count': self.wake_count,
+            'timer_count': self.tick_count - self.wake_count,
+            'last_lateness_us': self.last_lateness_us,
+            'max_lateness_us': self.max_lateness_us,
+        }
@@ -0,0 +1,47 @@
+import asyncio
+import unittest
+
+from .clock import VirtualClock
+from .loop_scheduler import LoopScheduler
+
+
+class TestLoopScheduler(unittest.IsolatedAsyncioTestCase):
+    async def test_wait_until_deadline(self):
+        clock = VirtualClock()
+        scheduler = LoopScheduler(clock)
+        wait_task = asyncio.create_task(scheduler.wait_until(5_000_000))
+        await asyncio.sleep(0)
+        clock.advance(0.004)
+        await asyncio.sleep(0)
+        self.assertFalse(wait_task.done())
+
+        clock.advance(0.001)
+        await asyncio.wait_for(wait_task, 1)
+        self.assertEqual(scheduler.tick_count, 1)
+        self.assertEqual(scheduler.wake_count, 0)
+        self.assertEqual(scheduler.last_lateness_us, 0)
+
+        clock.advance(0.003)
+        await scheduler.wait_until(1_000_000)
+        self.assertEqual(scheduler.last_lateness_us, 7000)
+        self.assertEqual(scheduler.max_lateness_us, 7000)
+        self.assertEqual(scheduler.to_dict()['timer_count'], 2)
+
+    async def test_wake(self):
+        scheduler = LoopScheduler()
+        wait_task = asyncio.create_task(
+            scheduler.wait_until(scheduler.clock.monotonic_ns() + 10_000_000_000)
+        )
+        await asyncio.sleep(0.01)
+        self.assertFalse(wait_task.done())
+        scheduler.wake()
+        await asyncio.wait_for(wait_task, 1)
+        self.assertEqual(scheduler.wake_count, 1)
+
+        # A wake while the loop is busy ends the next wait immediately.
+        scheduler.wake()
+        await asyncio.wait_for(
+            scheduler.wait_until(scheduler.clock.monotonic_ns() + 10_000_000_000), 1
+        )
+        self.assertEqual(scheduler.wake_count, 2)
+        self.assertFalse(scheduler.wake_pending)
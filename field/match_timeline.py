@@ -0,0 +1,107 @@
+from bisect import bisect_right
+from enum import IntEnum
+
+import game
+from game.match_timing import MatchTiming
+
+from .specs import POST_TIMEOUT_SEC
+
+
+class TimelineEventType(IntEnum):
+    PERIOD_TRANSITION = 0
+    SOUND = 1
+
+
+class TimelineEvent:
+    match_time_sec: float
+    type: TimelineEventType
+    name: str
+    sound: game.MatchSound | None
+
+    def __init__(
+        self,
+        match_time_sec: float,
+        type: TimelineEventType,
+        name: str,
+        sound: game.MatchSound | None = None,
+    ):
+        self.match_time_sec = match_time_sec
+        self.type = type
+        self.name = name
+        self.sound = sound
+
+
+class MatchTimeline:
+    """Every timed event of a match or timeout, sorted by match time.
+
+    The timeline is compiled once when the match or timeout starts, so the arena loop can sleep
+    until exactly the next event instead of re-checking the state machine on a fixed period.
+    """
+
+    events: list[TimelineEvent]
+    event_times: list[float]
+
+    def __init__(self, events: list[TimelineEvent] = None):
+        self.events = sorted(events or [], key=lambda event: event.match_time_sec)
+        self.event_times = [event.match_time_sec for event in self.events]
+
+    @classmethod
+    def for_match(cls, timing: MatchTiming, sounds: list[game.MatchSound]):
+        events = [
+            TimelineEvent(
+                timing.get_duration_to_auto_end(), TimelineEventType.PERIOD_TRANSITION, 'auto_end'
+            ),
+            TimelineEvent(
+                timing.get_duration_to_teleop_start(),
+                TimelineEventType.PERIOD_TRANSITION,
+                'teleop_start',
+            ),
+            TimelineEvent(
+                timing.get_duration_to_teleop_end(),
+                TimelineEventType.PERIOD_TRANSITION,
+                'teleop_end',
+            ),
+        ]
+        if timing.warmup_duration_sec > 0:
+            events.append(
+                TimelineEvent(
+                    timing.warmup_duration_sec, TimelineEventType.PERIOD_TRANSITION, 'warmup_end'
+                )
+            )
+
+        for sound in sounds:
+            if sound.match_time_sec >= 0:
+                events.append(
+                    TimelineEvent(sound.match_time_sec, TimelineEventType.SOUND, sound.name, sound)
+                )
+
+        return cls(events)
+
+    @classmethod
+    def for_timeout(cls, timeout_duration_sec: float):
+        return cls(
+            [
+                TimelineEvent(
+                    timeout_duration_sec, TimelineEventType.PERIOD_TRANSITION, 'timeout_end'
+                ),
+                TimelineEvent(
+                    timeout_duration_sec + POST_TIMEOUT_SEC,
+                    TimelineEventType.PERIOD_TRANSITION,
+                    'post_timeout_end',
+                ),
+            ]
+        )
+
+    def next_event_time_sec(self, match_time_sec: float) -> float | None:
+        index = bisect_right(self.event_times, match_time_sec)
+        if index == len(self.event_times):
+            return None
+        return self.event_times[index]
+
+    def due_sounds(self, match_time_sec: float) -> list[game.MatchSound]:
+        """Sounds whose time has been reached within the last second of match time."""
+        start = bisect_right(self.event_times, match_time_sec - 1)
+        end = bisect_right(self.event_times, match_time_sec)
+        return [
+            event.sound for event in self.events[start:end] if event.type == TimelineEventType.SOUND
+        ]
@@ -0,0 +1,61 @@
+import unittest
+
+import game
+from game.match_timing import MatchTiming
+
+from .match_timeline import MatchTimeline, TimelineEventType
+from .specs import POST_TIMEOUT_SEC
+
+
+class TestMatchTimeline(unittest.TestCase):
+    def test_for_match(self):
+        timing = MatchTiming(
+            warmup_duration_sec=3,
+            auto_duration_sec=15,
+            pause_duration_sec=2,
+            teleop_duration_sec=135,
+        )
+        sounds = [
+            game.MatchSound(name='start', file_extension='wav', match_time_sec=0),
+            game.MatchSound(name='end', file_extension='wav', match_time_sec=15),
+            game.MatchSound(name='abort', file_extension='wav', match_time_sec=-1),
+        ]
+        timeline = MatchTimeline.for_match(timing, sounds)
+
+        self.assertEqual(timeline.event_times, sorted(timeline.event_times))
+        self.assertEqual(
+            [event.name for event in timeline.events],
+            ['start', 'warmup_end', 'end', 'auto_end', 'teleop_start', 'teleop_end'],
+        )
+        self.assertNotIn('abort', [event.name for event in timeline.events])
+
+        self.assertEqual(timeline.next_event_time_sec(0), 3)
+        self.assertEqual(timeline.next_event_time_sec(3), 15)
+        self.assertEqual(timeline.next_event_time_sec(17.5), 18)
+        self.assertEqual(timeline.next_event_time_sec(20), 155)
+        self.assertIsNone(timeline.next_event_time_sec(155))
+
+    def test_no_warmup_transition(self):
+        timeline = MatchTimeline.for_match(MatchTiming(warmup_duration_sec=0), [])
+        self.assertTrue(
+            all(event.type == TimelineEventType.PERIOD_TRANSITION for event in timeline.events)
+        )
+        self.assertNotIn('warmup_end', [event.name for event in timeline.events])
+
+    def test_due_sounds(self):
+        sounds = [
+            game.MatchSound(name='start', file_extension='wav', match_time_sec=0),
+            game.MatchSound(name='resume', file_extension='wav', match_time_sec=18),
+        ]
+        timeline = MatchTimeline.for_match(MatchTiming(), sounds)
+
+        self.assertEqual([sound.name for sound in timeline.due_sounds(0)], ['start'])
+        self.assertEqual([sound.name for sound in timeline.due_sounds(0.99)], ['start'])
+        self.assertEqual(timeline.due_sounds(1), [])
+        self.assertEqual(timeline.due_sounds(17.9), [])
+        self.assertEqual([sound.name for sound in timeline.due_sounds(18.2)], ['resume'])
+
+    def test_for_timeout(self):
+        timeline = MatchTimeline.for_timeout(60)
+        self.assertEqual(timeline.event_times, [60, 60 + POST_TIMEOUT_SEC])
+        self.assertEqual(timeline.due_sounds(60), [])
@@ -1,4 +1,7 @@
+import argparse
 import asyncio
+import multiprocessing
+import socket
 
 import fastapi
 import uvicorn
@@ -6,9 +9,16 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
 import web
+import ws
 from field.arena import Arena
+from field.ds_heartbeat import DriverStationHeartbeat
 from models.base import db
+from web.api import multiplex
 from web.arena import APIArena
+from web.mirror import create_mirror_app
+
+RELAY_SOCKET_PATH = 'pengiloo-relay.sock'
+RELAY_PORT = 8001
 
 app = fastapi.FastAPI()
 app.mount('/static', StaticFiles(directory='static'), name='static')
@@ -21,28 +31,112 @@ app.add_middleware(
 )
 
 
-async def main():
+async def main(args: argparse.Namespace):
     db.bind(provider='sqlite', filename='pengiloo.db', create_db=True)
     # db.bind(provider='sqlite', filename=':memory:', create_db=True)
     db.generate_mapping(create_tables=True)
 
     arena = await Arena.new_arena()
+    if args.ds_heartbeat != 'loop':
+        arena.ds_heartbeat = DriverStationHeartbeat(
+            arena.metrics, threaded=args.ds_heartbeat == 'thread'
+        )
     APIArena.set_instance(arena)
     arena_task = asyncio.create_task(arena.run())
 
     app.include_router(web.router)
 
-    config = uvicorn.Config(app, '0.0.0.0', 8000, workers=4)
+    workers = []
+    if args.relay_workers > 0:
+        relay_server = ws.RelayServer(
+            arena.get_notifiers(), multiplex.handle_command, multiplex.handle_close
+        )
+        await relay_server.start(args.relay_socket)
+        # Spawned rather than forked, so workers do not inherit the running event loop.
+        context = multiprocessing.get_context('spawn')
+        for _ in range(args.relay_workers):
+            worker = context.Process(
+                target=run_relay_worker, args=(args.relay_socket, args.relay_port), daemon=True
+            )
+            worker.start()
+            workers.append(worker)
+
+    # Large frames are deflated once per broadcast by the websocket handlers for clients that
+    # negotiate it; the others keep the server's permessage-deflate.
+    config = uvicorn.Config(app, '0.0.0.0', args.port, ws=ws.WebSocketProtocol)
     server = uvicorn.Server(config)
 
     await server.serve()
 
     arena.running = False
     await arena_task
+    for worker in workers:
+        worker.terminate()
+
+
+async def run_mirror(args: argparse.Namespace):
+    """Serves read-only displays from one subscription to the primary server's /api/ws."""
+    config = uvicorn.Config(
+        create_mirror_app(args.mirror), '0.0.0.0', args.port, ws=ws.WebSocketProtocol
+    )
+    await uvicorn.Server(config).serve()
+
+
+def run_relay_worker(relay_socket: str, port: int):
+    """Serves /api/ws from the arena's relay, so display websockets are fanned out in this process.
+
+    Every worker binds the same port with SO_REUSEPORT and the kernel spreads connections
+    between them.
+    """
+    relay_client = ws.RelayClient(relay_socket)
+    worker_app = fastapi.FastAPI()
+    worker_app.mount('/static', StaticFiles(directory='static'), name='static')
+
+    @worker_app.websocket('/api/ws')
+    async def websocket_endpoint(websocket: fastapi.WebSocket):
+        await ws.handle_relayed_websocket(websocket, relay_client)
+
+    async def serve():
+        relay_task = asyncio.create_task(relay_client.run())
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(('0.0.0.0', port))
+        config = uvicorn.Config(worker_app, ws=ws.WebSocketProtocol)
+        await uvicorn.Server(config).serve(sockets=[sock])
+        relay_task.cancel()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument(
+        '--mirror',
+        metavar='PRIMARY_URL',
+        help='Run as a read-only mirror of the server at this URL, e.g. http://10.0.100.5:8000',
+    )
+    parser.add_argument(
+        '--relay-workers',
+        type=int,
+        default=0,
+        help='Number of processes serving /api/ws on the relay port, fed by the arena',
+    )
+    parser.add_argument('--relay-port', type=int, default=RELAY_PORT)
+    parser.add_argument('--relay-socket', default=RELAY_SOCKET_PATH)
+    parser.add_argument(
+        '--ds-heartbeat',
+        choices=['loop', 'task', 'thread'],
+        default='loop',
+        help='Where driver station control packets are sent from: the arena loop, a task of their '
+        'own, or a thread of their own',
+    )
+    args = parser.parse_args()
+
     try:
-        asyncio.run(main())
+        asyncio.run(run_mirror(args) if args.mirror else main(args))
     except KeyboardInterrupt:
         pass
@@ -141,7 +141,7 @@ class PlayoffTournament:
 
         self.final_matchup.update(playoff_match_results)
 
-        matches_by_type_order = dict[int, models.MatchOut]()
+        matches_by_type_order = dict[int, models.Match]()
         for match in matches:
             matches_by_type_order[match.type_order] = match
 
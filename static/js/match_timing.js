@@ -23,6 +23,9 @@ const matchStates = {
 }
 
 let matchTiming;
+// States in which the match time keeps running between match_time messages.
+const countingMatchStates = ['WARMUP_PERIOD', 'AUTO_PERIOD', 'PAUSE_PERIOD', 'TELEOP_PERIOD', 'TIMEOUT_ACTIVE'];
+let matchTimeTimer = null;
 
 const handleMatchTiming = (data) => {
     matchTiming = data
@@ -57,7 +60,19 @@ const translateMatchTime = (data, callback) => {
             break;
     }
 
-    callback(matchStates[data.match_state], matchStateText, getCountdown(data.match_state, data.match_time_sec));
+    // match_time only arrives on state transitions, so the countdown is kept locally from the
+    // server timestamp of the message and re-rendered every time it reaches a new second.
+    clearTimeout(matchTimeTimer);
+    var render = function () {
+        var matchTimeSec = data.match_time_sec;
+        if (countingMatchStates.indexOf(matchStates[data.match_state]) >= 0) {
+            matchTimeSec += Math.max(serverClock.now() - data.server_time_ms, 0) / 1000;
+            matchTimeTimer = setTimeout(render, (1 - matchTimeSec % 1) * 1000);
+        }
+        var countdown = getCountdown(data.match_state, Math.floor(matchTimeSec));
+        callback(matchStates[data.match_state], matchStateText, Math.max(countdown, 0));
+    };
+    render();
 }
 
 
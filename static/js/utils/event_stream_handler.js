@@ -0,0 +1,73 @@
+// Receives a read-only display's messages as Server-Sent Events from its `/events` endpoint, with
+// the same event handlers as wsHandler. EventSource reconnects on its own and sends the id of the
+// last event, from which the server resumes every topic where it left off.
+//
+// An event stream cannot carry time_sync requests, so pages showing the match time keep
+// serverClock, from websocket_handler.js, with requests to /api/time instead.
+var sseHandler = function (path, events) {
+    var handler = this;
+    var url = `${path}?${new URLSearchParams(window.location.search).toString()}`;
+    var displayId = new URLSearchParams(window.location.search).get('displayId');
+
+    events.reload = function (e) {
+        if (e.data === null || e.data === displayId) {
+            location.reload();
+        }
+    };
+
+    if (!events.hasOwnProperty('displayConfiguration')) {
+        events.displayConfiguration = function (e) {
+            if (e.data !== window.location.pathname + window.location.search) {
+                window.location = e.data;
+            }
+        };
+    }
+
+    this.connect = function () {
+        this.eventSource = new EventSource(url);
+
+        this.eventSource.onopen = function () {
+            console.log('Event stream connected to Server at ', url);
+            if (events.hasOwnProperty('match_time')) {
+                serverClock.start(handler);
+            }
+        };
+
+        this.eventSource.onerror = function () {
+            if (handler.eventSource.readyState === EventSource.CLOSED) {
+                serverClock.stop(handler);
+                console.error('Event stream was refused by the Server');
+            }
+        };
+
+        this.eventSource.onmessage = function (e) {
+            var event = JSON.parse(e.data);
+            if (events.hasOwnProperty(event.type)) {
+                events[event.type](event);
+            }
+        };
+
+        window.onbeforeunload = function (e) {
+            handler.eventSource.close();
+        };
+    };
+
+    // Only time_sync is ever sent, by serverClock; the reply comes back from /api/time.
+    this.send = function (type, data) {
+        if (type !== 'time_sync') {
+            return;
+        }
+        fetch(`/api/time?client_time_ms=${data.client_time_ms}`, { cache: 'no-store' })
+            .then(function (response) {
+                return response.json();
+            })
+            .then(function (reply) {
+                serverClock.handleReply(reply);
+            })
+            .catch(function (error) {
+                console.error('Time sync error:', error);
+            });
+    };
+
+    this.connect();
+};
@@ -1,7 +1,28 @@
 var wsHandler = function (path, events) {
     var handler = this;
     var protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-    var url = `${protocol}//${window.location.host}${path}${window.location.search}`;
+    var params = new URLSearchParams(window.location.search);
+    params.set('delta', '1');
+    var url = `${protocol}//${window.location.host}${path}?${params.toString()}`;
+
+    // Latest version of every numbered message type. It survives reconnects so the server only
+    // sends what was missed in between.
+    var versions = {};
+
+    var resumeUrl = function () {
+        var resume = Object.keys(versions).filter(function (type) {
+            return versions[type] !== null;
+        }).map(function (type) {
+            return `${type}:${versions[type].seq}`;
+        });
+        if (resume.length === 0) {
+            return url;
+        }
+        return `${url}&resume=${encodeURIComponent(resume.join(','))}`;
+    };
+
+    // Topics subscribed to on the shared /api/ws socket, subscribed again after a reconnect.
+    var topics = [];
 
     if (!events.hasOwnProperty('error')) {
         events.error = function (e) {
@@ -26,19 +47,63 @@ var wsHandler = function (path, events) {
     }
 
     this.connect = function () {
-        this.websocket = new WebSocket(url);
+        // Large frames arrive deflated as binary frames when the browser can inflate them.
+        var subprotocols = canInflate ? ['deflate'] : [];
+        this.websocket = new WebSocket(resumeUrl(), subprotocols);
+        this.websocket.binaryType = 'arraybuffer';
+        // Inflating is asynchronous, so frames are handled through a chain to keep their order.
+        var received = Promise.resolve();
+
+        this.websocket.onclose = function () {
+            serverClock.stop(handler);
+            console.log('WebSocket disconnected from Server. Retry after 3 seconds...');
+            setTimeout(function () {
+                handler.connect();
+            }, 3000);
+        };
 
         this.websocket.onopen = function () {
             console.log('WebSocket connected to Server at ', url);
+            if (topics.length > 0) {
+                handler.send('subscribe', topics);
+            }
+            // Only pages showing the match time need the server's clock.
+            if (events.hasOwnProperty('match_time')) {
+                serverClock.start(handler);
+            }
         };
 
-        this.websocket.onclose = function () {
-            console.log('WebSocket disconnected from Server. Retry after 3 seconds...');
-            setTimeout(handler.connect, 3000);
+        this.websocket.onmessage = function (e) {
+            received = received.then(function () {
+                return decodeFrame(e.data);
+            }).then(handleEvent).catch(function (error) {
+                console.error('WebSocket message error:', error);
+            });
         };
 
-        this.websocket.onmessage = function (e) {
-            var event = JSON.parse(e.data);
+        var handleEvent = function (event) {
+            if (event.type === 'time_sync') {
+                serverClock.handleReply(event.data);
+                return;
+            }
+
+            if (event.hasOwnProperty('patch')) {
+                var version = versions[event.type];
+                if (!version || event.seq !== version.seq + 1) {
+                    // A version is missing; ask once for a full snapshot and drop patches until then.
+                    if (version !== null) {
+                        versions[event.type] = null;
+                        handler.send('resync', { type: event.type });
+                    }
+                    return;
+                }
+                version.data = applyPatch(version.data, event.patch);
+                version.seq = event.seq;
+                event.data = version.data;
+            } else if (event.hasOwnProperty('seq')) {
+                versions[event.type] = { seq: event.seq, data: event.data };
+            }
+
             if (events.hasOwnProperty(event.type)) {
                 events[event.type](event);
             }
@@ -57,5 +122,158 @@ var wsHandler = function (path, events) {
         }));
     };
 
+    // Adds topics and their event handlers, so several widgets on a page can share one socket.
+    this.subscribe = function (newTopics, newEvents) {
+        Object.assign(events, newEvents || {});
+        newTopics = newTopics.filter(function (topic) {
+            return topics.indexOf(topic) < 0;
+        });
+        topics = topics.concat(newTopics);
+        if (newTopics.length > 0 && this.websocket.readyState === WebSocket.OPEN) {
+            this.send('subscribe', newTopics);
+            if (newTopics.indexOf('match_time') >= 0) {
+                serverClock.start(this);
+            }
+        }
+    };
+
+    this.unsubscribe = function (oldTopics) {
+        topics = topics.filter(function (topic) {
+            return oldTopics.indexOf(topic) < 0;
+        });
+        if (this.websocket.readyState === WebSocket.OPEN) {
+            this.send('unsubscribe', oldTopics);
+        }
+    };
+
+    // Sends a command to a panel's handler over the shared socket, e.g. target 'match_control'.
+    this.command = function (target, type, data) {
+        this.websocket.send(JSON.stringify({
+            "target": target,
+            "type": type,
+            "data": data
+        }));
+    };
+
     this.connect();
-}
\ No newline at end of file
+}
+
+// Estimate of the server's wall clock, kept with NTP-style request/reply exchanges on the websocket
+// so displays can count the match time down on their own between match_time messages.
+var serverClock = {
+    // Server time minus local time, and the round trip of the sample it was taken from.
+    offsetMs: 0,
+    roundTripMs: Infinity,
+    samples: [],
+    handler: null,
+    timer: null,
+
+    SAMPLE_COUNT: 8,
+    BURST_INTERVAL_MS: 200,
+    INTERVAL_MS: 30000,
+
+    localNow: function () {
+        return performance.timeOrigin + performance.now();
+    },
+
+    now: function () {
+        return this.localNow() + this.offsetMs;
+    },
+
+    start: function (handler) {
+        var clock = this;
+        this.stop(this.handler);
+        this.handler = handler;
+        // A quick burst right after connecting, then an occasional sample to follow drift.
+        var burst = this.SAMPLE_COUNT;
+        var request = function () {
+            handler.send('time_sync', { client_time_ms: clock.localNow() });
+            burst--;
+            clock.timer = setTimeout(request, burst > 0 ? clock.BURST_INTERVAL_MS : clock.INTERVAL_MS);
+        };
+        request();
+    },
+
+    stop: function (handler) {
+        if (this.handler === handler && this.timer !== null) {
+            clearTimeout(this.timer);
+            this.timer = null;
+        }
+    },
+
+    handleReply: function (data) {
+        var receiveTime = this.localNow();
+        var roundTripMs = receiveTime - data.client_time_ms;
+        if (!(roundTripMs >= 0)) {
+            return;
+        }
+
+        // Assuming the request and the reply took equally long, the server read its clock halfway
+        // through the round trip. The sample with the shortest round trip has the least room for
+        // asymmetry, so it is the one used.
+        this.samples.push({
+            offsetMs: data.server_time_ms - (data.client_time_ms + receiveTime) / 2,
+            roundTripMs: roundTripMs,
+        });
+        if (this.samples.length > this.SAMPLE_COUNT) {
+            this.samples.shift();
+        }
+        var best = this.samples.reduce(function (best, sample) {
+            return sample.roundTripMs < best.roundTripMs ? sample : best;
+        });
+        this.offsetMs = best.offsetMs;
+        this.roundTripMs = best.roundTripMs;
+    },
+};
+
+// Browsers that have DecompressionStream without the raw deflate format must not offer `deflate`.
+var canInflate = (function () {
+    try {
+        new DecompressionStream('deflate-raw');
+        return true;
+    } catch (e) {
+        return false;
+    }
+})();
+
+var decodeFrame = function (data) {
+    if (typeof data === 'string') {
+        return JSON.parse(data);
+    }
+    var stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate-raw'));
+    return new Response(stream).text().then(JSON.parse);
+};
+
+var applyPatch = function (document, patch) {
+    patch.forEach(function (operation) {
+        if (operation.path === '') {
+            document = operation.value;
+            return;
+        }
+
+        var tokens = operation.path.split('/').slice(1).map(function (token) {
+            return token.replace(/~1/g, '/').replace(/~0/g, '~');
+        });
+        var parent = document;
+        for (var i = 0; i < tokens.length - 1; i++) {
+            parent = parent[tokens[i]];
+        }
+
+        var key = tokens[tokens.length - 1];
+        if (Array.isArray(parent)) {
+            var index = key === '-' ? parent.length : parseInt(key);
+            if (operation.op === 'add') {
+                parent.splice(index, 0, operation.value);
+            } else if (operation.op === 'remove') {
+                parent.splice(index, 1);
+            } else {
+                parent[index] = operation.value;
+            }
+        } else if (operation.op === 'remove') {
+            delete parent[key];
+        } else {
+            parent[key] = operation.value;
+        }
+    });
+    return document;
+};
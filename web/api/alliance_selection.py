@@ -200,7 +200,7 @@ async def finalize_alliance_selection(start_time: datetime) -> dict:
 
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
 
     notifiers_task = asyncio.create_task(
         ws.handle_notifiers(websocket, get_arena().alliance_selection_notifier)
@@ -210,15 +210,16 @@ async def websocket_endpoint(websocket: WebSocket):
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await ws.receive_message(websocket)
             if 'type' not in data:
                 continue
             message_type = data['type']
 
             if message_type == 'set_timer':
                 if 'time_limit_sec' not in data['data']:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'time_limit_sec not provided'}}
+                    await ws.send_message(
+                        websocket,
+                        {'type': 'error', 'data': {'message': 'time_limit_sec not provided'}},
                     )
                     continue
                 alliance_selection_time_limit_sec = int(data['data']['time_limit_sec'])
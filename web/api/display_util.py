@@ -1,6 +1,12 @@
-from fastapi import Request, WebSocket
+import functools
+import logging
+from collections.abc import Callable
+
+from fastapi import Request, Response
+from starlette.requests import HTTPConnection
 
 import field
+import ws
 from web.arena import get_arena
 
 
@@ -37,13 +43,33 @@ async def enforce_display_configuration(
     return None
 
 
-async def register_display(websocket: WebSocket) -> field.Display:
-    query = dict(websocket.query_params)
+async def register_display(connection: HTTPConnection) -> field.Display:
+    query = {key: connection.query_params.getlist(key) for key in connection.query_params}
 
-    display_configuration = field.display_from_url(websocket.url.path, query)
+    display_configuration = field.display_from_url(connection.url.path, query)
 
-    ip_address = websocket.headers.get('X-Real-IP', '')
+    ip_address = connection.headers.get('X-Real-IP', '')
     if ip_address == '':
-        ip_address = websocket.client.host
+        ip_address = connection.client.host
 
     return await get_arena().register_display(display_configuration, ip_address)
+
+
+async def stream_display_events(
+    request: Request, get_notifiers: Callable[[field.Display], list[ws.Notifier]]
+) -> Response:
+    """Serves a read-only display's notifiers as Server-Sent Events instead of a websocket."""
+    try:
+        display = await register_display(request)
+    except ValueError as e:
+        logging.error(f'Error registering display: {e}')
+        # EventSource gives up on any response but a 200 instead of reconnecting.
+        return Response(str(e), 400)
+
+    return ws.EventStreamResponse(
+        request,
+        *get_notifiers(display),
+        on_close=functools.partial(
+            get_arena().mark_display_disconnect, display.display_configuration.id
+        ),
+    )
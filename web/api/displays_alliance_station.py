@@ -20,7 +20,7 @@ async def alliance_station_display(request: Request, display_id: str = '', nickn
 
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
     try:
         display = await register_display(websocket)
     except ValueError as e:
@@ -44,7 +44,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
     try:
         while True:
-            await websocket.receive_text()
+            ws.handle_protocol_message(websocket, await ws.receive_message(websocket))
     except WebSocketDisconnect:
         pass
     finally:
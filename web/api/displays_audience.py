@@ -25,7 +25,7 @@ async def audience_display(request: Request, display_id: str = '', nickname='')
 
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
     try:
         display = await register_display(websocket)
     except ValueError as e:
@@ -51,7 +51,8 @@ async def websocket_endpoint(websocket: WebSocket):
     )
 
     try:
-        await websocket.receive_text()
+        while True:
+            ws.handle_protocol_message(websocket, await ws.receive_message(websocket))
     except WebSocketDisconnect:
         pass
     finally:
@@ -20,7 +20,7 @@ async def field_monitor_display(request: Request, display_id: str = '', nickname
 
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
 
     try:
         display = await register_display(websocket)
@@ -33,11 +33,13 @@ async def websocket_endpoint(websocket: WebSocket):
         ws.handle_notifiers(
             websocket,
             display.notifier,
+            get_arena().websocket_stats_notifier,
         )
     )
 
     try:
-        await websocket.receive_text()
+        while True:
+            ws.handle_protocol_message(websocket, await ws.receive_message(websocket))
     except WebSocketDisconnect:
         pass
     finally:
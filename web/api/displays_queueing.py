@@ -1,7 +1,7 @@
 import asyncio
 from datetime import timedelta
 
-from fastapi import APIRouter, Request, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Request, Response, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
 
 import field
@@ -9,7 +9,11 @@ import models
 import ws
 from web.arena import get_arena
 
-from .display_util import enforce_display_configuration, register_display
+from .display_util import (
+    enforce_display_configuration,
+    register_display,
+    stream_display_events,
+)
 
 NUM_NON_PLAYOFF_MATCHES_TO_SHOW = 5
 NUM_PLAYOFF_MATCHES_TO_SHOW = 4
@@ -64,9 +68,14 @@ async def match_load() -> MatchLoadResponse:
     )
 
 
+@router.get('/events')
+async def events_endpoint(request: Request) -> Response:
+    return await stream_display_events(request, get_notifiers)
+
+
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
     try:
         display = await register_display(websocket)
     except ValueError as e:
@@ -74,20 +83,11 @@ async def websocket_endpoint(websocket: WebSocket):
         await websocket.close()
         return
 
-    notifiers_task = asyncio.create_task(
-        ws.handle_notifiers(
-            websocket,
-            display.notifier,
-            get_arena().match_timing_notifier,
-            get_arena().match_load_notifier,
-            get_arena().match_time_notifier,
-            get_arena().event_status_notifier,
-            get_arena().reload_displays_notifier,
-        )
-    )
+    notifiers_task = asyncio.create_task(ws.handle_notifiers(websocket, *get_notifiers(display)))
 
     try:
-        await websocket.receive_text()
+        while True:
+            ws.handle_protocol_message(websocket, await ws.receive_message(websocket))
     except WebSocketDisconnect:
         pass
     finally:
@@ -98,3 +98,14 @@ async def websocket_endpoint(websocket: WebSocket):
             pass
 
         await get_arena().mark_display_disconnect(display.display_configuration.id)
+
+
+def get_notifiers(display: field.Display) -> list[ws.Notifier]:
+    return [
+        display.notifier,
+        get_arena().match_timing_notifier,
+        get_arena().match_load_notifier,
+        get_arena().match_time_notifier,
+        get_arena().event_status_notifier,
+        get_arena().reload_displays_notifier,
+    ]
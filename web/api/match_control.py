@@ -1,5 +1,4 @@
 import asyncio
-from datetime import datetime
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel
@@ -53,8 +52,10 @@ async def load_match():
 
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
 
+    # Replies go through the listener so they never interleave with its writes.
+    listener = ws.create_listener(websocket)
     notifiers_task = asyncio.create_task(
         ws.handle_notifiers(
             websocket,
@@ -68,227 +69,22 @@ async def websocket_endpoint(websocket: WebSocket):
             get_arena().realtime_score_notifier,
             get_arena().score_posted_notifier,
             get_arena().scoring_status_notifier,
+            listener=listener,
         )
     )
 
     try:
         while True:
-            data = await websocket.receive_json()
-            if 'type' not in data:
+            data = await ws.receive_message(websocket)
+            if not isinstance(data, dict):
+                ws.enqueue_error(listener, 'Message must be a JSON object')
                 continue
-            command = data['type']
-            payload = data.get('data', {})
-
-            if command == 'load_match':
-                if 'match_id' not in payload:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Match ID not provided'}}
-                    )
-                    continue
-                try:
-                    get_arena().reset_match()
-                except RuntimeError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
-                    continue
-
-                match_id = int(payload['match_id'])
-                try:
-                    if match_id == 0:
-                        await get_arena().load_test_match()
-                    else:
-                        match = models.read_match_by_id(match_id)
-                        if match is None:
-                            await websocket.send_json(
-                                {'type': 'error', 'data': {'message': 'Match not found'}}
-                            )
-                            continue
-                        await get_arena().load_match(match)
-                except RuntimeError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
-                    continue
-
-            elif command == 'show_result':
-                if 'match_id' not in payload:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Match ID not provided'}}
-                    )
-                    continue
-
-                match_id = int(payload['match_id'])
-                if match_id == 0:
-                    get_arena().saved_match = models.Match(type=models.MatchType.TEST, type_order=0)
-                    get_arena().saved_match_result = models.MatchResult(
-                        match_id=0, match_type=models.MatchType.TEST
-                    )
-                    await get_arena().score_posted_notifier.notify()
-                    continue
-
-                match = models.read_match_by_id(match_id)
-                if match is None:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Match not found'}}
-                    )
-                    continue
-
-                match_result = models.read_match_result_for_match(match_id)
-                if match_result is None:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Match result not found'}}
-                    )
-                    continue
-
-                if match.should_update_ranking():
-                    get_arena().saved_rankings = models.read_all_rankings()
-                else:
-                    get_arena().saved_rankings = game.Rankings()
-
-                get_arena().saved_match = match
-                get_arena().saved_match_result = match_result
-                await get_arena().score_posted_notifier.notify()
-
-            elif command == 'substitute_teams':
-                if not all(
-                    station in payload
-                    for station in ['red1', 'red2', 'red3', 'blue1', 'blue2', 'blue3']
-                ):
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Team IDs not provided'}}
-                    )
-                    continue
-
-                red1 = int(payload.get('red1', 0))
-                red2 = int(payload.get('red2', 0))
-                red3 = int(payload.get('red3', 0))
-                blue1 = int(payload.get('blue1', 0))
-                blue2 = int(payload.get('blue2', 0))
-                blue3 = int(payload.get('blue3', 0))
-
-                try:
-                    await get_arena().substitute_team(red1, red2, red3, blue1, blue2, blue3)
-                except ValueError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
-                    continue
-
-            elif command == 'toggle_bypass':
-                if 'station' not in payload:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Station not provided'}}
-                    )
-                    continue
-
-                station = payload['station']
-                if station not in get_arena().alliance_stations:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Invalid station'}}
-                    )
-                    continue
-
-                get_arena().alliance_stations[station].bypass = (
-                    not get_arena().alliance_stations[station].bypass
-                )
-                await ws.write_notifier(websocket, get_arena().arena_status_notifier)
-
-            elif command == 'start_match':
-                mute_match_sounds = payload.get('mute_match_sounds', False)
-                get_arena().mute_match_sounds = mute_match_sounds
-                try:
-                    await get_arena().start_match()
-                except RuntimeError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
-                    continue
-
-            elif command == 'abort_match':
-                try:
-                    await get_arena().abort_match()
-                except RuntimeError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
-                    continue
-
-            elif command == 'signal_reset':
-                if get_arena().match_state not in [
-                    field.MatchState.POST_MATCH,
-                    field.MatchState.PRE_MATCH,
-                ]:
-                    continue
-
-                get_arena().field_reset = True
-                get_arena().alliance_station_display_mode = 'fieldReset'
-                await get_arena().alliance_station_display_mode_notifier.notify()
-
-            elif command == 'commit_results':
-                if get_arena().match_state != field.MatchState.POST_MATCH:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Match not in POST_MATCH state'}}
-                    )
-                    continue
-
-                try:
-                    await commit_current_match_score()
-                    get_arena().reset_match()
-                    await get_arena().load_next_match(True)
-                except RuntimeError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
-                    continue
-
-            elif command == 'discard_results':
-                try:
-                    get_arena().reset_match()
-                    await get_arena().load_next_match(False)
-                except RuntimeError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
-                    continue
-
-            elif command == 'set_audience_display':
-                if 'data' not in data:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Mode not provided'}}
-                    )
-                    continue
-
-                mode = data['data']
-                await get_arena().set_audience_display_mode(mode)
-
-            elif command == 'set_alliance_station_display':
-                if 'data' not in data:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Mode not provided'}}
-                    )
-                    continue
-
-                mode = data['data']
-                await get_arena().set_alliance_station_display_mode(mode)
-
-            elif command == 'start_timeout':
-                if 'duration_sec' not in payload:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Duration not provided'}}
-                    )
-                    continue
-
-                duration_sec = int(payload['duration_sec'])
-                try:
-                    await get_arena().start_timeout('Timeout', duration_sec)
-                except RuntimeError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
-                    continue
-
-            elif command == 'set_test_match_name':
-                if get_arena().current_match.type != models.MatchType.TEST:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Current match is not a test match'}}
-                    )
-                    continue
-                if 'name' not in payload:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Name not provided'}}
-                    )
-                    continue
-
-                get_arena().current_match.long_name = payload['name']
-                await get_arena().match_load_notifier.notify()
-
-            else:
-                await websocket.send_json({'type': 'error', 'data': {'message': 'Invalid command'}})
+            if 'type' not in data or ws.handle_protocol_message(websocket, data):
+                continue
+            try:
+                await handle_command(websocket, data)
+            except (ValueError, RuntimeError) as e:
+                ws.enqueue_error(listener, str(e))
 
     except WebSocketDisconnect:
         pass
@@ -300,6 +96,148 @@ async def websocket_endpoint(websocket: WebSocket):
             pass
 
 
+async def handle_command(websocket: WebSocket, data: dict):
+    """Runs a match control command; a rejected command raises ValueError or RuntimeError."""
+    command = data['type']
+    payload = data.get('data', {})
+
+    if command == 'load_match':
+        if 'match_id' not in payload:
+            raise ValueError('Match ID not provided')
+        get_arena().reset_match()
+
+        match_id = int(payload['match_id'])
+        if match_id == 0:
+            await get_arena().load_test_match()
+        else:
+            match = models.read_match_by_id(match_id)
+            if match is None:
+                raise ValueError('Match not found')
+            await get_arena().load_match(match)
+
+    elif command == 'show_result':
+        if 'match_id' not in payload:
+            raise ValueError('Match ID not provided')
+
+        match_id = int(payload['match_id'])
+        if match_id == 0:
+            get_arena().saved_match = models.Match(type=models.MatchType.TEST, type_order=0)
+            get_arena().saved_match_result = models.MatchResult(
+                match_id=0, match_type=models.MatchType.TEST
+            )
+            await get_arena().score_posted_notifier.notify()
+            return
+
+        match = models.read_match_by_id(match_id)
+        if match is None:
+            raise ValueError('Match not found')
+
+        match_result = models.read_match_result_for_match(match_id)
+        if match_result is None:
+            raise ValueError('Match result not found')
+
+        if match.should_update_ranking():
+            get_arena().saved_rankings = models.read_all_rankings()
+        else:
+            get_arena().saved_rankings = game.Rankings()
+
+        get_arena().saved_match = match
+        get_arena().saved_match_result = match_result
+        await get_arena().score_posted_notifier.notify()
+
+    elif command == 'substitute_teams':
+        if not all(
+            station in payload for station in ['red1', 'red2', 'red3', 'blue1', 'blue2', 'blue3']
+        ):
+            raise ValueError('Team IDs not provided')
+
+        red1 = int(payload.get('red1', 0))
+        red2 = int(payload.get('red2', 0))
+        red3 = int(payload.get('red3', 0))
+        blue1 = int(payload.get('blue1', 0))
+        blue2 = int(payload.get('blue2', 0))
+        blue3 = int(payload.get('blue3', 0))
+
+        await get_arena().substitute_team(red1, red2, red3, blue1, blue2, blue3)
+
+    elif command == 'toggle_bypass':
+        if 'station' not in payload:
+            raise ValueError('Station not provided')
+
+        station = payload['station']
+        if station not in get_arena().alliance_stations:
+            raise ValueError('Invalid station')
+
+        get_arena().alliance_stations[station].bypass = (
+            not get_arena().alliance_stations[station].bypass
+        )
+        await get_arena().arena_status_notifier.notify()
+
+    elif command == 'start_match':
+        mute_match_sounds = payload.get('mute_match_sounds', False)
+        get_arena().mute_match_sounds = mute_match_sounds
+        await get_arena().start_match()
+
+    elif command == 'abort_match':
+        await get_arena().abort_match()
+
+    elif command == 'signal_reset':
+        if get_arena().match_state not in [
+            field.MatchState.POST_MATCH,
+            field.MatchState.PRE_MATCH,
+        ]:
+            return
+
+        get_arena().field_reset = True
+        get_arena().alliance_station_display_mode = 'fieldReset'
+        await get_arena().alliance_station_display_mode_notifier.notify()
+
+    elif command == 'commit_results':
+        if get_arena().match_state != field.MatchState.POST_MATCH:
+            raise ValueError('Match not in POST_MATCH state')
+
+        await commit_current_match_score()
+        get_arena().reset_match()
+        await get_arena().load_next_match(True)
+
+    elif command == 'discard_results':
+        get_arena().reset_match()
+        await get_arena().load_next_match(False)
+
+    elif command == 'set_audience_display':
+        if 'data' not in data:
+            raise ValueError('Mode not provided')
+
+        mode = data['data']
+        await get_arena().set_audience_display_mode(mode)
+
+    elif command == 'set_alliance_station_display':
+        if 'data' not in data:
+            raise ValueError('Mode not provided')
+
+        mode = data['data']
+        await get_arena().set_alliance_station_display_mode(mode)
+
+    elif command == 'start_timeout':
+        if 'duration_sec' not in payload:
+            raise ValueError('Duration not provided')
+
+        duration_sec = int(payload['duration_sec'])
+        await get_arena().start_timeout('Timeout', duration_sec)
+
+    elif command == 'set_test_match_name':
+        if get_arena().current_match.type != models.MatchType.TEST:
+            raise ValueError('Current match is not a test match')
+        if 'name' not in payload:
+            raise ValueError('Name not provided')
+
+        get_arena().current_match.long_name = payload['name']
+        await get_arena().match_load_notifier.notify()
+
+    else:
+        raise ValueError('Invalid command')
+
+
 async def commit_match_score(
     match: models.Match, match_result: models.MatchResult, is_match_review_edit: bool
 ):
@@ -307,7 +245,7 @@ async def commit_match_score(
     if match.type == models.MatchType.PLAYOFF:
         match_result.correct_playoff_score()
 
-    match.score_commit_at = datetime.now()
+    match.score_commit_at = get_arena().clock.now()
     red_score_summary = match_result.red_score_summary()
     blue_score_summary = match_result.blue_score_summary()
     match.status = game.determine_match_status(
@@ -355,6 +293,9 @@ async def commit_match_score(
         if get_arena().event.tba_publishing_enabled and match.type != models.MatchType.PRACTICE:
             pass
 
+        # The loaded match may now be a replay, and its teams' rankings may have changed.
+        get_arena().match_load_notifier.invalidate()
+
         # models.backup_db(get_arena().event.name, f'post_{match.type}_match_{match.short_name}')
 
     if not is_match_review_edit:
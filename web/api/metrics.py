@@ -0,0 +1,22 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+import ws
+from web.arena import get_arena
+
+router = APIRouter(prefix='/metrics', tags=['metrics'])
+
+
+@router.get('', response_class=PlainTextResponse)
+async def metrics():
+    arena = get_arena()
+    return PlainTextResponse(
+        arena.metrics.to_prometheus_text(arena.loop_scheduler, arena.get_notifiers()),
+        media_type='text/plain; version=0.0.4',
+    )
+
+
+@router.get('/websockets')
+async def websocket_stats() -> dict[str, list[dict]]:
+    """Totals of every notifier topic and the statistics of every listener, slowest first."""
+    return ws.get_stats(get_arena().get_notifiers())
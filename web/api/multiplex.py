@@ -0,0 +1,112 @@
+import asyncio
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+import ws
+from web.arena import get_arena
+
+from . import match_control, panels_referee, panels_scoring
+
+router = APIRouter(prefix='/ws', tags=['websocket'])
+
+
+@router.websocket('')
+async def websocket_endpoint(websocket: WebSocket):
+    """One websocket for every notifier topic and panel command a page needs.
+
+    Clients pick topics with `?topics=a,b` or by sending `subscribe` and `unsubscribe` messages
+    whose data is a list of topic names, and receive the same frames as on the per-page
+    websockets. Any other message is a command for the handler named by its `target`, e.g.
+    `{"target": "match_control", "type": "start_match", "data": {}}`.
+    """
+    await ws.accept(websocket)
+
+    listener = ws.create_listener(websocket)
+    writer_task = asyncio.create_task(listener.run())
+
+    try:
+        topics = websocket.query_params.get('topics')
+        if topics:
+            try:
+                await ws.handle_subscription(listener, 'subscribe', topics.split(','), get_topics())
+            except ValueError as e:
+                ws.enqueue_error(listener, str(e))
+
+        while True:
+            data = await ws.receive_message(websocket)
+            if not isinstance(data, dict):
+                ws.enqueue_error(listener, 'Message must be a JSON object')
+                continue
+            if 'type' not in data or ws.handle_protocol_message(websocket, data):
+                continue
+
+            try:
+                if data['type'] in ['subscribe', 'unsubscribe']:
+                    await ws.handle_subscription(
+                        listener, data['type'], data.get('data', []), get_topics()
+                    )
+                else:
+                    await handle_command(websocket, data)
+            except (ValueError, RuntimeError) as e:
+                ws.enqueue_error(listener, str(e))
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        listener.close()
+        writer_task.cancel()
+        try:
+            await writer_task
+        except asyncio.CancelledError:
+            pass
+
+        for notifier in list(listener.notifiers.values()):
+            await ws.unsubscribe(listener, notifier)
+        await handle_close(websocket)
+
+
+@router.get('/topics')
+async def get_topic_descriptions() -> list[list]:
+    """Describes every topic for mirror servers, which subscribe to all of them."""
+    return ws.describe_topics(get_arena().get_notifiers())
+
+
+def get_topics() -> dict[str, ws.Notifier]:
+    return {notifier.message_type: notifier for notifier in get_arena().get_notifiers()}
+
+
+async def handle_command(websocket: WebSocket, data: dict):
+    """Runs a command on the handler named by its `target`.
+
+    Relay workers forward their clients' commands here too, with a stand-in for the websocket.
+    """
+    target = data.get('target')
+    if target == 'match_control':
+        await match_control.handle_command(websocket, data)
+    elif target == 'referee':
+        await panels_referee.handle_command(data)
+    elif target in ['scoring/red', 'scoring/blue']:
+        alliance = target.removeprefix('scoring/')
+        scoring_alliances = get_scoring_alliances(websocket)
+        if alliance not in scoring_alliances:
+            scoring_alliances.add(alliance)
+            get_arena().scoring_panel_registry.register_panel(alliance, websocket)
+            await get_arena().scoring_status_notifier.notify()
+        await panels_scoring.handle_command(alliance, websocket, data)
+    else:
+        raise ValueError(f'Invalid target: {target}')
+
+
+async def handle_close(websocket: WebSocket):
+    """Unregisters the scoring panels a closed websocket registered through its commands."""
+    scoring_alliances = get_scoring_alliances(websocket)
+    for alliance in scoring_alliances:
+        get_arena().scoring_panel_registry.unregister_panel(alliance, websocket)
+    if scoring_alliances:
+        await get_arena().scoring_status_notifier.notify()
+
+
+def get_scoring_alliances(websocket: WebSocket) -> set[str]:
+    if not hasattr(websocket.state, 'scoring_alliances'):
+        websocket.state.scoring_alliances = set[str]()
+    return websocket.state.scoring_alliances
@@ -13,21 +13,17 @@ router = APIRouter(prefix='/panels/scoring', tags=['panels'])
 
 @router.websocket('/{alliance}/websocket')
 async def websocket_endpoint(alliance: str, websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
 
     if alliance not in ['red', 'blue']:
         await websocket.close(1008, 'Invalid alliance')
         return
 
-    realtime_score = (
-        get_arena().red_realtime_score if alliance == 'red' else get_arena().blue_realtime_score
-    )
-    opponent_realtime_score = (
-        get_arena().blue_realtime_score if alliance == 'red' else get_arena().red_realtime_score
-    )
     get_arena().scoring_panel_registry.register_panel(alliance, websocket)
     await get_arena().scoring_status_notifier.notify()
 
+    # Replies go through the listener so they never interleave with its writes.
+    listener = ws.create_listener(websocket)
     notifiers_task = asyncio.create_task(
         ws.handle_notifiers(
             websocket,
@@ -35,187 +31,22 @@ async def websocket_endpoint(alliance: str, websocket: WebSocket):
             get_arena().match_time_notifier,
             get_arena().realtime_score_notifier,
             get_arena().reload_displays_notifier,
+            listener=listener,
         )
     )
 
     try:
         while True:
-            data = await websocket.receive_json()
-            if 'type' not in data:
+            data = await ws.receive_message(websocket)
+            if not isinstance(data, dict):
+                ws.enqueue_error(listener, 'Message must be a JSON object')
                 continue
-            command = data['type']
-
-            score = realtime_score.current_score
-            opponent_score = opponent_realtime_score.current_score
-            score_changed = False
-
-            if command == 'commit_match':
-                if get_arena().match_state != field.MatchState.POST_MATCH:
-                    await websocket.send_json(
-                        {'type': 'error', 'data': {'message': 'Match not in POST_MATCH state'}}
-                    )
-                    continue
-                else:
-                    get_arena().scoring_panel_registry.set_score_commited(alliance, websocket)
-                    await get_arena().scoring_status_notifier.notify()
-            else:
-                payload = data['data']
-
-                if command == 'leave':
-                    if 2 >= payload['position'] >= 0:
-                        score_changed, score.leave_statuses[payload['position']] = set_goal(
-                            score.leave_statuses[payload['position']], payload['state']
-                        )
-
-                elif command == 'cage':
-                    if 2 >= payload['position'] >= 0:
-                        if game.CageStatus(score.cage_statuses[payload['position']]) == max(
-                            game.CageStatus
-                        ):
-                            score.cage_statuses[payload['position']] = min(game.CageStatus)
-                        else:
-                            score.cage_statuses[payload['position']] = game.CageStatus(
-                                score.cage_statuses[payload['position']].value + 1
-                            )
-                        score_changed = True
-
-                elif command == 'endgame':
-                    if 2 >= payload['position'] >= 0:
-                        (
-                            score_changed,
-                            score.endgame_statuses[payload['position']],
-                        ) = set_goal(
-                            score.endgame_statuses[payload['position']],
-                            game.EndgameStatus(payload['state']),
-                        )
-                        print(score.endgame_statuses[payload['position']])
-
-                elif command == 'trough_auto':
-                    if payload['action'] == 'plus':
-                        score_changed, score.score_elements.auto_trough_coral = increment_goal(
-                            score.score_elements.auto_trough_coral
-                        )
-                        _, score.score_elements.total_trough_coral = increment_goal(
-                            score.score_elements.total_trough_coral
-                        )
-                    elif payload['action'] == 'minus':
-                        score_changed, score.score_elements.auto_trough_coral = decrement_goal(
-                            score.score_elements.auto_trough_coral
-                        )
-                        _, score.score_elements.total_trough_coral = decrement_goal(
-                            score.score_elements.total_trough_coral
-                        )
-
-                elif command == 'trough_total':
-                    if payload['action'] == 'plus':
-                        score_changed, score.score_elements.total_trough_coral = increment_goal(
-                            score.score_elements.total_trough_coral
-                        )
-                    elif payload['action'] == 'minus':
-                        score_changed, score.score_elements.total_trough_coral = decrement_goal(
-                            score.score_elements.total_trough_coral
-                        )
-
-                elif command == 'processor_auto':
-                    if payload['action'] == 'plus':
-                        score_changed, score.score_elements.auto_processor_algae = increment_goal(
-                            score.score_elements.auto_processor_algae
-                        )
-                    elif payload['action'] == 'minus':
-                        score_changed, score.score_elements.auto_processor_algae = decrement_goal(
-                            score.score_elements.auto_processor_algae
-                        )
-
-                elif command == 'processor_teleop':
-                    if payload['action'] == 'plus':
-                        score_changed, score.score_elements.teleop_processor_algae = increment_goal(
-                            score.score_elements.teleop_processor_algae
-                        )
-                    elif payload['action'] == 'minus':
-                        score_changed, score.score_elements.teleop_processor_algae = decrement_goal(
-                            score.score_elements.teleop_processor_algae
-                        )
-
-                elif command == 'net_auto':
-                    if payload['action'] == 'plus':
-                        score_changed, score.score_elements.auto_net_algae = increment_goal(
-                            score.score_elements.auto_net_algae
-                        )
-                        _, score.score_elements.total_net_algae = increment_goal(
-                            score.score_elements.total_net_algae
-                        )
-                    elif payload['action'] == 'minus':
-                        score_changed, score.score_elements.auto_net_algae = decrement_goal(
-                            score.score_elements.auto_net_algae
-                        )
-                        _, score.score_elements.total_net_algae = decrement_goal(
-                            score.score_elements.total_net_algae
-                        )
-
-                elif command == 'net_total':
-                    if payload['action'] == 'plus':
-                        score_changed, score.score_elements.total_net_algae = increment_goal(
-                            score.score_elements.total_net_algae
-                        )
-                    elif payload['action'] == 'minus':
-                        score_changed, score.score_elements.total_net_algae = decrement_goal(
-                            score.score_elements.total_net_algae
-                        )
-
-                elif command == 'branches_auto':
-                    if (
-                        0 <= payload['position'] < game.BranchLocation.COUNT
-                        and 0 <= payload['level'] < game.BranchLevel.COUNT
-                    ):
-                        (
-                            score_changed,
-                            score.score_elements.branches_auto[payload['position']][
-                                payload['level']
-                            ],
-                        ) = set_goal(
-                            score.score_elements.branches_auto[payload['position']][
-                                payload['level']
-                            ],
-                            payload['state'],
-                        )
-                        (
-                            _,
-                            score.score_elements.branches[payload['position']][payload['level']],
-                        ) = set_goal(
-                            score.score_elements.branches[payload['position']][payload['level']],
-                            payload['state'],
-                        )
-
-                elif command == 'branches':
-                    if (
-                        0 <= payload['position'] < game.BranchLocation.COUNT
-                        and 0 <= payload['level'] < game.BranchLevel.COUNT
-                    ):
-                        (
-                            score_changed,
-                            score.score_elements.branches[payload['position']][payload['level']],
-                        ) = set_goal(
-                            score.score_elements.branches[payload['position']][payload['level']],
-                            payload['state'],
-                        )
-
-                elif command == 'branches_algaes':
-                    if 0 <= payload['position'] < 6 and 0 <= payload['level'] < 2:
-                        (
-                            score_changed,
-                            score.score_elements.branch_algaes[payload['position']][
-                                payload['level']
-                            ],
-                        ) = set_goal(
-                            score.score_elements.branch_algaes[payload['position']][
-                                payload['level']
-                            ],
-                            payload['state'],
-                        )
-
-                if score_changed:
-                    await asyncio.to_thread(score.summarize, opponent_score)
-                    await get_arena().realtime_score_notifier.notify()
+            if 'type' not in data or ws.handle_protocol_message(websocket, data):
+                continue
+            try:
+                await handle_command(alliance, websocket, data)
+            except ValueError as e:
+                ws.enqueue_error(listener, str(e))
 
     except WebSocketDisconnect:
         pass
@@ -229,6 +60,179 @@ async def websocket_endpoint(alliance: str, websocket: WebSocket):
         await get_arena().scoring_status_notifier.notify()
 
 
+async def handle_command(alliance: str, websocket: WebSocket, data: dict):
+    """Runs a scoring panel command for one alliance; a rejected command raises ValueError.
+
+    The websocket identifies the panel in the scoring panel registry.
+    """
+    realtime_score = (
+        get_arena().red_realtime_score if alliance == 'red' else get_arena().blue_realtime_score
+    )
+    opponent_realtime_score = (
+        get_arena().blue_realtime_score if alliance == 'red' else get_arena().red_realtime_score
+    )
+    command = data['type']
+
+    score = realtime_score.current_score
+    opponent_score = opponent_realtime_score.current_score
+    score_changed = False
+
+    if command == 'commit_match':
+        if get_arena().match_state != field.MatchState.POST_MATCH:
+            raise ValueError('Match not in POST_MATCH state')
+        get_arena().scoring_panel_registry.set_score_commited(alliance, websocket)
+        await get_arena().scoring_status_notifier.notify()
+    else:
+        payload = data['data']
+
+        if command == 'leave':
+            if 2 >= payload['position'] >= 0:
+                score_changed, score.leave_statuses[payload['position']] = set_goal(
+                    score.leave_statuses[payload['position']], payload['state']
+                )
+
+        elif command == 'cage':
+            if 2 >= payload['position'] >= 0:
+                if game.CageStatus(score.cage_statuses[payload['position']]) == max(
+                    game.CageStatus
+                ):
+                    score.cage_statuses[payload['position']] = min(game.CageStatus)
+                else:
+                    score.cage_statuses[payload['position']] = game.CageStatus(
+                        score.cage_statuses[payload['position']].value + 1
+                    )
+                score_changed = True
+
+        elif command == 'endgame':
+            if 2 >= payload['position'] >= 0:
+                (
+                    score_changed,
+                    score.endgame_statuses[payload['position']],
+                ) = set_goal(
+                    score.endgame_statuses[payload['position']],
+                    game.EndgameStatus(payload['state']),
+                )
+
+        elif command == 'trough_auto':
+            if payload['action'] == 'plus':
+                score_changed, score.score_elements.auto_trough_coral = increment_goal(
+                    score.score_elements.auto_trough_coral
+                )
+                _, score.score_elements.total_trough_coral = increment_goal(
+                    score.score_elements.total_trough_coral
+                )
+            elif payload['action'] == 'minus':
+                score_changed, score.score_elements.auto_trough_coral = decrement_goal(
+                    score.score_elements.auto_trough_coral
+                )
+                _, score.score_elements.total_trough_coral = decrement_goal(
+                    score.score_elements.total_trough_coral
+                )
+
+        elif command == 'trough_total':
+            if payload['action'] == 'plus':
+                score_changed, score.score_elements.total_trough_coral = increment_goal(
+                    score.score_elements.total_trough_coral
+                )
+            elif payload['action'] == 'minus':
+                score_changed, score.score_elements.total_trough_coral = decrement_goal(
+                    score.score_elements.total_trough_coral
+                )
+
+        elif command == 'processor_auto':
+            if payload['action'] == 'plus':
+                score_changed, score.score_elements.auto_processor_algae = increment_goal(
+                    score.score_elements.auto_processor_algae
+                )
+            elif payload['action'] == 'minus':
+                score_changed, score.score_elements.auto_processor_algae = decrement_goal(
+                    score.score_elements.auto_processor_algae
+                )
+
+        elif command == 'processor_teleop':
+            if payload['action'] == 'plus':
+                score_changed, score.score_elements.teleop_processor_algae = increment_goal(
+                    score.score_elements.teleop_processor_algae
+                )
+            elif payload['action'] == 'minus':
+                score_changed, score.score_elements.teleop_processor_algae = decrement_goal(
+                    score.score_elements.teleop_processor_algae
+                )
+
+        elif command == 'net_auto':
+            if payload['action'] == 'plus':
+                score_changed, score.score_elements.auto_net_algae = increment_goal(
+                    score.score_elements.auto_net_algae
+                )
+                _, score.score_elements.total_net_algae = increment_goal(
+                    score.score_elements.total_net_algae
+                )
+            elif payload['action'] == 'minus':
+                score_changed, score.score_elements.auto_net_algae = decrement_goal(
+                    score.score_elements.auto_net_algae
+                )
+                _, score.score_elements.total_net_algae = decrement_goal(
+                    score.score_elements.total_net_algae
+                )
+
+        elif command == 'net_total':
+            if payload['action'] == 'plus':
+                score_changed, score.score_elements.total_net_algae = increment_goal(
+                    score.score_elements.total_net_algae
+                )
+            elif payload['action'] == 'minus':
+                score_changed, score.score_elements.total_net_algae = decrement_goal(
+                    score.score_elements.total_net_algae
+                )
+
+        elif command == 'branches_auto':
+            if (
+                0 <= payload['position'] < game.BranchLocation.COUNT
+                and 0 <= payload['level'] < game.BranchLevel.COUNT
+            ):
+                (
+                    score_changed,
+                    score.score_elements.branches_auto[payload['position']][payload['level']],
+                ) = set_goal(
+                    score.score_elements.branches_auto[payload['position']][payload['level']],
+                    payload['state'],
+                )
+                (
+                    _,
+                    score.score_elements.branches[payload['position']][payload['level']],
+                ) = set_goal(
+                    score.score_elements.branches[payload['position']][payload['level']],
+                    payload['state'],
+                )
+
+        elif command == 'branches':
+            if (
+                0 <= payload['position'] < game.BranchLocation.COUNT
+                and 0 <= payload['level'] < game.BranchLevel.COUNT
+            ):
+                (
+                    score_changed,
+                    score.score_elements.branches[payload['position']][payload['level']],
+                ) = set_goal(
+                    score.score_elements.branches[payload['position']][payload['level']],
+                    payload['state'],
+                )
+
+        elif command == 'branches_algaes':
+            if 0 <= payload['position'] < 6 and 0 <= payload['level'] < 2:
+                (
+                    score_changed,
+                    score.score_elements.branch_algaes[payload['position']][payload['level']],
+                ) = set_goal(
+                    score.score_elements.branch_algaes[payload['position']][payload['level']],
+                    payload['state'],
+                )
+
+        if score_changed:
+            await asyncio.to_thread(score.summarize, opponent_score)
+            await get_arena().realtime_score_notifier.notify()
+
+
 def increment_goal(goal: object):
     goal += 1
     return True, goal
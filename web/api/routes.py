@@ -1,4 +1,6 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+
+import ws
 
 from . import (
     bracket_svg,
@@ -17,6 +19,8 @@ from . import (
     match_control,
     match_logs,
     match_review,
+    metrics,
+    multiplex,
     panels_referee,
     panels_scoring,
     setup_awards,
@@ -65,7 +69,17 @@ router.include_router(match_logs.router)
 router.include_router(match_control.router)
 router.include_router(match_review.router)
 
+router.include_router(metrics.router)
+router.include_router(multiplex.router)
+
 
 @router.get('')
 async def api_root():
     return {'data': 'Hello API'}
+
+
+@router.get('/time')
+async def server_time(response: Response, client_time_ms: float | None = None) -> dict:
+    """The server's wall clock, for event stream displays, which cannot send time_sync."""
+    response.headers['cache-control'] = 'no-store'
+    return ws.get_time_sync_reply(client_time_ms)
@@ -16,7 +16,7 @@ async def get_display_type() -> dict[DisplayType, str]:
 
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
 
     notifiers_task = asyncio.create_task(
         ws.handle_notifiers(websocket, get_arena().display_configuration_notifier)
@@ -24,7 +24,7 @@ async def websocket_endpoint(websocket: WebSocket):
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await ws.receive_message(websocket)
             if 'type' not in data:
                 continue
             message_type = data['type']
@@ -48,8 +48,9 @@ async def websocket_endpoint(websocket: WebSocket):
                 await get_arena().reload_displays_notifier.notify()
 
             else:
-                await websocket.send_json(
-                    {'type': 'error', 'data': {'message': f'Invalid data type{message_type}'}}
+                await ws.send_message(
+                    websocket,
+                    {'type': 'error', 'data': {'message': f'Invalid data type{message_type}'}},
                 )
                 continue
 
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 
 import game
+import ws
 from web.arena import get_arena
 
 router = APIRouter(prefix='/setup/field_testing', tags=['field_testing'])
@@ -13,11 +14,11 @@ async def get_field_testing() -> list[game.MatchSound]:
 
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await ws.receive_message(websocket)
             if 'type' not in data:
                 continue
             message_type = data['type']
@@ -27,8 +28,9 @@ async def websocket_endpoint(websocket: WebSocket):
                 await get_arena().play_sound_notifier.notify_with_message(sound)
 
             else:
-                await websocket.send_json(
-                    {'type': 'error', 'data': {'message': f'Invalid data type{message_type}'}}
+                await ws.send_message(
+                    websocket,
+                    {'type': 'error', 'data': {'message': f'Invalid data type{message_type}'}},
                 )
                 continue
     except WebSocketDisconnect:
@@ -17,15 +17,19 @@ async def get_lower_thirds() -> list[models.LowerThird]:
 
 @router.websocket('/websocket')
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+    await ws.accept(websocket)
 
+    # Replies go through the listener so they never interleave with its writes.
+    listener = ws.create_listener(websocket)
     notifiers_task = asyncio.create_task(
-        ws.handle_notifiers(websocket, get_arena().audience_display_mode_notifier)
+        ws.handle_notifiers(
+            websocket, get_arena().audience_display_mode_notifier, listener=listener
+        )
     )
 
     try:
         while True:
-            data = await websocket.receive_json()
+            data = await ws.receive_message(websocket)
             if 'type' not in data:
                 continue
             message_type = data['type']
@@ -60,7 +64,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 try:
                     reorder_lower_third(id, move_up)
                 except ValueError as e:
-                    await websocket.send_json({'type': 'error', 'data': {'message': str(e)}})
+                    ws.enqueue_error(listener, str(e))
                     continue
 
             elif message_type == 'set_audience_display':
@@ -68,9 +72,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 await get_arena().set_audience_display_mode(mode)
 
             else:
-                await websocket.send_json(
-                    {'type': 'error', 'data': {'message': f'Invalid data type{message_type}'}}
-                )
+                ws.enqueue_error(listener, f'Invalid data type{message_type}')
                 continue
 
             await ws.write_notifier(websocket, get_arena().reload_displays_notifier)
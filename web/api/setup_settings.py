@@ -163,6 +163,7 @@ async def clear_db(type: str) -> dict:
     elif match_type == models.MatchType.PLAYOFF:
         delete_match_data_for_type(models.MatchType.PLAYOFF)
         models.truncate_alliance()
+    get_arena().match_load_notifier.invalidate()
 
     return {'status': 'success'}
 
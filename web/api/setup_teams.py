@@ -32,6 +32,8 @@ async def create_team(request_body: TeamsRequest) -> list[models.Team | None]:
     teams = []
     for team_number in request_body.team_ids:
         teams.append(models.create_team(models.Team(id=team_number)))
+    # The loaded match carries its teams' details.
+    get_arena().match_load_notifier.invalidate()
 
     return teams
 
@@ -44,6 +46,7 @@ async def clear_teams() -> dict:
         )
 
     models.truncate_teams()
+    get_arena().match_load_notifier.invalidate()
 
     return {'status': 'success'}
 
@@ -55,6 +58,7 @@ async def generate_wpa_keys(all: bool = False) -> dict:
         if len(team.wpakey) == 0 or all:
             team.wpakey = ''.join(random.choices(KEY_CHARS, k=8))
             models.update_team(team)
+    get_arena().match_load_notifier.invalidate()
 
     return {'status': 'success'}
 
@@ -93,6 +97,7 @@ async def update_team(team_number: int, new_team: models.Team) -> models.Team |
     team.has_connected = new_team.has_connected
 
     data = models.update_team(team)
+    get_arena().match_load_notifier.invalidate()
 
     return data
 
@@ -109,6 +114,7 @@ async def delete_team(team_number: int) -> dict:
         raise HTTPException(status_code=404, detail='Team not found')
 
     models.delete_team(team.id)
+    get_arena().match_load_notifier.invalidate()
 
     return {'status': 'success'}
 
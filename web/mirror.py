@@ -0,0 +1,148 @@
+import asyncio
+import contextlib
+import time
+
+import fastapi
+import httpx
+from fastapi import Request, Response, WebSocket, WebSocketDisconnect
+from fastapi.staticfiles import StaticFiles
+
+import ws
+
+# Topics of the read-only displays a mirror serves, as their websockets on the primary send them.
+MIRROR_DISPLAY_TOPICS = {
+    'audience': [
+        'match_timing',
+        'audience_display_mode',
+        'match_load',
+        'match_time',
+        'realtime_score',
+        'play_sound',
+        'score_posted',
+        'alliance_selection',
+        'lower_third',
+        'reload_displays',
+    ],
+    'bracket': ['match_load', 'reload_displays'],
+    'rankings': ['event_status', 'reload_displays'],
+    'twitch': ['reload_displays'],
+}
+# Pages and reports fetched from the primary are kept this long, or until a topic they are built
+# from changes.
+RESPONSE_CACHE_TTL_SEC = 30
+RESPONSE_CACHE_TOPICS = ['event_status', 'match_load', 'score_posted', 'alliance_selection']
+PROXIED_HEADERS = ['content-type', 'content-disposition', 'location']
+
+
+class ResponseCache:
+    """GET responses of the primary, so a page or report is fetched once for every display."""
+
+    entries: dict[str, tuple[float, Response]]
+
+    def __init__(self, ttl_sec: float = RESPONSE_CACHE_TTL_SEC):
+        self.ttl_sec = ttl_sec
+        self.entries = {}
+
+    def get(self, key: str) -> Response | None:
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, key: str, response: Response):
+        self.entries[key] = (time.monotonic() + self.ttl_sec, response)
+
+    def handle_message(self, message_type: str):
+        if message_type in RESPONSE_CACHE_TOPICS:
+            self.entries.clear()
+
+
+def create_mirror_app(primary_url: str) -> fastapi.FastAPI:
+    """Builds the app of a read-only mirror of the primary server at `primary_url`.
+
+    The websockets and event streams of the audience, bracket, rankings and Twitch displays and
+    /api/ws are served from one subscription to the primary; any other GET is fetched from the
+    primary and cached.
+    """
+    cache = ResponseCache()
+    client = ws.MirrorClient(primary_url, on_message=cache.handle_message)
+    http = httpx.AsyncClient(base_url=client.primary_url)
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app: fastapi.FastAPI):
+        client_task = asyncio.create_task(client.run())
+        yield
+        client_task.cancel()
+        await http.aclose()
+
+    app = fastapi.FastAPI(lifespan=lifespan)
+    app.mount('/static', StaticFiles(directory='static'), name='static')
+
+    @app.websocket('/api/ws')
+    async def multiplex_websocket(websocket: WebSocket):
+        await ws.handle_relayed_websocket(websocket, client)
+
+    @app.websocket('/api/displays/{display}/websocket')
+    async def display_websocket(display: str, websocket: WebSocket):
+        topics = MIRROR_DISPLAY_TOPICS.get(display)
+        if topics is None:
+            await websocket.close(1008, 'Display is not served by a mirror')
+            return
+
+        await ws.accept(websocket)
+        await client.ready.wait()
+        notifiers_task = asyncio.create_task(
+            ws.handle_notifiers(websocket, *[client.notifiers[topic] for topic in topics])
+        )
+        try:
+            while True:
+                ws.handle_protocol_message(
+                    websocket, await ws.receive_message(websocket), client.time_offset_ms
+                )
+        except WebSocketDisconnect:
+            pass
+        finally:
+            notifiers_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await notifiers_task
+
+    @app.get('/api/displays/{display}/events')
+    async def display_events(display: str, request: Request) -> Response:
+        topics = MIRROR_DISPLAY_TOPICS.get(display)
+        if topics is None:
+            return Response('Display is not served by a mirror', 404)
+
+        await client.ready.wait()
+        return ws.EventStreamResponse(request, *[client.notifiers[topic] for topic in topics])
+
+    @app.get('/api/time')
+    async def server_time(response: Response, client_time_ms: float | None = None) -> dict:
+        # Never proxied and cached, and given in the primary's clock like time_sync replies.
+        response.headers['cache-control'] = 'no-store'
+        return ws.get_time_sync_reply(client_time_ms, client.time_offset_ms)
+
+    @app.get('/{path:path}')
+    async def proxy(request: Request, path: str) -> Response:
+        key = f'/{path}?{request.url.query}'
+        response = cache.get(key)
+        if response is not None:
+            return response
+
+        try:
+            primary_response = await http.get(f'/{path}', params=request.query_params)
+        except httpx.HTTPError:
+            return Response('Primary server is not reachable', 502)
+        response = Response(
+            primary_response.content,
+            primary_response.status_code,
+            {
+                name: value
+                for name, value in primary_response.headers.items()
+                if name in PROXIED_HEADERS
+            },
+        )
+        if primary_response.status_code == 200:
+            cache.put(key, response)
+        return response
+
+    return app
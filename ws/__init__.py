@@ -1 +1,21 @@
-from .notifier import Notifier, handle_notifiers, write_notifier
+from .encoding import WebSocketProtocol, accept, receive_message, send_message
+from .listener import Listener, OverflowPolicy
+from .mirror import MirrorClient
+from .notifier import (
+    Notifier,
+    create_listener,
+    enqueue_error,
+    get_stats,
+    get_time_sync_reply,
+    handle_notifiers,
+    handle_protocol_message,
+    handle_resync,
+    handle_subscription,
+    handle_time_sync,
+    parse_resume,
+    subscribe,
+    unsubscribe,
+    write_notifier,
+)
+from .relay import RelayClient, RelayServer, describe_topics, handle_relayed_websocket
+from .sse import EventStreamListener, EventStreamResponse
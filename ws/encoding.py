@@ -0,0 +1,119 @@
+import functools
+import zlib
+from typing import Any
+
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect
+from uvicorn.protocols.websockets.websockets_impl import (
+    WebSocketProtocol as UvicornWebSocketProtocol,
+)
+
+try:
+    import msgpack
+except ImportError:
+    # Without msgpack the subprotocol is never negotiated and those clients get JSON.
+    msgpack = None
+
+MSGPACK_SUBPROTOCOL = 'msgpack'
+DEFLATE_SUBPROTOCOL = 'deflate'
+SUBPROTOCOLS = [MSGPACK_SUBPROTOCOL, DEFLATE_SUBPROTOCOL] if msgpack else [DEFLATE_SUBPROTOCOL]
+# Frames below this size, such as match_time ticks, are not worth deflating.
+COMPRESS_MIN_BYTES = 512
+COMPRESS_LEVEL = 6
+# Frames of recent broadcasts; every listener of a broadcast shares them until they are sent.
+ENCODED_FRAME_CACHE_SIZE = 64
+
+
+async def accept(websocket: WebSocket):
+    """Accepts a websocket with the first subprotocol the client offers that is supported.
+
+    `msgpack` switches the connection to MessagePack binary frames. `deflate` keeps JSON but sends
+    frames of at least COMPRESS_MIN_BYTES as raw deflate binary frames. Without either, or for a
+    client that offers none, every frame is JSON text.
+    """
+    subprotocol = next(
+        (
+            subprotocol
+            for subprotocol in websocket.scope.get('subprotocols', [])
+            if subprotocol in SUBPROTOCOLS
+        ),
+        None,
+    )
+    websocket.state.subprotocol = subprotocol
+    await websocket.accept(subprotocol=subprotocol)
+
+
+class WebSocketProtocol(UvicornWebSocketProtocol):
+    """Uvicorn's websocket protocol, keeping permessage-deflate off the `deflate` subprotocol.
+
+    Connections that negotiate `deflate` already get their large frames deflated once per
+    broadcast, so compressing them again per socket only costs CPU. Every other connection, such
+    as a mirror server's client, still gets permessage-deflate when it offers it.
+    """
+
+    def process_extensions(self, headers, available_extensions):
+        # The application has accepted the connection, and so chosen its subprotocol, by now.
+        if self.accepted_subprotocol == DEFLATE_SUBPROTOCOL:
+            return None, []
+        return super().process_extensions(headers, available_extensions)
+
+
+def get_subprotocol(websocket: WebSocket) -> str | None:
+    subprotocol = getattr(websocket.state, 'subprotocol', None)
+    return subprotocol if subprotocol in SUBPROTOCOLS else None
+
+
+def encode_frame(frame: str, subprotocol: str | None) -> str | bytes:
+    """Encodes a JSON text frame for a connection with the given subprotocol."""
+    if subprotocol == MSGPACK_SUBPROTOCOL:
+        return to_msgpack_frame(frame)
+    if subprotocol == DEFLATE_SUBPROTOCOL and len(frame) >= COMPRESS_MIN_BYTES:
+        return to_deflate_frame(frame)
+    return frame
+
+
+# Notifiers hand the same frame to every listener, so only the first listener to send a frame pays
+# for converting it.
+@functools.lru_cache(maxsize=ENCODED_FRAME_CACHE_SIZE)
+def to_msgpack_frame(frame: str) -> bytes:
+    return msgpack.packb(orjson.loads(frame))
+
+
+@functools.lru_cache(maxsize=ENCODED_FRAME_CACHE_SIZE)
+def to_deflate_frame(frame: str) -> bytes:
+    compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(frame.encode()) + compressor.flush()
+
+
+async def send_frame(websocket: WebSocket, frame: str):
+    data = encode_frame(frame, get_subprotocol(websocket))
+    if isinstance(data, bytes):
+        await websocket.send_bytes(data)
+    else:
+        await websocket.send_text(data)
+
+
+async def send_message(websocket: WebSocket, message: Any):
+    """Sends a JSON-compatible message in the encoding the websocket negotiated."""
+    if get_subprotocol(websocket) == MSGPACK_SUBPROTOCOL:
+        await websocket.send_bytes(msgpack.packb(message))
+    else:
+        await send_frame(websocket, orjson.dumps(message).decode())
+
+
+async def receive_message(websocket: WebSocket) -> Any:
+    """Receives a message sent as JSON text or as a binary frame in the negotiated encoding."""
+    message = await websocket.receive()
+    if message['type'] == 'websocket.disconnect':
+        raise WebSocketDisconnect(message.get('code', 1000), message.get('reason'))
+
+    data = message.get('bytes')
+    if data is None:
+        return orjson.loads(message['text'])
+
+    subprotocol = get_subprotocol(websocket)
+    if subprotocol == MSGPACK_SUBPROTOCOL:
+        return msgpack.unpackb(data)
+    if subprotocol == DEFLATE_SUBPROTOCOL:
+        return orjson.loads(zlib.decompress(data, -zlib.MAX_WBITS))
+    return orjson.loads(data)
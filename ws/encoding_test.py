@@ -0,0 +1,146 @@
+import asyncio
+import unittest
+import zlib
+from unittest.mock import AsyncMock
+
+import orjson
+import uvicorn
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.datastructures import State
+from uvicorn.server import ServerState
+from websockets.datastructures import Headers
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+from . import encoding
+from .listener import Listener
+
+
+def mock_websocket(subprotocols: list[str]) -> AsyncMock:
+    websocket = AsyncMock(spec=WebSocket)
+    websocket.scope = {'subprotocols': subprotocols}
+    websocket.state = State()
+    return websocket
+
+
+def score_frame(seq: int) -> str:
+    data = {name: [[False] * 3] * 12 for name in ['branches', 'branches_auto', 'branch_algaes']}
+    return orjson.dumps({'type': 'score', 'seq': seq, 'data': data}).decode()
+
+
+class TestEncoding(unittest.IsolatedAsyncioTestCase):
+    async def test_accept(self):
+        for subprotocols, subprotocol in [
+            (['deflate'], 'deflate'),
+            (['unknown', 'deflate'], 'deflate'),
+            (['unknown'], None),
+            ([], None),
+        ]:
+            websocket = mock_websocket(subprotocols)
+            await encoding.accept(websocket)
+            websocket.accept.assert_called_once_with(subprotocol=subprotocol)
+            self.assertEqual(encoding.get_subprotocol(websocket), subprotocol)
+
+    async def test_deflate(self):
+        websocket = mock_websocket(['deflate'])
+        await encoding.accept(websocket)
+
+        # Small messages stay text; large ones are deflated.
+        await encoding.send_message(websocket, {'type': 'match_time', 'data': {'sec': 3}})
+        websocket.send_text.assert_called_once_with('{"type":"match_time","data":{"sec":3}}')
+
+        frame = score_frame(1)
+        self.assertGreaterEqual(len(frame), encoding.COMPRESS_MIN_BYTES)
+        await encoding.send_frame(websocket, frame)
+        sent = websocket.send_bytes.call_args.args[0]
+        self.assertLess(len(sent), len(frame) / 4)
+        self.assertEqual(zlib.decompress(sent, -zlib.MAX_WBITS).decode(), frame)
+
+        websocket.receive.return_value = {'type': 'websocket.receive', 'bytes': sent}
+        self.assertEqual(await encoding.receive_message(websocket), orjson.loads(frame))
+        websocket.receive.return_value = {'type': 'websocket.disconnect', 'code': 1001}
+        with self.assertRaises(WebSocketDisconnect):
+            await encoding.receive_message(websocket)
+
+    async def test_deflate_listener(self):
+        frame = score_frame(2)
+        websockets = [mock_websocket(['deflate']) for _ in range(3)]
+        listeners = [Listener(websocket, subprotocol='deflate') for websocket in websockets]
+        tasks = [asyncio.create_task(listener.run()) for listener in listeners]
+        encoding.to_deflate_frame.cache_clear()
+        for listener in listeners:
+            listener.enqueue('score', frame)
+            listener.enqueue('ping', '{"type":"ping","data":{}}')
+        await asyncio.sleep(0)
+
+        for websocket in websockets:
+            websocket.send_text.assert_called_once_with('{"type":"ping","data":{}}')
+            sent = websocket.send_bytes.call_args.args[0]
+            self.assertEqual(zlib.decompress(sent, -zlib.MAX_WBITS).decode(), frame)
+        # The frame is compressed once and shared by every listener.
+        self.assertEqual(encoding.to_deflate_frame.cache_info().misses, 1)
+
+        for listener, task in zip(listeners, tasks, strict=True):
+            listener.close()
+            await task
+
+    async def test_per_message_deflate(self):
+        protocol = encoding.WebSocketProtocol(
+            config=uvicorn.Config(None), server_state=ServerState(), app_state={}
+        )
+        headers = Headers({'Sec-WebSocket-Extensions': 'permessage-deflate'})
+        extensions = [ServerPerMessageDeflateFactory()]
+        for subprotocol, extension_header in [
+            (None, 'permessage-deflate'),
+            ('msgpack', 'permessage-deflate'),
+            # Frames are already deflated once per broadcast.
+            ('deflate', None),
+        ]:
+            protocol.accepted_subprotocol = subprotocol
+            self.assertEqual(
+                protocol.process_extensions(headers, extensions)[0], extension_header, subprotocol
+            )
+
+
+@unittest.skipIf(encoding.msgpack is None, 'msgpack is not installed')
+class TestMsgpackEncoding(unittest.IsolatedAsyncioTestCase):
+    async def test_accept(self):
+        websocket = mock_websocket(['msgpack', 'deflate'])
+        await encoding.accept(websocket)
+        websocket.accept.assert_called_once_with(subprotocol='msgpack')
+        self.assertEqual(encoding.get_subprotocol(websocket), 'msgpack')
+
+    async def test_send_and_receive(self):
+        message = {'type': 'leave', 'data': {'position': 1, 'state': True}}
+        websocket = mock_websocket(['msgpack'])
+        await encoding.accept(websocket)
+        await encoding.send_message(websocket, message)
+        sent = websocket.send_bytes.call_args.args[0]
+        self.assertEqual(encoding.msgpack.unpackb(sent), message)
+
+        websocket.receive.return_value = {'type': 'websocket.receive', 'bytes': sent}
+        self.assertEqual(await encoding.receive_message(websocket), message)
+        websocket.receive.return_value = {
+            'type': 'websocket.receive',
+            'text': orjson.dumps(message).decode(),
+        }
+        self.assertEqual(await encoding.receive_message(websocket), message)
+
+    async def test_msgpack_listener(self):
+        frame = score_frame(3)
+        websockets = [mock_websocket(['msgpack']) for _ in range(3)]
+        listeners = [Listener(websocket, subprotocol='msgpack') for websocket in websockets]
+        tasks = [asyncio.create_task(listener.run()) for listener in listeners]
+        encoding.to_msgpack_frame.cache_clear()
+        for listener in listeners:
+            listener.enqueue('score', frame)
+        await asyncio.sleep(0)
+
+        sent = [websocket.send_bytes.call_args.args[0] for websocket in websockets]
+        self.assertEqual(encoding.msgpack.unpackb(sent[0]), orjson.loads(frame))
+        self.assertLess(len(sent[0]), len(frame))
+        # The frame is converted once and shared by every binary listener.
+        self.assertEqual(encoding.to_msgpack_frame.cache_info().misses, 1)
+
+        for listener, task in zip(listeners, tasks, strict=True):
+            listener.close()
+            await task
@@ -0,0 +1,85 @@
+from typing import Any
+
+
+def escape_pointer_token(token: str) -> str:
+    return token.replace('~', '~0').replace('/', '~1')
+
+
+def unescape_pointer_token(token: str) -> str:
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def make_patch(old: Any, new: Any, path: str = '') -> list[dict]:
+    """Builds the RFC 6902 operations that turn one JSON document into another.
+
+    Both documents must be plain JSON data (dicts with string keys, lists and scalars). Lists
+    are compared element by element, so a change inside a nested score matrix produces a single
+    `replace` for the changed cell rather than a copy of the whole matrix.
+    """
+    if type(old) is not type(new):
+        return [{'op': 'replace', 'path': path, 'value': new}]
+
+    if isinstance(new, dict):
+        patch = []
+        for key in old:
+            if key not in new:
+                patch.append({'op': 'remove', 'path': f'{path}/{escape_pointer_token(key)}'})
+        for key, value in new.items():
+            key_path = f'{path}/{escape_pointer_token(key)}'
+            if key not in old:
+                patch.append({'op': 'add', 'path': key_path, 'value': value})
+            else:
+                patch.extend(make_patch(old[key], value, key_path))
+        return patch
+
+    if isinstance(new, list):
+        patch = []
+        common_length = min(len(old), len(new))
+        for i in range(common_length):
+            patch.extend(make_patch(old[i], new[i], f'{path}/{i}'))
+        for i in range(common_length, len(new)):
+            patch.append({'op': 'add', 'path': f'{path}/{i}', 'value': new[i]})
+        # Remove from the end so the remaining indices stay valid while applying.
+        for i in reversed(range(common_length, len(old))):
+            patch.append({'op': 'remove', 'path': f'{path}/{i}'})
+        return patch
+
+    if old != new:
+        return [{'op': 'replace', 'path': path, 'value': new}]
+    return []
+
+
+def apply_patch(document: Any, patch: list[dict]) -> Any:
+    """Applies `add`, `remove` and `replace` operations in place and returns the document."""
+    for operation in patch:
+        path = operation['path']
+        if path == '':
+            document = operation['value']
+            continue
+
+        tokens = [unescape_pointer_token(token) for token in path.split('/')[1:]]
+        parent = document
+        for token in tokens[:-1]:
+            parent = parent[int(token)] if isinstance(parent, list) else parent[token]
+
+        key = tokens[-1]
+        op = operation['op']
+        if isinstance(parent, list):
+            index = len(parent) if key == '-' else int(key)
+            if op == 'add':
+                parent.insert(index, operation['value'])
+            elif op == 'remove':
+                del parent[index]
+            elif op == 'replace':
+                parent[index] = operation['value']
+            else:
+                raise ValueError(f'Unsupported patch operation: {op}')
+        else:
+            if op in ['add', 'replace']:
+                parent[key] = operation['value']
+            elif op == 'remove':
+                del parent[key]
+            else:
+                raise ValueError(f'Unsupported patch operation: {op}')
+
+    return document
@@ -0,0 +1,54 @@
+import copy
+import unittest
+
+from .json_patch import apply_patch, make_patch
+
+
+class TestJsonPatch(unittest.TestCase):
+    def assertRoundTrip(self, old, new):
+        patch = make_patch(old, new)
+        self.assertEqual(apply_patch(copy.deepcopy(old), patch), new)
+        return patch
+
+    def test_scalars(self):
+        self.assertEqual(make_patch(1, 1), [])
+        self.assertEqual(self.assertRoundTrip(1, 2), [{'op': 'replace', 'path': '', 'value': 2}])
+        self.assertEqual(
+            self.assertRoundTrip(1, True), [{'op': 'replace', 'path': '', 'value': True}]
+        )
+
+    def test_dicts(self):
+        old = {'match_state': 3, 'red': {'score': 10, 'fouls': []}, 'removed': 'x'}
+        new = {'match_state': 3, 'red': {'score': 14, 'fouls': []}, 'added/key~': 1}
+        self.assertEqual(
+            self.assertRoundTrip(old, new),
+            [
+                {'op': 'remove', 'path': '/removed'},
+                {'op': 'replace', 'path': '/red/score', 'value': 14},
+                {'op': 'add', 'path': '/added~1key~0', 'value': 1},
+            ],
+        )
+
+    def test_lists(self):
+        branches = [[False] * 3 for _ in range(12)]
+        new_branches = copy.deepcopy(branches)
+        new_branches[7][2] = True
+        self.assertEqual(
+            self.assertRoundTrip({'branches': branches}, {'branches': new_branches}),
+            [{'op': 'replace', 'path': '/branches/7/2', 'value': True}],
+        )
+
+        self.assertEqual(
+            self.assertRoundTrip([1, 2], [1, 2, 3, 4]),
+            [{'op': 'add', 'path': '/2', 'value': 3}, {'op': 'add', 'path': '/3', 'value': 4}],
+        )
+        self.assertEqual(
+            self.assertRoundTrip([1, 2, 3, 4], [5]),
+            [
+                {'op': 'replace', 'path': '/0', 'value': 5},
+                {'op': 'remove', 'path': '/3'},
+                {'op': 'remove', 'path': '/2'},
+                {'op': 'remove', 'path': '/1'},
+            ],
+        )
+        self.assertRoundTrip({'fouls': [{'rule_id': 1}]}, {'fouls': [{'rule_id': 1}, {'id': 2}]})
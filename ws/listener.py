@@ -0,0 +1,223 @@
+import asyncio
+import contextlib
+import time
+from collections import deque
+from enum import IntEnum
+from typing import Any
+
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.requests import HTTPConnection
+
+from .encoding import encode_frame
+
+NOTIFY_QUEUE_SIZE = 5
+HEARTBEAT_INTERVAL_SEC = 10
+PING_FRAME = '{"type":"ping","data":{}}'
+
+
+class OverflowPolicy(IntEnum):
+    DROP_OLDEST = 0
+    COALESCE = 1
+    DISCONNECT = 2
+
+
+DEFAULT_OVERFLOW_POLICY = OverflowPolicy.COALESCE
+
+
+class Listener:
+    """A websocket connection and the messages waiting to be written to it.
+
+    Notifiers only append encoded frames to the bounded queue, which never blocks; a single writer
+    task per connection drains it, so a slow client can fall behind without holding up the
+    notifier or any other client. What happens when the queue is full is set by the overflow
+    policy.
+
+    The writer also keeps the connection alive: after a heartbeat interval without any message it
+    sends a ping, and a failed write is how a vanished client is noticed. No other task is needed
+    per connection, whatever the number of notifiers it listens to.
+
+    Frames are queued as JSON text and converted when they are written to a listener that
+    negotiated MessagePack or compression.
+
+    Listeners that opted into deltas get patch frames for notifiers that produce them, as long as
+    every earlier message of that type has made it into the queue. Whenever one is dropped or
+    replaced, the next message of that type falls back to its full snapshot so the client never
+    applies a patch on top of a version it did not receive.
+
+    Every listener also keeps statistics of its writes, so the client that falls behind can be
+    told apart from the rest: when it last got a message, how long its writes took in total, how
+    much is waiting in its queue and how many messages it lost.
+    """
+
+    websocket: WebSocket
+    connection: HTTPConnection | None
+    queue: deque[tuple[str, str, str | None]]
+    queue_size: int
+    overflow_policy: OverflowPolicy
+    heartbeat_interval_sec: float
+    delta: bool
+    subprotocol: str | None
+    delta_seqs: dict[str, int]
+    resume_seqs: dict[str, int]
+    notifiers: dict[str, Any]
+    closed: bool
+    overflowed: bool
+    dropped_count: int
+    sent_count: int
+    sent_bytes: int
+    send_time_ns: int
+    last_send_time: float | None
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+        overflow_policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY,
+        delta: bool = False,
+        heartbeat_interval_sec: float = HEARTBEAT_INTERVAL_SEC,
+        subprotocol: str | None = None,
+    ):
+        self.websocket = websocket
+        self.connection = websocket
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.heartbeat_interval_sec = heartbeat_interval_sec
+        self.delta = delta
+        self.subprotocol = subprotocol
+        self.delta_seqs = {}
+        self.resume_seqs = {}
+        self.notifiers = {}
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.overflowed = False
+        self.dropped_count = 0
+        self.sent_count = 0
+        self.sent_bytes = 0
+        self.send_time_ns = 0
+        self.last_send_time = None
+
+    def enqueue(
+        self, message_type: str, frame: str, patch_frame: str | None = None, seq: int | None = None
+    ):
+        """Queues a message; `seq` marks a versioned frame and `patch_frame` its delta."""
+        if self.closed:
+            return
+
+        if len(self.queue) >= self.queue_size:
+            self.overflowed = True
+            if self.overflow_policy == OverflowPolicy.DISCONNECT:
+                self.close()
+                return
+
+            self.dropped_count += 1
+            if self.overflow_policy == OverflowPolicy.COALESCE and self.replace(
+                message_type, frame, seq
+            ):
+                return
+
+            self.drop_oldest()
+
+        if seq is None:
+            self.queue.append((message_type, frame, None))
+        else:
+            if (
+                self.delta
+                and patch_frame is not None
+                and self.delta_seqs.get(message_type) == (seq - 1)
+            ):
+                self.queue.append((message_type, patch_frame, frame))
+            else:
+                self.queue.append((message_type, frame, frame))
+            self.delta_seqs[message_type] = seq
+        self.ready.set()
+
+    def replace(self, message_type: str, frame: str, seq: int | None) -> bool:
+        """Replaces the newest queued message of the same type, keeping its place."""
+        for i in reversed(range(len(self.queue))):
+            if self.queue[i][0] == message_type:
+                # The replaced message never reaches the client, so a versioned message has to go
+                # out as a full snapshot.
+                self.queue[i] = (message_type, frame, None if seq is None else frame)
+                if seq is not None:
+                    self.delta_seqs[message_type] = seq
+                return True
+        return False
+
+    def drop_oldest(self):
+        message_type, _, full_frame = self.queue.popleft()
+        if full_frame is None:
+            return
+
+        for i, (queued_message_type, _, queued_full_frame) in enumerate(self.queue):
+            if queued_message_type == message_type:
+                self.queue[i] = (message_type, queued_full_frame, queued_full_frame)
+                return
+        self.delta_seqs.pop(message_type, None)
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        self.ready.set()
+
+    @property
+    def queued_bytes(self) -> int:
+        return sum(len(frame) for _, frame, _ in self.queue)
+
+    def to_dict(self) -> dict[str, Any]:
+        client = self.connection.client if self.connection is not None else None
+        return {
+            'client': f'{client.host}:{client.port}' if client is not None else '',
+            'path': self.connection.url.path if self.connection is not None else '',
+            'topics': list(self.notifiers),
+            'delta': self.delta,
+            'subprotocol': self.subprotocol,
+            'queue_length': len(self.queue),
+            'queued_bytes': self.queued_bytes,
+            'sent_count': self.sent_count,
+            'sent_bytes': self.sent_bytes,
+            'send_time_us': self.send_time_ns // 1000,
+            'last_send_age_sec': (
+                None if self.last_send_time is None else time.monotonic() - self.last_send_time
+            ),
+            'dropped_count': self.dropped_count,
+            'overflowed': self.overflowed,
+        }
+
+    async def run(self):
+        """Writes queued messages until the connection closes."""
+        try:
+            while not self.closed:
+                if not self.queue:
+                    self.ready.clear()
+                    try:
+                        async with asyncio.timeout(self.heartbeat_interval_sec):
+                            await self.ready.wait()
+                    except TimeoutError:
+                        self.enqueue('ping', PING_FRAME)
+                    continue
+
+                _, frame, _ = self.queue.popleft()
+                send_start_time_ns = time.perf_counter_ns()
+                await self.write(frame)
+                self.send_time_ns += time.perf_counter_ns() - send_start_time_ns
+                self.last_send_time = time.monotonic()
+                self.sent_count += 1
+                self.sent_bytes += len(frame)
+        except (WebSocketDisconnect, RuntimeError, OSError):
+            self.closed = True
+            return
+
+        if self.overflowed and self.overflow_policy == OverflowPolicy.DISCONNECT:
+            await self.close_overflowed()
+
+    async def write(self, frame: str):
+        data = encode_frame(frame, self.subprotocol)
+        if isinstance(data, bytes):
+            await self.websocket.send_bytes(data)
+        else:
+            await self.websocket.send_text(data)
+
+    async def close_overflowed(self):
+        with contextlib.suppress(RuntimeError, OSError):
+            await self.websocket.close(1008, 'Listener fell too far behind')
@@ -0,0 +1,184 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from .listener import Listener, OverflowPolicy
+
+
+def queued(listener: Listener) -> list[tuple[str, str]]:
+    return [(message_type, frame) for message_type, frame, _ in listener.queue]
+
+
+class TestListener(unittest.IsolatedAsyncioTestCase):
+    def test_drop_oldest(self):
+        listener = Listener(
+            AsyncMock(spec=WebSocket), queue_size=3, overflow_policy=OverflowPolicy.DROP_OLDEST
+        )
+        for i in range(5):
+            listener.enqueue('score', str(i))
+        self.assertEqual(queued(listener), [('score', '2'), ('score', '3'), ('score', '4')])
+        self.assertEqual(listener.dropped_count, 2)
+        self.assertFalse(listener.closed)
+
+    def test_coalesce(self):
+        listener = Listener(
+            AsyncMock(spec=WebSocket), queue_size=3, overflow_policy=OverflowPolicy.COALESCE
+        )
+        listener.enqueue('score', 's1')
+        listener.enqueue('time', 't1')
+        listener.enqueue('sound', 'match_end')
+        listener.enqueue('time', 't2')
+        listener.enqueue('score', 's2')
+        self.assertEqual(
+            queued(listener), [('score', 's2'), ('time', 't2'), ('sound', 'match_end')]
+        )
+        self.assertEqual(listener.dropped_count, 2)
+
+        # Falls back to dropping the oldest message when nothing of the same type is queued.
+        listener.enqueue('status', 'a1')
+        self.assertEqual(
+            queued(listener), [('time', 't2'), ('sound', 'match_end'), ('status', 'a1')]
+        )
+        self.assertEqual(listener.dropped_count, 3)
+
+    def test_coalesce_keeps_order(self):
+        listener = Listener(
+            AsyncMock(spec=WebSocket), queue_size=3, overflow_policy=OverflowPolicy.COALESCE
+        )
+        listener.enqueue('score', 's1')
+        listener.enqueue('score', 's2')
+        listener.enqueue('time', 't1')
+        listener.enqueue('score', 's3')
+        self.assertEqual(queued(listener), [('score', 's1'), ('score', 's3'), ('time', 't1')])
+
+    def test_delta(self):
+        listener = Listener(AsyncMock(spec=WebSocket), delta=True)
+        listener.enqueue('score', 'full1', seq=1)
+        listener.enqueue('score', 'full2', 'patch2', seq=2)
+        listener.enqueue('score', 'full4', 'patch4', seq=4)
+        listener.enqueue('score', 'full5', 'patch5', seq=5)
+        self.assertEqual(
+            queued(listener),
+            [('score', 'full1'), ('score', 'patch2'), ('score', 'full4'), ('score', 'patch5')],
+        )
+
+        listener = Listener(AsyncMock(spec=WebSocket), delta=False)
+        listener.enqueue('score', 'full1', seq=1)
+        listener.enqueue('score', 'full2', 'patch2', seq=2)
+        self.assertEqual(queued(listener), [('score', 'full1'), ('score', 'full2')])
+
+    def test_delta_overflow(self):
+        listener = Listener(
+            AsyncMock(spec=WebSocket),
+            queue_size=2,
+            overflow_policy=OverflowPolicy.COALESCE,
+            delta=True,
+        )
+        listener.enqueue('score', 'full1', seq=1)
+        listener.enqueue('time', 't1')
+        # Replacing patch 1 would leave the client without version 1, so version 2 goes out whole.
+        listener.enqueue('score', 'full2', 'patch2', seq=2)
+        self.assertEqual(queued(listener), [('score', 'full2'), ('time', 't1')])
+        listener.queue.popleft()
+        listener.enqueue('score', 'full3', 'patch3', seq=3)
+        self.assertEqual(queued(listener), [('time', 't1'), ('score', 'patch3')])
+
+        listener = Listener(
+            AsyncMock(spec=WebSocket),
+            queue_size=2,
+            overflow_policy=OverflowPolicy.DROP_OLDEST,
+            delta=True,
+        )
+        listener.enqueue('score', 'full1', seq=1)
+        listener.enqueue('score', 'full2', 'patch2', seq=2)
+        listener.enqueue('score', 'full3', 'patch3', seq=3)
+        # Dropping version 1 promotes the queued patch for version 2 to its full snapshot.
+        self.assertEqual(queued(listener), [('score', 'full2'), ('score', 'patch3')])
+
+        listener.enqueue('time', 't1')
+        listener.enqueue('time', 't2')
+        listener.enqueue('score', 'full4', 'patch4', seq=4)
+        self.assertEqual(queued(listener), [('time', 't2'), ('score', 'full4')])
+
+    async def test_disconnect(self):
+        websocket = AsyncMock(spec=WebSocket)
+        listener = Listener(websocket, queue_size=2, overflow_policy=OverflowPolicy.DISCONNECT)
+        listener.enqueue('score', '1')
+        listener.enqueue('score', '2')
+        self.assertFalse(listener.closed)
+        listener.enqueue('score', '3')
+        self.assertTrue(listener.closed)
+        self.assertEqual(len(listener.queue), 0)
+
+        listener.enqueue('score', '4')
+        self.assertEqual(len(listener.queue), 0)
+
+        await asyncio.wait_for(listener.run(), 1)
+        websocket.send_text.assert_not_called()
+        websocket.close.assert_called_once()
+
+    async def test_run(self):
+        websocket = AsyncMock(spec=WebSocket)
+        listener = Listener(websocket)
+        task = asyncio.create_task(listener.run())
+        listener.enqueue('score', '1')
+        listener.enqueue('time', '2')
+        await asyncio.sleep(0)
+        self.assertEqual([call.args[0] for call in websocket.send_text.call_args_list], ['1', '2'])
+        self.assertEqual(listener.sent_count, 2)
+
+        listener.close()
+        await asyncio.wait_for(task, 1)
+        websocket.close.assert_not_called()
+
+    async def test_stats(self):
+        websocket = AsyncMock(spec=WebSocket)
+        websocket.client.host = '10.0.100.21'
+        websocket.client.port = 50123
+        websocket.url.path = '/api/displays/queueing/websocket'
+        listener = Listener(websocket, queue_size=2, overflow_policy=OverflowPolicy.DROP_OLDEST)
+        stats = listener.to_dict()
+        self.assertEqual(stats['client'], '10.0.100.21:50123')
+        self.assertEqual(stats['path'], '/api/displays/queueing/websocket')
+        self.assertIsNone(stats['last_send_age_sec'])
+
+        listener.enqueue('score', 'abc')
+        listener.enqueue('score', 'defg')
+        listener.enqueue('score', 'hi')
+        stats = listener.to_dict()
+        self.assertEqual(stats['queue_length'], 2)
+        self.assertEqual(stats['queued_bytes'], 6)
+        self.assertEqual(stats['dropped_count'], 1)
+
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0)
+        stats = listener.to_dict()
+        self.assertEqual(stats['queued_bytes'], 0)
+        self.assertEqual(stats['sent_count'], 2)
+        self.assertEqual(stats['sent_bytes'], 6)
+        self.assertGreaterEqual(stats['last_send_age_sec'], 0)
+        listener.close()
+        await asyncio.wait_for(task, 1)
+
+    async def test_heartbeat(self):
+        websocket = AsyncMock(spec=WebSocket)
+        listener = Listener(websocket, heartbeat_interval_sec=0.02)
+        task = asyncio.create_task(listener.run())
+        await asyncio.sleep(0.05)
+        websocket.send_text.assert_called_with('{"type":"ping","data":{}}')
+        self.assertGreaterEqual(websocket.send_text.call_count, 2)
+
+        # A failed ping is how a client that vanished without closing is noticed.
+        websocket.send_text.side_effect = OSError()
+        await asyncio.wait_for(task, 1)
+        self.assertTrue(listener.closed)
+
+    async def test_run_stops_on_disconnect(self):
+        websocket = AsyncMock(spec=WebSocket)
+        websocket.send_text.side_effect = WebSocketDisconnect()
+        listener = Listener(websocket)
+        listener.enqueue('score', '1')
+        await asyncio.wait_for(listener.run(), 1)
+        self.assertTrue(listener.closed)
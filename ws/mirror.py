@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+from urllib.parse import urlencode
+
+import httpx
+import orjson
+import websockets
+
+from .listener import Listener
+from .relay import RECONNECT_DELAY_SEC, RELAY_REPLAY_SIZE, MirrorNotifier
+
+logger = logging.getLogger(__name__)
+
+TOPICS_PATH = '/api/ws/topics'
+WEBSOCKET_PATH = '/api/ws'
+TIME_SYNC_SAMPLES = 8
+TIME_SYNC_BURST_INTERVAL_SEC = 0.2
+TIME_SYNC_INTERVAL_SEC = 30
+
+
+class MirrorClient:
+    """Connection of a mirror server to the /api/ws websocket of a primary server.
+
+    Subscribes once to every topic of the primary, with deltas, and republishes the messages on a
+    MirrorNotifier per topic, so the primary carries a single connection however many displays
+    the mirror serves. After a lost connection it resumes from the last version of each topic.
+
+    The mirror also keeps its offset to the primary's clock with the same exchange as browsers
+    use, so clock syncs answered by the mirror agree with the primary's match_time timestamps.
+    Commands are not forwarded; a mirror is read only.
+    """
+
+    primary_url: str
+    notifiers: dict[str, MirrorNotifier]
+    ready: asyncio.Event
+    time_offset_ms: float
+    round_trip_ms: float
+    on_message: Callable[[str], None] | None
+
+    def __init__(
+        self,
+        primary_url: str,
+        on_message: Callable[[str], None] | None = None,
+        replay_size: int = RELAY_REPLAY_SIZE,
+    ):
+        self.primary_url = primary_url.rstrip('/')
+        self.on_message = on_message
+        self.replay_size = replay_size
+        self.notifiers = {}
+        self.ready = asyncio.Event()
+        self.time_offset_ms = 0
+        self.round_trip_ms = float('inf')
+        self.time_sync_samples = deque(maxlen=TIME_SYNC_SAMPLES)
+        self.websocket = None
+
+    async def run(self):
+        async with httpx.AsyncClient(base_url=self.primary_url) as http:
+            while True:
+                try:
+                    await self.sync_topics(http)
+                    async with websockets.connect(
+                        self.get_websocket_url(), max_size=None
+                    ) as websocket:
+                        self.websocket = websocket
+                        time_sync_task = asyncio.create_task(self.sync_time())
+                        try:
+                            async for frame in websocket:
+                                self.handle_frame(frame)
+                        finally:
+                            time_sync_task.cancel()
+                            self.websocket = None
+                except (OSError, httpx.HTTPError, websockets.WebSocketException) as e:
+                    logger.warning(f'Lost the connection to the primary, reconnecting: {e}')
+                self.ready.clear()
+                await asyncio.sleep(RECONNECT_DELAY_SEC)
+
+    async def sync_topics(self, http: httpx.AsyncClient):
+        response = await http.get(TOPICS_PATH)
+        response.raise_for_status()
+        for topic, stateful, delta, versioned in response.json():
+            if topic not in self.notifiers:
+                self.notifiers[topic] = MirrorNotifier(
+                    topic, stateful, delta, self.replay_size if versioned else 0
+                )
+
+    def get_websocket_url(self) -> str:
+        params = {'topics': ','.join(self.notifiers), 'delta': '1'}
+        resume = [
+            f'{topic}:{notifier.seq}'
+            for topic, notifier in self.notifiers.items()
+            if notifier.versioned and notifier.seq > 0
+        ]
+        if resume:
+            params['resume'] = ','.join(resume)
+        url = self.primary_url.replace('http', 'ws', 1)
+        return f'{url}{WEBSOCKET_PATH}?{urlencode(params)}'
+
+    def handle_frame(self, frame: str | bytes):
+        message = orjson.loads(frame)
+        message_type = message.get('type')
+        if message_type == 'time_sync':
+            self.handle_time_sync(message['data'])
+            return
+
+        notifier = self.notifiers.get(message_type)
+        if notifier is None:
+            return
+        if isinstance(frame, bytes):
+            frame = frame.decode()
+        if not notifier.publish_frame(frame, message):
+            self.send({'type': 'resync', 'data': {'type': message_type}})
+            return
+
+        if self.on_message is not None:
+            self.on_message(message_type)
+        if not self.ready.is_set() and all(
+            notifier.last_frame is not None
+            for notifier in self.notifiers.values()
+            if notifier.message_producer is not None
+        ):
+            # Every topic with a state has its first snapshot, so displays can be served.
+            self.ready.set()
+
+    def send(self, message: Any):
+        if self.websocket is not None:
+            asyncio.create_task(self.websocket.send(orjson.dumps(message).decode()))
+
+    async def sync_time(self):
+        num_samples = 0
+        while True:
+            self.send({'type': 'time_sync', 'data': {'client_time_ms': time.time_ns() / 1_000_000}})
+            num_samples += 1
+            await asyncio.sleep(
+                TIME_SYNC_BURST_INTERVAL_SEC
+                if num_samples < TIME_SYNC_SAMPLES
+                else TIME_SYNC_INTERVAL_SEC
+            )
+
+    def handle_time_sync(self, data: dict):
+        receive_time_ms = time.time_ns() / 1_000_000
+        round_trip_ms = receive_time_ms - data['client_time_ms']
+        if round_trip_ms < 0:
+            return
+
+        # The primary read its clock halfway through the round trip, as far as can be told; the
+        # sample with the shortest round trip leaves the least room for error.
+        self.time_sync_samples.append(
+            (round_trip_ms, data['server_time_ms'] - (data['client_time_ms'] + receive_time_ms) / 2)
+        )
+        self.round_trip_ms, self.time_offset_ms = min(self.time_sync_samples)
+
+    def connect(self, listener: Listener) -> int:
+        return id(listener)
+
+    def disconnect(self, connection_id: int):
+        pass
+
+    def send_command(self, connection_id: int, data: Any):
+        raise RuntimeError('Commands are not accepted by a mirror')
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+from unittest.mock import AsyncMock, patch
+
+import orjson
+from fastapi import WebSocket
+
+from .listener import Listener
+from .mirror import MirrorClient
+from .notifier import subscribe
+from .relay import MirrorNotifier
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestMirror(unittest.IsolatedAsyncioTestCase):
+    def create_client(self) -> MirrorClient:
+        client = MirrorClient('http://primary:8000/', on_message=self.messages.append)
+        client.notifiers = {
+            'score': MirrorNotifier('score', True, True, 4),
+            'play_sound': MirrorNotifier('play_sound', False, False, 4),
+            'match_timing': MirrorNotifier('match_timing', True, False, 0),
+        }
+        client.websocket = AsyncMock()
+        return client
+
+    def setUp(self):
+        self.messages = []
+
+    def test_websocket_url(self):
+        client = self.create_client()
+        self.assertEqual(
+            client.get_websocket_url(),
+            'ws://primary:8000/api/ws?topics=score%2Cplay_sound%2Cmatch_timing&delta=1',
+        )
+        client.notifiers['score'].seq = 12
+        self.assertTrue(client.get_websocket_url().endswith('&resume=score%3A12'))
+
+    async def test_handle_frame(self):
+        client = self.create_client()
+        client.handle_frame('{"type":"score","seq":4,"data":{"score":0,"fouls":[]}}')
+        self.assertFalse(client.ready.is_set())
+        client.handle_frame('{"type":"match_timing","data":{"auto_duration_sec":15}}')
+        self.assertTrue(client.ready.is_set())
+
+        websocket = AsyncMock(spec=WebSocket)
+        listener = Listener(websocket, delta=True)
+        writer_task = asyncio.create_task(listener.run())
+        await subscribe(listener, client.notifiers['score'])
+        patch_frame = '{"type":"score","seq":5,"patch":[{"op":"add","path":"/fouls/-","value":1}]}'
+        client.handle_frame(patch_frame)
+        await settle()
+        # Listeners get the primary's patch, and new listeners the snapshot rebuilt from it.
+        self.assertEqual(
+            [call.args[0] for call in websocket.send_text.call_args_list],
+            ['{"type":"score","seq":4,"data":{"score":0,"fouls":[]}}', patch_frame],
+        )
+        self.assertEqual(
+            orjson.loads(client.notifiers['score'].get_snapshot()[0]),
+            {'type': 'score', 'seq': 5, 'data': {'score': 0, 'fouls': [1]}},
+        )
+
+        # A patch after a gap cannot be applied, so a snapshot is requested instead.
+        client.handle_frame('{"type":"score","seq":7,"patch":[]}')
+        await settle()
+        client.websocket.send.assert_called_once_with('{"type":"resync","data":{"type":"score"}}')
+        self.assertEqual(client.notifiers['score'].seq, 5)
+        self.assertEqual(self.messages, ['score', 'match_timing', 'score'])
+
+        listener.close()
+        await writer_task
+
+    def test_handle_time_sync(self):
+        client = self.create_client()
+        for client_time_ms, server_time_ms, receive_time_ms in [
+            (1000, 1520, 1040),
+            (2000, 2505, 2010),
+            (3000, 3530, 3060),
+        ]:
+            with patch('time.time_ns', return_value=receive_time_ms * 1_000_000):
+                client.handle_time_sync(
+                    {'client_time_ms': client_time_ms, 'server_time_ms': server_time_ms}
+                )
+        # The sample with the shortest round trip wins.
+        self.assertEqual(client.round_trip_ms, 10)
+        self.assertEqual(client.time_offset_ms, 500)
+
+    def test_send_command(self):
+        with self.assertRaises(RuntimeError):
+            self.create_client().send_command(0, {'type': 'start_match'})
@@ -1,30 +1,100 @@
 import asyncio
+import time
+from collections import deque
 from collections.abc import Callable
 from typing import Any
 
+import orjson
 from fastapi import WebSocket, WebSocketDisconnect
+from pydantic import BaseModel
 
-NOTIFY_QUEUE_SIZE = 5
+from .encoding import get_subprotocol, send_frame
+from .json_patch import make_patch
+from .listener import DEFAULT_OVERFLOW_POLICY, NOTIFY_QUEUE_SIZE, Listener, OverflowPolicy
+
+ENCODE_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+# Marks a pending coalesced notification whose body is produced when it is flushed.
+PRODUCE_ON_FLUSH = object()
+# Marks a cached notifier whose body has to be produced again.
+STALE = object()
 
 
 class Notifier:
     """Notifier class."""
 
-    listeners: list[WebSocket]
+    listeners: list[Listener]
     message_type: str
     message_producer: Callable[..., Any] | None
+    coalesce_interval_sec: float | None
+    delta: bool
+    cache: bool
+    replay_size: int
+    replay_buffer: deque[tuple[int, str, str | None]]
+    seq: int
+    notify_count: int
+    fan_out_count: int
+    coalesced_count: int
+    message_count: int
+    encoded_bytes: int
+    encode_time_ns: int
 
-    def __init__(self, message_type: str, message_producer: Callable[..., Any] | None = None):
+    def __init__(
+        self,
+        message_type: str,
+        message_producer: Callable[..., Any] | None = None,
+        coalesce_interval_sec: float | None = None,
+        delta: bool = False,
+        cache: bool = False,
+        replay_size: int = 0,
+        relayed: bool = True,
+    ):
         """Create a new Notifier instance.
 
         Args:
             message_type (str): _description_
             message_producer (Callable[..., Any] | None, optional): _description_. Defaults to None.
+            coalesce_interval_sec (float | None, optional): When set, notifications are sent at
+                most once per interval with the newest message. Defaults to None.
+            delta (bool, optional): Number every message and send JSON patches against the
+                previous message to listeners that opted into deltas. Defaults to False.
+            cache (bool, optional): Keep the produced body and its encoded frame until the next
+                notify() or invalidate(), so new connections reuse them instead of calling the
+                producer again. Defaults to False.
+            replay_size (int, optional): Number every message and keep this many recent ones, so
+                a reconnecting client that says which version it last saw gets only what it
+                missed. Defaults to 0.
+            relayed (bool, optional): Pass the topic on to relay workers and mirrors. Topics about
+                this server's own connections turn it off, since a relay or mirror subscribed to
+                them would count as a listener for good. Defaults to True.
         """
         self.listeners = []
         self.message_type = message_type
         self.message_producer = message_producer
+        self.coalesce_interval_sec = coalesce_interval_sec
+        self.delta = delta
+        self.cache = cache
+        self.cached_body = STALE
+        self.cached_frame = None
+        self.replay_size = replay_size
+        self.replay_buffer = deque(maxlen=replay_size)
+        self.relayed = relayed
+        # Versions start from the wall clock, so a client resuming after a server restart holds a
+        # lower version than anything this process sends and falls back to a snapshot.
+        self.seq = time.time_ns() // 1_000_000
+        self.last_data = None
+        self.last_frame = None
         self.lock = asyncio.Lock()
+        self.notify_count = 0
+        self.fan_out_count = 0
+        self.coalesced_count = 0
+        self.message_count = 0
+        self.encoded_bytes = 0
+        self.encode_time_ns = 0
+        self.pending_message = None
+        self.flush_handle = None
+        self.last_flush_time = float('-inf')
 
     class MessageEnvelope:
         """Message envelope class."""
@@ -36,36 +106,44 @@ class Notifier:
             self.type = type
             self.data = data
 
-    async def connect(self, websocket: WebSocket):
+    async def connect(self, listener: Listener):
         """Connect a new listener.
 
         Args:
-            websocket (WebSocket): _description_
+            listener (Listener): _description_
         """
         async with self.lock:
-            self.listeners.append(websocket)
+            self.listeners.append(listener)
 
-    async def disconnect(self, websocket: WebSocket):
+    async def disconnect(self, listener: Listener):
         """Disconnect a listener.
 
         Args:
-            websocket (WebSocket): _description_
+            listener (Listener): _description_
         """
         async with self.lock:
-            self.listeners.remove(websocket)
-
-    async def listen(self, websocket: WebSocket):
-        """Listen for new listeners."""
-        try:
-            while True:
-                await asyncio.sleep(1)
-        except (WebSocketDisconnect, asyncio.CancelledError):
-            pass
-        finally:
-            await self.disconnect(websocket)
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    @property
+    def versioned(self) -> bool:
+        return self.delta or self.replay_size > 0
+
+    def invalidate(self):
+        """Drops the cached body after a change that is not followed by notify()."""
+        self.cached_body = STALE
+        self.cached_frame = None
+        self.last_frame = None
 
     async def notify(self):
         """Notify all listeners with a message."""
+        # Every notify follows a change to the state the body is produced from.
+        self.invalidate()
+        if self.coalesce_interval_sec is not None:
+            # The body is only produced once the coalesced notification is flushed.
+            self.coalesce(PRODUCE_ON_FLUSH)
+            return
+
         message_body = self.get_message_body()
         await self.notify_with_message(message_body)
 
@@ -75,59 +153,390 @@ class Notifier:
         Args:
             message (Any): _description_
         """
-        message = self.MessageEnvelope(type=self.message_type, data=message)
-        async with self.lock:
+        if self.coalesce_interval_sec is not None:
+            self.coalesce(message)
+            return
+
+        self.notify_count += 1
+        self.broadcast(message)
+
+    def coalesce(self, message: Any):
+        """Keep only the newest message and flush it at most once per coalesce interval."""
+        self.notify_count += 1
+        if not self.listeners:
+            # Nobody holds the last version any more, so the next snapshot starts a new one.
+            self.last_frame = None
+            return
+
+        if self.flush_handle is not None:
+            self.coalesced_count += 1
+        else:
+            loop = asyncio.get_running_loop()
+            delay_sec = max(self.last_flush_time + self.coalesce_interval_sec - loop.time(), 0)
+            self.flush_handle = loop.call_later(delay_sec, self.flush)
+        self.pending_message = message
+
+    def flush(self):
+        self.flush_handle = None
+        self.last_flush_time = asyncio.get_running_loop().time()
+        message = self.pending_message
+        self.pending_message = None
+        if message is PRODUCE_ON_FLUSH:
+            message = self.get_message_body()
+        self.broadcast(message)
+
+    def broadcast(self, message: Any):
+        if not self.listeners and (self.message_producer is not None or not self.replay_size):
+            # Nobody holds the last version any more, so the next snapshot starts a new one.
+            # Messages without a producer are still kept for clients that are about to resume.
+            self.last_frame = None
+            return
+
+        self.message_count += 1
+        encode_start_time_ns = time.perf_counter_ns()
+        if self.versioned:
+            with_patch = self.delta and any(listener.delta for listener in self.listeners)
+            frame, patch_frame = self.encode_version(message, with_patch)
+            self.encode_time_ns += time.perf_counter_ns() - encode_start_time_ns
+            self.encoded_bytes += len(frame) + len(patch_frame or '')
             for listener in self.listeners:
-                await self.notify_listener(listener, message)
+                listener.enqueue(self.message_type, frame, patch_frame, self.seq)
+                self.fan_out_count += 1
+            return
 
-    async def notify_listener(self, listener: WebSocket, message: MessageEnvelope):
-        """Notify a single listener with a message.
+        # Encode once and queue the same frame for every listener; the writes happen in each
+        # listener's own task, so a slow client never blocks the caller.
+        frame = encode_message(self.MessageEnvelope(type=self.message_type, data=message))
+        self.encode_time_ns += time.perf_counter_ns() - encode_start_time_ns
+        self.encoded_bytes += len(frame)
+        if self.cache and message is self.cached_body:
+            self.cached_frame = frame
+        for listener in self.listeners:
+            listener.enqueue(self.message_type, frame)
+            self.fan_out_count += 1
 
-        Args:
-            listener (WebSocket): _description_
-            message (MessageEnvelope): _description_
+    def encode_version(self, message: Any, with_patch: bool) -> tuple[str, str | None]:
+        """Numbers a new version of the message and encodes it as a snapshot and as a patch.
+
+        The patch is left out when there is no previous version to diff against, or when it would
+        not be smaller than the snapshot.
         """
-        await listener.send_json(vars(message))
+        data_json = orjson.dumps(message, default=encode_default, option=ENCODE_OPTIONS)
+        data = orjson.loads(data_json) if with_patch else None
+        self.seq += 1
+        frame = orjson.dumps(
+            {'type': self.message_type, 'seq': self.seq, 'data': orjson.Fragment(data_json)}
+        ).decode()
+
+        patch_frame = None
+        if data is not None and self.last_data is not None:
+            patch_frame = orjson.dumps(
+                {
+                    'type': self.message_type,
+                    'seq': self.seq,
+                    'patch': make_patch(self.last_data, data),
+                }
+            ).decode()
+            if len(patch_frame) >= len(frame):
+                patch_frame = None
+
+        self.last_data = data
+        self.last_frame = frame
+        if self.replay_size:
+            self.replay_buffer.append((self.seq, frame, patch_frame))
+        return frame, patch_frame
+
+    def get_snapshot(self) -> tuple[str, int]:
+        """Get the encoded latest version of a versioned notifier and its sequence number."""
+        if self.last_frame is None:
+            self.encode_version(self.get_message_body(), self.delta)
+        return self.last_frame, self.seq
+
+    def get_missed(self, seq: int) -> list[tuple[int, str, str | None]] | None:
+        """Get the buffered versions after `seq`, or None when some of them are not buffered."""
+        if seq > self.seq or (self.message_producer is not None and self.last_frame is None):
+            # Unknown version, or the state changed while nobody was listening.
+            return None
+
+        missed = [version for version in self.replay_buffer if version[0] > seq]
+        if len(missed) < self.seq - seq:
+            return None
+        return missed
+
+    def get_message_frame(self) -> str:
+        """Get the encoded message body."""
+        if self.cached_frame is not None:
+            return self.cached_frame
+
+        frame = encode_message(
+            self.MessageEnvelope(type=self.message_type, data=self.get_message_body())
+        )
+        if self.cache:
+            self.cached_frame = frame
+        return frame
 
     def get_message_body(self):
         """Get the message body."""
-        return self.message_producer() if self.message_producer else {}
+        if not self.cache:
+            return self.message_producer() if self.message_producer else {}
+
+        if self.cached_body is STALE:
+            self.cached_body = self.message_producer() if self.message_producer else {}
+        return self.cached_body
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            'type': self.message_type,
+            'listeners': len(self.listeners),
+            'notify_count': self.notify_count,
+            'coalesced_count': self.coalesced_count,
+            'message_count': self.message_count,
+            'encoded_bytes': self.encoded_bytes,
+            'encode_time_us': self.encode_time_ns // 1000,
+            'fan_out_count': self.fan_out_count,
+        }
 
 
-async def handle_notifiers(websocket: WebSocket, *notifiers: Notifier):
+async def handle_notifiers(
+    websocket: WebSocket,
+    *notifiers: Notifier,
+    overflow_policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY,
+    listener: Listener | None = None,
+):
+    """Supervises a websocket for its whole life in the calling task.
+
+    Registers one listener with every notifier, queues their current state, then writes messages
+    and heartbeats until the client goes away or the task is cancelled, and finally unregisters
+    from every notifier. A caller that queues replies of its own passes the listener it created.
+    """
+    if listener is None:
+        listener = create_listener(websocket, overflow_policy)
     try:
-        async with asyncio.TaskGroup() as tg:
-            for notifier in notifiers:
-                await notifier.connect(websocket)
-                tg.create_task(notifier.listen(websocket))
-
-                if notifier.message_producer is not None:
-                    await write_notifier(websocket, notifier)
-
-            async def heartbeat():
-                while True:
-                    try:
-                        await asyncio.sleep(10)
-                        await websocket.send_json({'type': 'ping', 'data': {}})
-                    except WebSocketDisconnect:
-                        tg.cancel()
-                        return  # 這樣外部可以捕捉到 WebSocketDisconnect
-                    except RuntimeError:
-                        return  # 避免 asyncio 被關閉時出錯
-
-            tg.create_task(heartbeat())
+        for notifier in notifiers:
+            await subscribe(listener, notifier)
+
+        await listener.run()
 
     except (WebSocketDisconnect, asyncio.CancelledError):
         pass
 
     finally:
+        listener.close()
         # 確保所有 notifier 也都會斷線
         for notifier in notifiers:
-            if websocket in notifier.listeners:
-                await notifier.disconnect(websocket)
+            await notifier.disconnect(listener)
 
 
-async def write_notifier(websocket: WebSocket, notifier: Notifier):
-    await websocket.send_json(
-        vars(notifier.MessageEnvelope(type=notifier.message_type, data=notifier.get_message_body()))
+def get_stats(notifiers: list[Notifier]) -> dict[str, list[dict[str, Any]]]:
+    """Totals of every topic, and the statistics of every listener with the slowest first.
+
+    A listener that falls behind has a growing queue, or lost messages once it was full; other
+    listeners of the same notifiers, such as a relay server, are left out.
+    """
+    listeners = dict[int, Listener]()
+    for notifier in notifiers:
+        for listener in notifier.listeners:
+            if isinstance(listener, Listener):
+                listeners[id(listener)] = listener
+
+    listener_stats = [listener.to_dict() for listener in listeners.values()]
+    listener_stats.sort(
+        key=lambda stats: (stats['queued_bytes'], stats['dropped_count']), reverse=True
     )
+    return {
+        'topics': [notifier.to_dict() for notifier in notifiers],
+        'listeners': listener_stats,
+    }
+
+
+def create_listener(
+    websocket: WebSocket, overflow_policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY
+) -> Listener:
+    """Creates the listener for a websocket from its `delta` and `resume` query parameters.
+
+    `resume` lists the last version the client saw of each topic, e.g. `match_load:12,score:40`.
+    """
+    listener = Listener(
+        websocket,
+        overflow_policy=overflow_policy,
+        delta=websocket.query_params.get('delta') == '1',
+        subprotocol=get_subprotocol(websocket),
+    )
+    listener.resume_seqs = parse_resume(websocket.query_params.get('resume', ''))
+    websocket.state.listener = listener
+    return listener
+
+
+def parse_resume(value: str) -> dict[str, int]:
+    """Parses the last version a client saw of each topic, e.g. `match_load:12,score:40`."""
+    resume_seqs = {}
+    for token in value.split(','):
+        message_type, _, seq = token.rpartition(':')
+        if message_type and seq.isdigit():
+            resume_seqs[message_type] = int(seq)
+    return resume_seqs
+
+
+async def subscribe(listener: Listener, notifier: Notifier):
+    """Registers a listener with a notifier and queues the notifier's current state.
+
+    A resuming listener only gets the messages it missed, when the notifier still has them.
+    """
+    if notifier.message_type in listener.notifiers:
+        return
+
+    await notifier.connect(listener)
+    listener.notifiers[notifier.message_type] = notifier
+    # Leave room for one snapshot per notifier on top of the regular backlog.
+    listener.queue_size = len(listener.notifiers) + NOTIFY_QUEUE_SIZE
+
+    resume_seq = listener.resume_seqs.pop(notifier.message_type, None)
+    if resume_seq is not None and notifier.versioned:
+        missed = notifier.get_missed(resume_seq)
+        # Catching up on state only pays off with a short run of patches; otherwise the snapshot
+        # is smaller. Messages without a producer can only be caught up by replaying them.
+        if missed is not None and (
+            not missed
+            or notifier.message_producer is None
+            or (listener.delta and notifier.delta and len(missed) <= NOTIFY_QUEUE_SIZE)
+        ):
+            listener.delta_seqs[notifier.message_type] = resume_seq
+            for seq, frame, patch_frame in missed:
+                listener.enqueue(notifier.message_type, frame, patch_frame, seq)
+            return
+
+    if notifier.versioned and notifier.message_producer is not None:
+        frame, seq = notifier.get_snapshot()
+        listener.enqueue(notifier.message_type, frame, seq=seq)
+    elif notifier.message_producer is not None:
+        listener.enqueue(notifier.message_type, notifier.get_message_frame())
+
+
+async def unsubscribe(listener: Listener, notifier: Notifier):
+    """Unregisters a listener from a notifier; messages already queued are still sent."""
+    await notifier.disconnect(listener)
+    listener.notifiers.pop(notifier.message_type, None)
+    listener.delta_seqs.pop(notifier.message_type, None)
+    listener.queue_size = len(listener.notifiers) + NOTIFY_QUEUE_SIZE
+
+
+async def handle_subscription(
+    listener: Listener, action: str, topics: list[str], notifiers: dict[str, Notifier]
+):
+    """Subscribes a listener to, or unsubscribes it from, the notifiers of the given topics."""
+    unknown_topics = [topic for topic in topics if topic not in notifiers]
+    if unknown_topics:
+        raise ValueError(f'Unknown topics: {", ".join(unknown_topics)}')
+
+    for topic in topics:
+        if action == 'subscribe':
+            await subscribe(listener, notifiers[topic])
+        else:
+            await unsubscribe(listener, notifiers[topic])
+
+
+def enqueue_error(listener: Listener, message: str):
+    # Errors go through the listener so they never interleave with its writes.
+    listener.enqueue(
+        'error', orjson.dumps({'type': 'error', 'data': {'message': message}}).decode()
+    )
+
+
+def handle_resync(websocket: WebSocket, data: Any) -> bool:
+    """Handles a client's request for a fresh snapshot after it missed a delta.
+
+    Returns whether the message was a resync request.
+    """
+    if not isinstance(data, dict) or data.get('type') != 'resync':
+        return False
+
+    listener = getattr(websocket.state, 'listener', None)
+    message_type = (data.get('data') or {}).get('type')
+    notifier = listener.notifiers.get(message_type) if listener is not None else None
+    if notifier is not None and notifier.delta:
+        frame, seq = notifier.get_snapshot()
+        listener.delta_seqs.pop(message_type, None)
+        listener.enqueue(message_type, frame, seq=seq)
+    return True
+
+
+def handle_time_sync(websocket: WebSocket, data: Any, server_time_offset_ms: float = 0) -> bool:
+    """Answers a client's clock sync request with the server's wall clock time.
+
+    The client sends its own time as `client_time_ms` and gets it back with `server_time_ms`, from
+    which it estimates the round trip and its offset to the server clock the way NTP does. The
+    reply goes through the listener so it never interleaves with its writes; time spent in the
+    queue only lengthens that sample's round trip, which the client weighs against the others.
+    A server relaying another one's messages passes its offset to that server's clock.
+
+    Returns whether the message was a clock sync request.
+    """
+    if not isinstance(data, dict) or data.get('type') != 'time_sync':
+        return False
+
+    listener = getattr(websocket.state, 'listener', None)
+    if listener is not None:
+        client_time_ms = (data.get('data') or {}).get('client_time_ms')
+        listener.enqueue(
+            'time_sync',
+            orjson.dumps(
+                {
+                    'type': 'time_sync',
+                    'data': get_time_sync_reply(client_time_ms, server_time_offset_ms),
+                }
+            ).decode(),
+        )
+    return True
+
+
+def get_time_sync_reply(client_time_ms: Any, server_time_offset_ms: float = 0) -> dict[str, Any]:
+    """The data of a clock sync reply, also served over HTTP to clients without a websocket."""
+    return {
+        'client_time_ms': client_time_ms,
+        'server_time_ms': time.time_ns() / 1_000_000 + server_time_offset_ms,
+    }
+
+
+def handle_protocol_message(
+    websocket: WebSocket, data: Any, server_time_offset_ms: float = 0
+) -> bool:
+    """Handles the messages every notifier websocket accepts besides its own commands.
+
+    Returns whether the message was one of them.
+    """
+    return handle_resync(websocket, data) or handle_time_sync(
+        websocket, data, server_time_offset_ms
+    )
+
+
+async def write_notifier(websocket: WebSocket, notifier: Notifier):
+    """Sends a notifier's current message to this websocket only, not to its other listeners."""
+    listener = getattr(websocket.state, 'listener', None)
+    if not isinstance(listener, Listener):
+        await send_frame(websocket, notifier.get_message_frame())
+        return
+
+    # Queued behind the listener's own writes rather than interleaved with them.
+    if (
+        notifier.versioned
+        and notifier.message_producer is not None
+        and listener.notifiers.get(notifier.message_type) is notifier
+    ):
+        # A numbered snapshot keeps the version chain of a topic this socket follows intact.
+        frame, seq = notifier.get_snapshot()
+        listener.delta_seqs.pop(notifier.message_type, None)
+        listener.enqueue(notifier.message_type, frame, seq=seq)
+    else:
+        listener.enqueue(notifier.message_type, notifier.get_message_frame())
+
+
+def encode_default(value: Any):
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if hasattr(value, 'to_dict'):
+        return value.to_dict()
+    raise TypeError(f'Type is not JSON serializable: {type(value).__name__}')
+
+
+def encode_message(message: Notifier.MessageEnvelope) -> str:
+    return orjson.dumps(vars(message), default=encode_default, option=ENCODE_OPTIONS).decode()
@@ -1,30 +1,63 @@
+import asyncio
 import logging
+import time
 import unittest
-from unittest.mock import AsyncMock, Mock
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import orjson
 from fastapi import WebSocket
+from pydantic import BaseModel
 
-from .notifier import Notifier
+from .json_patch import apply_patch
+from .listener import Listener
+from .notifier import (
+    Notifier,
+    get_stats,
+    get_time_sync_reply,
+    handle_notifiers,
+    handle_protocol_message,
+    handle_resync,
+    subscribe,
+    unsubscribe,
+    write_notifier,
+)
+
+
+def frame(type: str, data) -> str:
+    return orjson.dumps({'type': type, 'data': data}).decode()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
 
 
 class TestNotifier(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         logger = logging.getLogger()
         logger.propagate = False
+        self.writer_tasks = []
+
+    async def asyncTearDown(self):
+        for task in self.writer_tasks:
+            task.cancel()
+
+    async def connect(self, notifier: Notifier, websocket: WebSocket, **kwargs) -> Listener:
+        listener = Listener(websocket, **kwargs)
+        self.writer_tasks.append(asyncio.create_task(listener.run()))
+        await notifier.connect(listener)
+        return listener
 
     async def test_connect(self):
         notifier = Notifier(message_type='test', message_producer=self.message_generator)
-        websocket = AsyncMock(spec=WebSocket)
-        await notifier.connect(websocket)
-        websocket.accept.assert_called_once()
-        self.assertIn(websocket, notifier.listeners)
+        listener = await self.connect(notifier, AsyncMock(spec=WebSocket))
+        self.assertIn(listener, notifier.listeners)
 
-    def test_disconnect(self):
+    async def test_disconnect(self):
         notifier = Notifier(message_type='test', message_producer=self.message_generator)
-        websocket = Mock(spec=WebSocket)
-        notifier.listeners.add(websocket)
-        notifier.disconnect(websocket)
-        self.assertNotIn(websocket, notifier.listeners)
+        listener = await self.connect(notifier, AsyncMock(spec=WebSocket))
+        await notifier.disconnect(listener)
+        self.assertNotIn(listener, notifier.listeners)
 
     async def test_notifier(self):
         notifier = Notifier(message_type='test', message_producer=self.message_generator)
@@ -33,57 +66,428 @@ class TestNotifier(unittest.IsolatedAsyncioTestCase):
         await notifier.notify_with_message({})
 
         websocket = AsyncMock(spec=WebSocket)
-        await notifier.connect(websocket)
+        await self.connect(notifier, websocket)
 
         await notifier.notify()
-        websocket.send_json.assert_called_with({'type': 'test', 'payload': 'test_message'})
+        await settle()
+        websocket.send_text.assert_called_with(frame('test', 'test_message'))
 
         await notifier.notify_with_message(12345)
-        websocket.send_json.assert_called_with({'type': 'test', 'payload': 12345})
+        await settle()
+        websocket.send_text.assert_called_with(frame('test', 12345))
 
         await notifier.notify_with_message('message1')
         await notifier.notify_with_message('message2')
         await notifier.notify()
-        websocket.send_json.assert_any_call({'type': 'test', 'payload': 'message1'})
-        websocket.send_json.assert_any_call({'type': 'test', 'payload': 'message2'})
-        websocket.send_json.assert_any_call({'type': 'test', 'payload': 'test_message'})
+        await settle()
+        websocket.send_text.assert_any_call(frame('test', 'message1'))
+        websocket.send_text.assert_any_call(frame('test', 'message2'))
+        websocket.send_text.assert_any_call(frame('test', 'test_message'))
 
     async def test_multiple_listeners(self):
         notifier = Notifier(message_type='test2', message_producer=None)
-        listeners = [AsyncMock(spec=WebSocket) for _ in range(50)]
-        for listener in listeners:
-            await notifier.connect(listener)
+        websockets = [AsyncMock(spec=WebSocket) for _ in range(50)]
+        listeners = [await self.connect(notifier, websocket) for websocket in websockets]
 
         await notifier.notify()
         await notifier.notify_with_message('test_message')
+        await settle()
 
-        for listener in listeners:
-            listener.send_json.assert_any_call({'type': 'test2', 'payload': None})
-            listener.send_json.assert_any_call({'type': 'test2', 'payload': 'test_message'})
+        for websocket in websockets:
+            websocket.send_text.assert_any_call(frame('test2', {}))
+            websocket.send_text.assert_any_call(frame('test2', 'test_message'))
 
-        notifier.disconnect(listeners[4])
-        listeners[4].send_json.reset_mock()
+        await notifier.disconnect(listeners[4])
+        websockets[4].send_text.reset_mock()
         self.assertEqual(len(notifier.listeners), 49)
 
         await notifier.notify_with_message('test_message2')
-        listeners[4].send_json.assert_not_called()
+        await settle()
+        websockets[4].send_text.assert_not_called()
         for listener in notifier.listeners:
-            listener.send_json.assert_any_call({'type': 'test2', 'payload': 'test_message2'})
-
-        notifier.disconnect(listeners[16])
-        listeners[16].send_json.reset_mock()
-        notifier.disconnect(listeners[31])
-        listeners[31].send_json.reset_mock()
-        notifier.disconnect(listeners[47])
-        listeners[47].send_json.reset_mock()
+            listener.websocket.send_text.assert_any_call(frame('test2', 'test_message2'))
+
+        for i in [16, 31, 47]:
+            await notifier.disconnect(listeners[i])
+            websockets[i].send_text.reset_mock()
         self.assertEqual(len(notifier.listeners), 46)
 
         await notifier.notify_with_message('test_message3')
-        listeners[16].send_json.assert_not_called()
-        listeners[31].send_json.assert_not_called()
-        listeners[47].send_json.assert_not_called()
+        await settle()
+        websockets[16].send_text.assert_not_called()
+        websockets[31].send_text.assert_not_called()
+        websockets[47].send_text.assert_not_called()
         for listener in notifier.listeners:
-            listener.send_json.assert_any_call({'type': 'test2', 'payload': 'test_message3'})
+            listener.websocket.send_text.assert_any_call(frame('test2', 'test_message3'))
+
+    async def test_encodes_once_per_notify(self):
+        notifier = Notifier(message_type='test', message_producer=None)
+        listeners = [Listener(AsyncMock(spec=WebSocket)) for _ in range(10)]
+        for listener in listeners:
+            await notifier.connect(listener)
+
+        with patch('ws.notifier.orjson.dumps', wraps=orjson.dumps) as dumps:
+            await notifier.notify_with_message({'score': 12})
+        dumps.assert_called_once()
+
+        queued_frames = [listener.queue[0][1] for listener in listeners]
+        self.assertEqual(queued_frames[0], frame('test', {'score': 12}))
+        for queued_frame in queued_frames:
+            self.assertIs(queued_frame, queued_frames[0])
+        self.assertEqual(notifier.notify_count, 1)
+        self.assertEqual(notifier.fan_out_count, 10)
+
+    async def test_encodes_models(self):
+        class Message(BaseModel):
+            name: str
+            rankings: dict[int, int]
+
+        notifier = Notifier(
+            message_type='test',
+            message_producer=lambda: {'message': Message(name='Q1', rankings={254: 1})},
+        )
+        websocket = AsyncMock(spec=WebSocket)
+        await write_notifier(websocket, notifier)
+        websocket.send_text.assert_called_once_with(
+            frame('test', {'message': {'name': 'Q1', 'rankings': {'254': 1}}})
+        )
+
+    async def test_write_notifier_reaches_only_its_websocket(self):
+        notifier = Notifier('reload_displays', None, replay_size=4)
+        display_websocket = AsyncMock(spec=WebSocket)
+        await self.connect(notifier, display_websocket)
+        seq = notifier.seq
+
+        # The caller's listener is not subscribed to the topic, yet still gets the message.
+        websocket = AsyncMock(spec=WebSocket)
+        listener = Listener(websocket)
+        websocket.state.listener = listener
+        self.writer_tasks.append(asyncio.create_task(listener.run()))
+        await write_notifier(websocket, notifier)
+        await settle()
+
+        websocket.send_text.assert_called_once_with(frame('reload_displays', {}))
+        display_websocket.send_text.assert_not_called()
+        self.assertEqual(notifier.seq, seq)
+
+    async def test_slow_listener_does_not_block_notify(self):
+        notifier = Notifier(message_type='test', message_producer=None)
+        stalled_send = asyncio.Event()
+
+        async def stall(_):
+            await stalled_send.wait()
+
+        slow_websocket = AsyncMock(spec=WebSocket)
+        slow_websocket.send_text.side_effect = stall
+        fast_websocket = AsyncMock(spec=WebSocket)
+        slow_listener = await self.connect(notifier, slow_websocket)
+        await self.connect(notifier, fast_websocket)
+
+        for i in range(20):
+            await asyncio.wait_for(notifier.notify_with_message(i), 0.1)
+        await settle()
+
+        self.assertEqual(fast_websocket.send_text.call_count, 20)
+        self.assertEqual(slow_websocket.send_text.call_count, 1)
+        self.assertEqual(len(slow_listener.queue), slow_listener.queue_size)
+        self.assertGreater(slow_listener.dropped_count, 0)
+
+    async def test_coalesce(self):
+        state = {'score': 0}
+        notifier = Notifier('score', lambda: dict(state), coalesce_interval_sec=0.2)
+        websocket = AsyncMock(spec=WebSocket)
+        await self.connect(notifier, websocket)
+
+        # The first notification after a quiet period goes out on the next loop iteration.
+        await notifier.notify()
+        await settle()
+        websocket.send_text.assert_called_once_with(frame('score', {'score': 0}))
+
+        for i in range(1, 6):
+            state['score'] = i
+            await notifier.notify()
+        await settle()
+        self.assertEqual(websocket.send_text.call_count, 1)
+        self.assertEqual(notifier.coalesced_count, 4)
+
+        await asyncio.sleep(0.25)
+        await settle()
+        self.assertEqual(websocket.send_text.call_count, 2)
+        websocket.send_text.assert_called_with(frame('score', {'score': 5}))
+        self.assertEqual(notifier.notify_count, 6)
+
+        await notifier.notify_with_message({'score': 99})
+        await asyncio.sleep(0.25)
+        await settle()
+        websocket.send_text.assert_called_with(frame('score', {'score': 99}))
+
+    async def test_coalesce_without_listeners(self):
+        produced = []
+        notifier = Notifier('score', lambda: produced.append(1), coalesce_interval_sec=0.05)
+        await notifier.notify()
+        self.assertIsNone(notifier.flush_handle)
+        self.assertEqual(notifier.notify_count, 1)
+        self.assertEqual(produced, [])
+
+    async def test_cache(self):
+        state = {'match': 'Q1'}
+        produce_count = []
+
+        def produce():
+            produce_count.append(1)
+            return dict(state)
+
+        notifier = Notifier('match_load', produce, cache=True)
+        websockets = [AsyncMock(spec=WebSocket) for _ in range(30)]
+        for websocket in websockets:
+            await write_notifier(websocket, notifier)
+        self.assertEqual(len(produce_count), 1)
+        websockets[-1].send_text.assert_called_once_with(frame('match_load', {'match': 'Q1'}))
+
+        state['match'] = 'Q2'
+        await self.connect(notifier, websockets[0])
+        await notifier.notify()
+        self.assertEqual(len(produce_count), 2)
+        self.assertEqual(notifier.get_message_frame(), frame('match_load', {'match': 'Q2'}))
+        self.assertEqual(len(produce_count), 2)
+
+        state['match'] = 'Q3'
+        notifier.invalidate()
+        self.assertEqual(notifier.get_message_frame(), frame('match_load', {'match': 'Q3'}))
+        self.assertEqual(len(produce_count), 3)
+
+    async def test_handle_notifiers(self):
+        notifier = Notifier(message_type='test', message_producer=self.message_generator)
+        silent_notifier = Notifier(message_type='silent', message_producer=None)
+        websocket = AsyncMock(spec=WebSocket)
+        task_count = len(asyncio.all_tasks())
+        task = asyncio.create_task(handle_notifiers(websocket, notifier, silent_notifier))
+        await settle()
+        websocket.send_text.assert_called_once_with(frame('test', 'test_message'))
+        # A single task supervises the connection, whatever the number of notifiers.
+        self.assertEqual(len(asyncio.all_tasks()), task_count + 1)
+        self.assertEqual(len(notifier.listeners), 1)
+        self.assertEqual(len(silent_notifier.listeners), 1)
+
+        await silent_notifier.notify_with_message('hello')
+        await settle()
+        websocket.send_text.assert_called_with(frame('silent', 'hello'))
+
+        task.cancel()
+        await task
+        self.assertEqual(len(notifier.listeners), 0)
+        self.assertEqual(len(silent_notifier.listeners), 0)
+
+    async def test_subscribe(self):
+        notifier = Notifier(message_type='test', message_producer=self.message_generator)
+        silent_notifier = Notifier(message_type='silent', message_producer=None)
+        listener = Listener(AsyncMock(spec=WebSocket))
+
+        await subscribe(listener, notifier)
+        await subscribe(listener, notifier)
+        await subscribe(listener, silent_notifier)
+        self.assertEqual(notifier.listeners, [listener])
+        self.assertEqual(listener.notifiers, {'test': notifier, 'silent': silent_notifier})
+        self.assertEqual(list(listener.queue), [('test', frame('test', 'test_message'), None)])
+        self.assertEqual(listener.queue_size, 7)
+
+        await unsubscribe(listener, notifier)
+        await notifier.notify()
+        self.assertEqual(notifier.listeners, [])
+        self.assertEqual(listener.notifiers, {'silent': silent_notifier})
+        self.assertEqual(len(listener.queue), 1)
+        self.assertEqual(listener.queue_size, 6)
+
+    async def test_delta(self):
+        state = {'score': {'red': 0, 'blue': 0}, 'branches': [[False] * 3] * 12, 'fouls': []}
+        notifier = Notifier('score', lambda: state, delta=True)
+        delta_websocket = AsyncMock(spec=WebSocket)
+        full_websocket = AsyncMock(spec=WebSocket)
+        delta_listener = await self.connect(notifier, delta_websocket, delta=True)
+        await self.connect(notifier, full_websocket)
+        first_seq = notifier.seq + 1
+
+        frame, seq = notifier.get_snapshot()
+        delta_listener.enqueue('score', frame, seq=seq)
+        for red_score in [4, 10]:
+            state['score']['red'] = red_score
+            await notifier.notify()
+        state['fouls'].append({'rule_id': 3})
+        await notifier.notify()
+        await settle()
+
+        messages = [orjson.loads(call.args[0]) for call in delta_websocket.send_text.call_args_list]
+        self.assertEqual([message['seq'] - first_seq for message in messages], [0, 1, 2, 3])
+        self.assertEqual(
+            messages[1]['patch'], [{'op': 'replace', 'path': '/score/red', 'value': 4}]
+        )
+        document = messages[0]['data']
+        for message in messages[1:]:
+            document = apply_patch(document, message['patch'])
+        self.assertEqual(document, state)
+
+        full_messages = [
+            orjson.loads(call.args[0]) for call in full_websocket.send_text.call_args_list
+        ]
+        self.assertEqual([message['seq'] - first_seq for message in full_messages], [1, 2, 3])
+        self.assertEqual(full_messages[-1]['data'], state)
+
+    async def test_resync(self):
+        state = {'score': 0, 'branches': [[False] * 3] * 12}
+        notifier = Notifier('score', lambda: state, delta=True)
+        websocket = AsyncMock(spec=WebSocket)
+        websocket.query_params = {'delta': '1'}
+        first_seq = notifier.seq + 1
+        task = asyncio.create_task(handle_notifiers(websocket, notifier))
+        await settle()
+        self.assertEqual(
+            orjson.loads(websocket.send_text.call_args.args[0]),
+            {
+                'type': 'score',
+                'seq': first_seq,
+                'data': {'score': 0, 'branches': state['branches']},
+            },
+        )
+
+        state['score'] = 5
+        await notifier.notify()
+        await settle()
+        self.assertIn('patch', orjson.loads(websocket.send_text.call_args.args[0]))
+
+        self.assertFalse(handle_resync(websocket, {'type': 'commit_match'}))
+        self.assertTrue(handle_resync(websocket, {'type': 'resync', 'data': {'type': 'score'}}))
+        await settle()
+        self.assertEqual(
+            orjson.loads(websocket.send_text.call_args.args[0]),
+            {
+                'type': 'score',
+                'seq': first_seq + 1,
+                'data': {'score': 5, 'branches': state['branches']},
+            },
+        )
+
+        task.cancel()
+        await task
+
+    async def test_time_sync(self):
+        notifier = Notifier('match_time', lambda: {'match_state': 0})
+        websocket = AsyncMock(spec=WebSocket)
+        websocket.query_params = {}
+        task = asyncio.create_task(handle_notifiers(websocket, notifier))
+        await settle()
+
+        self.assertFalse(handle_protocol_message(websocket, {'type': 'commit_match'}))
+        before_ms = time.time_ns() / 1_000_000
+        self.assertTrue(
+            handle_protocol_message(websocket, {'type': 'time_sync', 'data': {'client_time_ms': 5}})
+        )
+        after_ms = time.time_ns() / 1_000_000
+        await settle()
+        message = orjson.loads(websocket.send_text.call_args.args[0])
+        self.assertEqual(message['type'], 'time_sync')
+        self.assertEqual(message['data']['client_time_ms'], 5)
+        self.assertGreaterEqual(message['data']['server_time_ms'], before_ms)
+        self.assertLessEqual(message['data']['server_time_ms'], after_ms)
+
+        task.cancel()
+        await task
+
+    def test_time_sync_reply_offset(self):
+        before_ms = time.time_ns() / 1_000_000
+        reply = get_time_sync_reply(5, server_time_offset_ms=-1000)
+        self.assertEqual(reply['client_time_ms'], 5)
+        self.assertGreaterEqual(reply['server_time_ms'], before_ms - 1000)
+        self.assertLess(reply['server_time_ms'], before_ms)
+
+    async def resume(self, resume: str, *notifiers: Notifier) -> list[dict]:
+        websocket = AsyncMock(spec=WebSocket)
+        websocket.query_params = {'delta': '1', 'resume': resume}
+        task = asyncio.create_task(handle_notifiers(websocket, *notifiers))
+        await settle()
+        task.cancel()
+        await task
+        return [orjson.loads(call.args[0]) for call in websocket.send_text.call_args_list]
+
+    async def test_resume_messages(self):
+        notifier = Notifier('play_sound', None, replay_size=2)
+        # Messages are kept even while no client is connected.
+        await notifier.notify_with_message('start')
+        seq = notifier.seq
+        await notifier.notify_with_message('end')
+        await notifier.notify_with_message('abort')
+
+        messages = await self.resume(f'play_sound:{seq}', notifier)
+        self.assertEqual([message['data'] for message in messages], ['end', 'abort'])
+        self.assertEqual([message['seq'] for message in messages], [seq + 1, seq + 2])
+
+        self.assertEqual(await self.resume(f'play_sound:{notifier.seq}', notifier), [])
+        # Missed messages that fell out of the buffer are gone.
+        await notifier.notify_with_message('match_end')
+        self.assertEqual(await self.resume(f'play_sound:{seq}', notifier), [])
+
+    async def test_resume_state(self):
+        state = {'match': 'Q1'}
+        notifier = Notifier('match_load', lambda: dict(state), replay_size=3)
+        messages = await self.resume('', notifier)
+        self.assertEqual(messages, [{'type': 'match_load', 'seq': notifier.seq, 'data': state}])
+
+        # An up-to-date client gets nothing, not even the snapshot.
+        seq = notifier.seq
+        self.assertEqual(await self.resume(f'match_load:{seq}', notifier), [])
+
+        # A change while nobody listens, or an unknown version, means a new snapshot.
+        state['match'] = 'Q2'
+        await notifier.notify()
+        for resume in [f'match_load:{seq}', f'match_load:{seq + 100}']:
+            messages = await self.resume(resume, notifier)
+            self.assertEqual(messages, [{'type': 'match_load', 'seq': notifier.seq, 'data': state}])
+
+    async def test_resume_delta(self):
+        state = {'score': 0, 'branches': [[False] * 3] * 12}
+        notifier = Notifier('score', lambda: state, delta=True, replay_size=8)
+        listener = await self.connect(notifier, AsyncMock(spec=WebSocket), delta=True)
+        frame, seq = notifier.get_snapshot()
+        listener.enqueue('score', frame, seq=seq)
+        for score in [3, 6]:
+            state['score'] = score
+            await notifier.notify()
+
+        messages = await self.resume(f'score:{seq}', notifier)
+        self.assertEqual(
+            [message['patch'] for message in messages],
+            [
+                [{'op': 'replace', 'path': '/score', 'value': 3}],
+                [{'op': 'replace', 'path': '/score', 'value': 6}],
+            ],
+        )
+
+    async def test_stats(self):
+        score_notifier = Notifier('score', None)
+        time_notifier = Notifier('time', None, replay_size=2)
+        slow_listener = Listener(AsyncMock(spec=WebSocket))
+        listener = Listener(AsyncMock(spec=WebSocket))
+        relay = MagicMock()
+        for notifier in [score_notifier, time_notifier]:
+            await subscribe(slow_listener, notifier)
+            await notifier.connect(relay)
+        await subscribe(listener, time_notifier)
+
+        await score_notifier.notify_with_message({'score': 12})
+        await time_notifier.notify_with_message(5)
+        listener.queue.clear()
+
+        stats = get_stats([score_notifier, time_notifier])
+        score_stats, time_stats = stats['topics']
+        self.assertEqual(score_stats['type'], 'score')
+        self.assertEqual(score_stats['listeners'], 2)
+        self.assertEqual(score_stats['message_count'], 1)
+        self.assertEqual(score_stats['encoded_bytes'], len(frame('score', {'score': 12})))
+        self.assertEqual(time_stats['fan_out_count'], 3)
+        # Each listener once, whatever the number of its notifiers, and the slowest first.
+        self.assertEqual(
+            [listener_stats['queue_length'] for listener_stats in stats['listeners']], [2, 0]
+        )
+        self.assertEqual(stats['listeners'][0]['topics'], ['score', 'time'])
 
     def message_generator(self):
         return 'test_message'
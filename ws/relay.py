@@ -0,0 +1,455 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import os
+import struct
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+import orjson
+from fastapi import WebSocket, WebSocketDisconnect
+from starlette.datastructures import State
+
+from .encoding import accept, receive_message
+from .json_patch import apply_patch
+from .listener import Listener
+from .notifier import (
+    Notifier,
+    create_listener,
+    enqueue_error,
+    handle_protocol_message,
+    handle_subscription,
+    unsubscribe,
+)
+
+logger = logging.getLogger(__name__)
+
+# Every record is this header followed by the three strings whose byte lengths it gives: kind,
+# a number (the version of a message or the id of a relayed connection, -1 for none), then the
+# lengths of the message type, the frame and the patch frame.
+RECORD_HEADER = struct.Struct('>BqHII')
+# Arena to worker.
+TOPICS = 1
+MESSAGE = 2
+SYNCED = 3
+REPLY = 4
+# Worker to arena.
+COMMAND = 5
+CLOSE = 6
+
+NO_NUMBER = -1
+# A worker whose socket buffer grows past this is dropped; it reconnects and starts from snapshots.
+MAX_WRITE_BUFFER_BYTES = 4 * 1024 * 1024
+RECONNECT_DELAY_SEC = 1
+RELAY_REPLAY_SIZE = 16
+
+CommandHandler = Callable[[WebSocket, Any], Awaitable[None]]
+
+
+def encode_record(
+    kind: int, number: int | None = None, message_type: str = '', frame: str = '', patch: str = ''
+) -> bytes:
+    message_type_bytes, frame_bytes, patch_bytes = (
+        message_type.encode(),
+        frame.encode(),
+        patch.encode(),
+    )
+    return b''.join(
+        [
+            RECORD_HEADER.pack(
+                kind,
+                NO_NUMBER if number is None else number,
+                len(message_type_bytes),
+                len(frame_bytes),
+                len(patch_bytes),
+            ),
+            message_type_bytes,
+            frame_bytes,
+            patch_bytes,
+        ]
+    )
+
+
+async def read_record(reader: asyncio.StreamReader) -> tuple[int, int | None, str, str, str]:
+    kind, number, *lengths = RECORD_HEADER.unpack(await reader.readexactly(RECORD_HEADER.size))
+    body = await reader.readexactly(sum(lengths))
+    message_type_end = lengths[0]
+    frame_end = message_type_end + lengths[1]
+    return (
+        kind,
+        None if number == NO_NUMBER else number,
+        body[:message_type_end].decode(),
+        body[message_type_end:frame_end].decode(),
+        body[frame_end:].decode(),
+    )
+
+
+def describe_topics(notifiers: list[Notifier]) -> list[list]:
+    """Lists each relayed notifier's topic and how to mirror it: whether it has a state that new
+    listeners start from, whether it sends patches and whether its messages are numbered.
+    """
+    return [
+        [
+            notifier.message_type,
+            notifier.message_producer is not None,
+            notifier.delta,
+            notifier.versioned,
+        ]
+        for notifier in notifiers
+        if notifier.relayed
+    ]
+
+
+class RelayedWebSocket:
+    """Stands in on the arena side for a websocket held by a relay worker.
+
+    Command handlers reply through `ws.send_message`, which ends up in `send_text`; the reply is
+    sent back to the worker and queued on the client's listener there.
+    """
+
+    connection_id: int
+    writer: asyncio.StreamWriter
+    state: State
+
+    def __init__(self, connection_id: int, writer: asyncio.StreamWriter):
+        self.connection_id = connection_id
+        self.writer = writer
+        self.state = State()
+
+    async def send_text(self, data: str):
+        if not self.writer.is_closing():
+            self.writer.write(encode_record(REPLY, self.connection_id, frame=data))
+
+
+class RelayServer:
+    """Publishes the arena's notifiers to relay worker processes over a Unix domain socket.
+
+    The server is registered with every notifier like a listener that opted into deltas, so each
+    message is encoded once in the arena process, as a snapshot and as a patch, and written once
+    per worker however many websockets the worker holds. A worker that connects first gets the
+    list of topics and their current state. Commands from the worker's clients are run here by
+    `handle_command`, with a `RelayedWebSocket` standing in for the client's websocket, and
+    `handle_close` is called for it once the client is gone.
+    """
+
+    notifiers: list[Notifier]
+    handle_command: CommandHandler
+    handle_close: Callable[[WebSocket], Awaitable[None]] | None
+    writers: list[asyncio.StreamWriter]
+    delta: bool
+
+    def __init__(
+        self,
+        notifiers: list[Notifier],
+        handle_command: CommandHandler,
+        handle_close: Callable[[WebSocket], Awaitable[None]] | None = None,
+    ):
+        self.notifiers = [notifier for notifier in notifiers if notifier.relayed]
+        self.handle_command = handle_command
+        self.handle_close = handle_close
+        self.writers = []
+        # Workers may serve clients that opted into deltas, so patches are always produced.
+        self.delta = True
+        self.server = None
+
+    async def start(self, path: str) -> asyncio.AbstractServer:
+        # A socket file left behind by an earlier run would make the bind fail.
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
+        self.server = await asyncio.start_unix_server(self.handle_worker, path)
+        return self.server
+
+    def enqueue(
+        self, message_type: str, frame: str, patch_frame: str | None = None, seq: int | None = None
+    ):
+        record = encode_record(MESSAGE, seq, message_type, frame, patch_frame or '')
+        for writer in list(self.writers):
+            self.write(writer, record)
+
+    def write(self, writer: asyncio.StreamWriter, record: bytes):
+        if writer.is_closing():
+            return
+        if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER_BYTES:
+            logger.warning('Dropping relay worker that fell too far behind')
+            writer.close()
+            return
+        writer.write(record)
+
+    async def handle_worker(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connections = dict[int, RelayedWebSocket]()
+        try:
+            await self.sync(writer)
+            while True:
+                kind, connection_id, _, payload, _ = await read_record(reader)
+                if kind == COMMAND:
+                    if connection_id not in connections:
+                        connections[connection_id] = RelayedWebSocket(connection_id, writer)
+                    await self.run_command(connections[connection_id], orjson.loads(payload))
+                elif kind == CLOSE and connection_id in connections:
+                    await self.close_connection(connections.pop(connection_id))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            await self.disconnect(writer)
+            for websocket in connections.values():
+                await self.close_connection(websocket)
+            writer.close()
+
+    async def sync(self, writer: asyncio.StreamWriter):
+        """Registers a worker and sends it every topic and what a new listener would get."""
+        if not self.writers:
+            for notifier in self.notifiers:
+                await notifier.connect(self)
+        self.writers.append(writer)
+
+        writer.write(
+            encode_record(TOPICS, frame=orjson.dumps(describe_topics(self.notifiers)).decode())
+        )
+        for notifier in self.notifiers:
+            # Recent versions first, so the worker can serve resuming clients straight away.
+            for seq, frame, patch_frame in notifier.replay_buffer:
+                writer.write(
+                    encode_record(MESSAGE, seq, notifier.message_type, frame, patch_frame or '')
+                )
+            if notifier.message_producer is None:
+                continue
+            if notifier.versioned:
+                frame, seq = notifier.get_snapshot()
+                writer.write(encode_record(MESSAGE, seq, notifier.message_type, frame))
+            else:
+                writer.write(
+                    encode_record(
+                        MESSAGE, None, notifier.message_type, notifier.get_message_frame()
+                    )
+                )
+        writer.write(encode_record(SYNCED))
+        await writer.drain()
+
+    async def disconnect(self, writer: asyncio.StreamWriter):
+        if writer in self.writers:
+            self.writers.remove(writer)
+        if not self.writers:
+            for notifier in self.notifiers:
+                await notifier.disconnect(self)
+
+    async def run_command(self, websocket: RelayedWebSocket, data: Any):
+        try:
+            await self.handle_command(websocket, data)
+        except (ValueError, RuntimeError) as e:
+            await websocket.send_text(
+                orjson.dumps({'type': 'error', 'data': {'message': str(e)}}).decode()
+            )
+        except Exception:
+            # Any other failure is confined to the command, not the whole worker's connection.
+            logger.exception('Relayed command failed')
+
+    async def close_connection(self, websocket: RelayedWebSocket):
+        if self.handle_close is not None:
+            await self.handle_close(websocket)
+
+
+class MirrorNotifier(Notifier):
+    """Notifier in a relay worker that republishes the versions of a notifier in the arena.
+
+    Versions keep the arena's numbers, so a client can move between workers, or between a worker
+    and the arena, and still resume. The latest frame is what new listeners get as a snapshot.
+    """
+
+    def __init__(self, message_type: str, stateful: bool, delta: bool, replay_size: int):
+        super().__init__(
+            message_type,
+            self.get_mirrored_body if stateful else None,
+            delta=delta,
+            replay_size=replay_size,
+        )
+        self.seq = 0
+
+    def publish(self, frame: str, patch_frame: str | None, seq: int | None):
+        self.notify_count += 1
+        if seq is not None:
+            if seq <= self.seq:
+                # Already have it, e.g. a snapshot sent again after the relay reconnected.
+                return
+            # After a gap the patch would be against a version the listeners do not hold.
+            if seq != self.seq + 1:
+                patch_frame = None
+            self.seq = seq
+            if self.replay_size:
+                self.replay_buffer.append((seq, frame, patch_frame))
+        if self.message_producer is not None:
+            self.last_frame = frame
+
+        for listener in self.listeners:
+            listener.enqueue(self.message_type, frame, patch_frame, seq)
+            self.fan_out_count += 1
+
+    def publish_frame(self, frame: str, message: dict) -> bool:
+        """Publishes a frame as a client of the original notifier received it.
+
+        A patch is applied to the previous version to rebuild the snapshot new listeners start
+        from. Returns False when the patch does not follow the last version, in which case a fresh
+        snapshot has to be requested.
+        """
+        seq = message.get('seq')
+        if 'patch' in message:
+            if self.last_data is None or seq != self.seq + 1:
+                return False
+            self.last_data = apply_patch(self.last_data, message['patch'])
+            snapshot = orjson.dumps(
+                {'type': self.message_type, 'seq': seq, 'data': self.last_data}
+            ).decode()
+            self.publish(snapshot, frame, seq)
+            return True
+
+        if seq is not None and seq <= self.seq:
+            return True
+        if self.delta:
+            self.last_data = message.get('data')
+        self.publish(frame, None, seq)
+        return True
+
+    def get_snapshot(self) -> tuple[str, int]:
+        return self.last_frame, self.seq
+
+    def get_message_frame(self) -> str:
+        return self.last_frame
+
+    def get_mirrored_body(self) -> Any:
+        return orjson.loads(self.last_frame)['data']
+
+
+class RelayClient:
+    """Connection of a relay worker process to the arena's RelayServer.
+
+    Keeps a MirrorNotifier for every topic of the arena and sends the commands of the worker's
+    clients to the arena, reconnecting whenever the arena goes away.
+    """
+
+    path: str
+    notifiers: dict[str, MirrorNotifier]
+    listeners: dict[int, Listener]
+    ready: asyncio.Event
+    time_offset_ms: float
+
+    def __init__(self, path: str, replay_size: int = RELAY_REPLAY_SIZE):
+        self.path = path
+        self.replay_size = replay_size
+        self.notifiers = {}
+        self.listeners = {}
+        self.ready = asyncio.Event()
+        # The arena runs on the same host, so its clock is this process's clock.
+        self.time_offset_ms = 0
+        self.writer = None
+        self.connection_ids = itertools.count()
+
+    async def run(self):
+        while True:
+            try:
+                reader, self.writer = await asyncio.open_unix_connection(self.path)
+            except (FileNotFoundError, ConnectionError):
+                await asyncio.sleep(RECONNECT_DELAY_SEC)
+                continue
+
+            try:
+                while True:
+                    self.handle_record(*await read_record(reader))
+            except (asyncio.IncompleteReadError, ConnectionError):
+                logger.warning('Lost the connection to the arena relay, reconnecting')
+            finally:
+                self.ready.clear()
+                self.writer.close()
+                self.writer = None
+            await asyncio.sleep(RECONNECT_DELAY_SEC)
+
+    def handle_record(
+        self, kind: int, number: int | None, message_type: str, frame: str, patch_frame: str
+    ):
+        if kind == MESSAGE:
+            notifier = self.notifiers.get(message_type)
+            if notifier is not None:
+                notifier.publish(frame, patch_frame or None, number)
+        elif kind == REPLY:
+            listener = self.listeners.get(number)
+            if listener is not None:
+                listener.enqueue('reply', frame)
+        elif kind == TOPICS:
+            for topic, stateful, delta, versioned in orjson.loads(frame):
+                if topic not in self.notifiers:
+                    self.notifiers[topic] = MirrorNotifier(
+                        topic, stateful, delta, self.replay_size if versioned else 0
+                    )
+        elif kind == SYNCED:
+            self.ready.set()
+
+    def connect(self, listener: Listener) -> int:
+        connection_id = next(self.connection_ids)
+        self.listeners[connection_id] = listener
+        return connection_id
+
+    def disconnect(self, connection_id: int):
+        self.listeners.pop(connection_id, None)
+        if self.writer is not None:
+            self.writer.write(encode_record(CLOSE, connection_id))
+
+    def send_command(self, connection_id: int, data: Any):
+        """Forwards a client's command to the arena."""
+        if self.writer is None or not self.ready.is_set():
+            raise RuntimeError('Arena is not reachable')
+        self.writer.write(encode_record(COMMAND, connection_id, frame=orjson.dumps(data).decode()))
+
+
+async def handle_relayed_websocket(websocket: WebSocket, client: RelayClient):
+    """Serves a multiplexed websocket in a relay worker, like /api/ws does in the arena process.
+
+    Subscriptions, resyncs and clock syncs are handled in the worker; every other message is a
+    command sent on to the arena, whose reply comes back on the same connection.
+    """
+    await accept(websocket)
+    await client.ready.wait()
+
+    listener = create_listener(websocket)
+    connection_id = client.connect(listener)
+    writer_task = asyncio.create_task(listener.run())
+
+    try:
+        topics = websocket.query_params.get('topics')
+        if topics:
+            try:
+                await handle_subscription(
+                    listener, 'subscribe', topics.split(','), client.notifiers
+                )
+            except ValueError as e:
+                enqueue_error(listener, str(e))
+
+        while True:
+            data = await receive_message(websocket)
+            if not isinstance(data, dict):
+                enqueue_error(listener, 'Message must be a JSON object')
+                continue
+            if 'type' not in data or handle_protocol_message(
+                websocket, data, client.time_offset_ms
+            ):
+                continue
+
+            try:
+                if data['type'] in ['subscribe', 'unsubscribe']:
+                    await handle_subscription(
+                        listener, data['type'], data.get('data', []), client.notifiers
+                    )
+                else:
+                    client.send_command(connection_id, data)
+            except (ValueError, RuntimeError) as e:
+                enqueue_error(listener, str(e))
+
+    except WebSocketDisconnect:
+        pass
+    finally:
+        client.disconnect(connection_id)
+        listener.close()
+        writer_task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await writer_task
+
+        for notifier in list(listener.notifiers.values()):
+            await unsubscribe(listener, notifier)
@@ -0,0 +1,144 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest.mock import AsyncMock
+
+import orjson
+from fastapi import WebSocket
+
+from .listener import Listener
+from .notifier import Notifier, subscribe
+from .relay import (
+    COMMAND,
+    MESSAGE,
+    RelayClient,
+    RelayServer,
+    describe_topics,
+    encode_record,
+    read_record,
+)
+
+
+async def settle():
+    for _ in range(20):
+        await asyncio.sleep(0)
+
+
+class TestRelay(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'relay.sock')
+        self.state = {'score': 0, 'branches': [[False] * 3] * 12}
+        self.score_notifier = Notifier('score', lambda: self.state, delta=True, replay_size=4)
+        self.sound_notifier = Notifier('play_sound', None, replay_size=4)
+        self.stats_notifier = Notifier('websocket_stats', lambda: {}, relayed=False)
+        self.commands = []
+        self.closed = []
+        self.server = RelayServer(
+            [self.score_notifier, self.sound_notifier, self.stats_notifier],
+            self.handle_command,
+            self.handle_close,
+        )
+        await self.server.start(self.path)
+        self.client = RelayClient(self.path)
+        self.client_task = asyncio.create_task(self.client.run())
+        await asyncio.wait_for(self.client.ready.wait(), 1)
+
+    async def asyncTearDown(self):
+        self.client_task.cancel()
+        if self.client.writer is not None:
+            self.client.writer.close()
+        await asyncio.sleep(0.01)
+        self.server.server.close()
+        await self.server.server.wait_closed()
+        self.directory.cleanup()
+
+    async def handle_command(self, websocket, data):
+        self.commands.append(data)
+        if data['type'] == 'bad':
+            raise ValueError('Bad command')
+        await websocket.send_text('{"type":"done","data":{}}')
+
+    async def handle_close(self, websocket):
+        self.closed.append(websocket.connection_id)
+
+    async def test_record(self):
+        reader = asyncio.StreamReader()
+        reader.feed_data(encode_record(MESSAGE, 7, 'score', '{"a":"é"}', '{"b":1}'))
+        reader.feed_data(encode_record(COMMAND, None, frame='{}'))
+        self.assertEqual(await read_record(reader), (MESSAGE, 7, 'score', '{"a":"é"}', '{"b":1}'))
+        self.assertEqual(await read_record(reader), (COMMAND, None, '', '{}', ''))
+
+    async def test_describe_topics(self):
+        # Topics about this server's own connections stay off relays and mirrors.
+        self.assertEqual(
+            describe_topics([self.score_notifier, self.sound_notifier, self.stats_notifier]),
+            [['score', True, True, True], ['play_sound', False, False, True]],
+        )
+        self.assertEqual(self.server.notifiers, [self.score_notifier, self.sound_notifier])
+
+    async def test_mirror(self):
+        mirror = self.client.notifiers['score']
+        self.assertEqual(set(self.client.notifiers), {'score', 'play_sound'})
+        self.assertEqual(mirror.get_snapshot(), self.score_notifier.get_snapshot())
+        self.assertEqual(self.score_notifier.listeners, [self.server])
+
+        websocket = AsyncMock(spec=WebSocket)
+        listener = Listener(websocket, delta=True)
+        writer_task = asyncio.create_task(listener.run())
+        await subscribe(listener, mirror)
+        await settle()
+        snapshot = orjson.loads(websocket.send_text.call_args.args[0])
+        self.assertEqual(snapshot['data'], self.state)
+
+        self.state['score'] = 5
+        await self.score_notifier.notify()
+        await self.sound_notifier.notify_with_message('end')
+        await settle()
+        # The patch the arena made is relayed as is and continues the listener's version chain.
+        patch = orjson.loads(websocket.send_text.call_args.args[0])
+        self.assertEqual(patch['seq'], snapshot['seq'] + 1)
+        self.assertEqual(patch['patch'], [{'op': 'replace', 'path': '/score', 'value': 5}])
+        self.assertEqual(
+            mirror.get_missed(snapshot['seq']), list(self.score_notifier.replay_buffer)[-1:]
+        )
+        self.assertEqual(
+            list(self.client.notifiers['play_sound'].replay_buffer),
+            list(self.sound_notifier.replay_buffer),
+        )
+
+        listener.close()
+        await writer_task
+
+    async def test_command(self):
+        websocket = AsyncMock(spec=WebSocket)
+        listener = Listener(websocket)
+        writer_task = asyncio.create_task(listener.run())
+        connection_id = self.client.connect(listener)
+
+        self.client.send_command(connection_id, {'type': 'good'})
+        self.client.send_command(connection_id, {'type': 'bad'})
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.commands, [{'type': 'good'}, {'type': 'bad'}])
+        self.assertEqual(
+            [call.args[0] for call in websocket.send_text.call_args_list],
+            [
+                '{"type":"done","data":{}}',
+                '{"type":"error","data":{"message":"Bad command"}}',
+            ],
+        )
+
+        self.client.disconnect(connection_id)
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.closed, [connection_id])
+
+        listener.close()
+        await writer_task
+
+    async def test_worker_disconnect(self):
+        self.client_task.cancel()
+        self.client.writer.close()
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.server.writers, [])
+        self.assertEqual(self.score_notifier.listeners, [])
@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import re
+from collections.abc import Awaitable, Callable
+
+from starlette.requests import HTTPConnection
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from .listener import DEFAULT_OVERFLOW_POLICY, PING_FRAME, Listener, OverflowPolicy
+from .notifier import Notifier, parse_resume, subscribe, unsubscribe
+
+# Browsers wait this long before reconnecting a dropped event stream.
+RETRY_INTERVAL_MS = 3000
+# Every versioned frame starts with its type and version, see Notifier.encode_version().
+VERSION_PATTERN = re.compile(r'\{"type":"([^"]*)","seq":(\d+)')
+
+
+class EventStreamListener(Listener):
+    """A listener writing to a Server-Sent Events response instead of a websocket.
+
+    Frames are the JSON text the notifiers already encoded, sent as the data of one event each.
+    Every event after a versioned frame carries the last version of every topic as its id, e.g.
+    `match_load:12,event_status:3`; the browser sends it back as `Last-Event-ID` when it
+    reconnects, and the stream resumes like a websocket with a `resume` query parameter.
+    Heartbeats are comments, which EventSource ignores.
+    """
+
+    send: Send
+    event_seqs: dict[str, int]
+
+    def __init__(
+        self,
+        send: Send,
+        overflow_policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY,
+        resume_seqs: dict[str, int] | None = None,
+        connection: HTTPConnection | None = None,
+    ):
+        super().__init__(None, overflow_policy=overflow_policy)
+        self.connection = connection
+        self.send = send
+        self.resume_seqs = dict(resume_seqs or {})
+        self.event_seqs = dict(self.resume_seqs)
+
+    async def write(self, frame: str):
+        if frame is PING_FRAME:
+            await self.write_body(b': ping\n\n')
+            return
+
+        match = VERSION_PATTERN.match(frame)
+        if match is None:
+            await self.write_body(f'data: {frame}\n\n'.encode())
+            return
+
+        self.event_seqs[match[1]] = int(match[2])
+        event_id = ','.join(
+            f'{message_type}:{seq}' for message_type, seq in self.event_seqs.items()
+        )
+        await self.write_body(f'id: {event_id}\ndata: {frame}\n\n'.encode())
+
+    async def write_body(self, body: bytes):
+        await self.send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    async def close_overflowed(self):
+        # Ending the response is all it takes; the browser reconnects and resumes.
+        pass
+
+
+class EventStreamResponse(StreamingResponse):
+    """Streams the messages of notifiers to a read-only client as Server-Sent Events.
+
+    The stream holds no receive loop or heartbeat task of its own: the listener's writer sends
+    the frames and heartbeats, and the response only waits for the client to disconnect.
+    `on_close` runs once the stream has ended, e.g. to mark a display as disconnected.
+    """
+
+    def __init__(
+        self,
+        connection: HTTPConnection,
+        *notifiers: Notifier,
+        on_close: Callable[[], Awaitable[None]] | None = None,
+        overflow_policy: OverflowPolicy = DEFAULT_OVERFLOW_POLICY,
+    ):
+        super().__init__(
+            iter(()),
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+            media_type='text/event-stream',
+        )
+        self.notifiers = notifiers
+        self.on_close = on_close
+        self.overflow_policy = overflow_policy
+        self.connection = connection
+        # Pages opening a stream for the first time can resume like websockets; EventSource sends
+        # the id of the last event it got when it reconnects.
+        self.resume_seqs = parse_resume(
+            connection.headers.get('Last-Event-ID') or connection.query_params.get('resume', '')
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send(
+            {'type': 'http.response.start', 'status': self.status_code, 'headers': self.raw_headers}
+        )
+        listener = EventStreamListener(
+            send, self.overflow_policy, self.resume_seqs, self.connection
+        )
+
+        async def wait_for_disconnect():
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+            listener.close()
+
+        disconnect_task = asyncio.create_task(wait_for_disconnect())
+        try:
+            await listener.write_body(f'retry: {RETRY_INTERVAL_MS}\n\n'.encode())
+            for notifier in self.notifiers:
+                await subscribe(listener, notifier)
+            await listener.run()
+        except (RuntimeError, OSError):
+            pass
+        finally:
+            listener.close()
+            disconnect_task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await disconnect_task
+            for notifier in self.notifiers:
+                await unsubscribe(listener, notifier)
+            if self.on_close is not None:
+                await self.on_close()
+
+        with contextlib.suppress(RuntimeError, OSError):
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
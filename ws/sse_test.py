@@ -0,0 +1,117 @@
+import asyncio
+import unittest
+
+from starlette.requests import HTTPConnection
+
+from .listener import PING_FRAME
+from .notifier import Notifier
+from .sse import EventStreamListener, EventStreamResponse
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class EventStream:
+    """Runs an EventStreamResponse as an ASGI server would and collects what it sends."""
+
+    def __init__(self, *notifiers: Notifier, last_event_id: str = '', on_close=None):
+        headers = [(b'last-event-id', last_event_id.encode())] if last_event_id else []
+        connection = HTTPConnection({'type': 'http', 'headers': headers, 'query_string': b''})
+        self.response = EventStreamResponse(connection, *notifiers, on_close=on_close)
+        self.messages = []
+        self.disconnected = asyncio.Event()
+        self.task = asyncio.create_task(self.response({}, self.receive, self.send))
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(self, message: dict):
+        self.messages.append(message)
+
+    def events(self) -> list[bytes]:
+        body = b''.join(message.get('body', b'') for message in self.messages)
+        return [event for event in body.split(b'\n\n') if event]
+
+    async def close(self):
+        self.disconnected.set()
+        await asyncio.wait_for(self.task, 1)
+
+
+class TestEventStream(unittest.IsolatedAsyncioTestCase):
+    async def test_stream(self):
+        state = {'match': 'Q1'}
+        match_load_notifier = Notifier('match_load', lambda: dict(state), replay_size=4)
+        sound_notifier = Notifier('play_sound', None)
+        closed = asyncio.Event()
+
+        async def on_close():
+            closed.set()
+
+        stream = EventStream(match_load_notifier, sound_notifier, on_close=on_close)
+        await settle()
+        start = stream.messages[0]
+        self.assertEqual(start['type'], 'http.response.start')
+        self.assertIn((b'content-type', b'text/event-stream; charset=utf-8'), start['headers'])
+        self.assertIn((b'cache-control', b'no-cache'), start['headers'])
+
+        await sound_notifier.notify_with_message('start')
+        state['match'] = 'Q2'
+        await match_load_notifier.notify()
+        await settle()
+        seq = match_load_notifier.seq
+        self.assertEqual(
+            stream.events(),
+            [
+                b'retry: 3000',
+                f'id: match_load:{seq - 1}\ndata: {{"type":"match_load","seq":{seq - 1},'
+                f'"data":{{"match":"Q1"}}}}'.encode(),
+                b'data: {"type":"play_sound","data":"start"}',
+                f'id: match_load:{seq}\ndata: {{"type":"match_load","seq":{seq},'
+                f'"data":{{"match":"Q2"}}}}'.encode(),
+            ],
+        )
+
+        await stream.close()
+        self.assertTrue(closed.is_set())
+        self.assertEqual(match_load_notifier.listeners, [])
+        self.assertEqual(sound_notifier.listeners, [])
+        self.assertFalse(stream.messages[-1]['more_body'])
+
+    async def test_resume_from_last_event_id(self):
+        state = {'match': 'Q1'}
+        match_load_notifier = Notifier('match_load', lambda: dict(state), replay_size=4)
+        sound_notifier = Notifier('play_sound', None, replay_size=4)
+        await sound_notifier.notify_with_message('start')
+        sound_seq = sound_notifier.seq
+        await sound_notifier.notify_with_message('end')
+        _, match_load_seq = match_load_notifier.get_snapshot()
+
+        # The client saw every version of match_load and missed one sound.
+        stream = EventStream(
+            match_load_notifier,
+            sound_notifier,
+            last_event_id=f'match_load:{match_load_seq},play_sound:{sound_seq}',
+        )
+        await settle()
+        self.assertEqual(
+            stream.events(),
+            [
+                b'retry: 3000',
+                f'id: match_load:{match_load_seq},play_sound:{sound_seq + 1}\n'
+                f'data: {{"type":"play_sound","seq":{sound_seq + 1},"data":"end"}}'.encode(),
+            ],
+        )
+        await stream.close()
+
+    async def test_ping(self):
+        sent = []
+
+        async def send(message: dict):
+            sent.append(message['body'])
+
+        listener = EventStreamListener(send)
+        await listener.write(PING_FRAME)
+        self.assertEqual(sent, [b': ping\n\n'])